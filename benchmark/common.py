@@ -0,0 +1,106 @@
+import datetime
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+
+WEBSERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "webserver")
+DATABASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "database")
+
+sys.path.insert(0, WEBSERVER_DIR)
+
+from flask import Config  # noqa: E402
+
+from osm_service import METERS_PER_DEGREE, OsmService  # noqa: E402
+
+
+def loadSettings(path):
+    config = Config(".")
+    config.from_pyfile(os.path.abspath(path))
+    return config
+
+
+def connectionParameters(config):
+    return {
+        "user": config["DATABASE_USER"],
+        "password": config["DATABASE_PASSWORD"],
+        "host": config["DATABASE_HOST"],
+        "port": config["DATABASE_PORT"],
+        "database": config["DATABASE_NAME"]
+    }
+
+
+def createService(config):
+    parameters = connectionParameters(config)
+    return OsmService(parameters["user"], parameters["password"], parameters["host"], parameters["port"], parameters["database"],
+                      pool_min_size=1, pool_max_size=config.get("DATABASE_POOL_MAX_SIZE", 10))
+
+
+def fixtureExtent(osm):
+    """Returns the center and extent written by fixture.py, so benchmarks query where the data is."""
+    rows = osm.pool.run(lambda cursor: (cursor.execute("SELECT lat, lon, extent, density, seed FROM benchmark_fixture"), cursor.fetchall())[1])
+    if not rows:
+        raise RuntimeError("benchmark_fixture is empty, load a fixture with fixture.py first")
+
+    lat, lon, extent, density, seed = rows[0]
+    return {"lat": lat, "lon": lon, "extent": extent, "density": density, "seed": seed}
+
+
+def samplePoints(fixture, count, seed):
+    """Returns `count` reproducible points within the inner half of the fixture, away from its edges."""
+    generator = random.Random(seed)
+    lat_delta = fixture["extent"] / 4 / METERS_PER_DEGREE
+    lon_delta = lat_delta / math.cos(math.radians(fixture["lat"]))
+
+    return [(fixture["lat"] + generator.uniform(-lat_delta, lat_delta), fixture["lon"] + generator.uniform(-lon_delta, lon_delta))
+            for _ in range(count)]
+
+
+def summarize(durations):
+    """Latency statistics in milliseconds of a list of durations in seconds."""
+    if not durations:
+        return {"count": 0}
+
+    values = sorted(duration * 1000 for duration in durations)
+
+    def percentile(p):
+        return values[min(len(values) - 1, int(math.ceil(p / 100 * len(values))) - 1)]
+
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values),
+        "min": values[0],
+        "p50": percentile(50),
+        "p90": percentile(90),
+        "p95": percentile(95),
+        "p99": percentile(99),
+        "max": values[-1]
+    }
+
+
+def gitRevision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=WEBSERVER_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def writeResults(path, kind, parameters, results):
+    """Writes one JSON document per run, tagged with the revision it was measured on."""
+    document = {
+        "kind": kind,
+        "revision": gitRevision(),
+        "finished_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "host": platform.node(),
+        "parameters": parameters,
+        "results": results
+    }
+
+    with open(path, "w") as output:
+        json.dump(document, output, indent=2, sort_keys=True)
+
+    return document
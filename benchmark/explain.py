@@ -0,0 +1,89 @@
+import argparse
+import json
+import sys
+
+from psycopg2.extras import Json
+
+from common import createService, fixtureExtent, loadSettings, samplePoints, writeResults
+from osm_service import FULL_REPORT_AREAS_CLIPPED_QUERY, FULL_REPORT_AREAS_QUERY, FULL_REPORT_POI_QUERY, LANDUSE_CLIPPED_QUERY, LANDUSE_QUERY, \
+    NEAREST_PARKS_QUERY, NEAREST_POI_QUERIES, PARKS_QUERY, POI_CATEGORIES, POI_QUERIES, TAGS_QUERY, query_parameters
+
+QUERIES = {
+    "poi_supermarkets": (POI_QUERIES["supermarkets"], {"limit": None, "selected_tags": None}),
+    "poi_bus_stations": (POI_QUERIES["bus_stations"], {"limit": None, "selected_tags": None}),
+    "landuse": (LANDUSE_QUERY, {}),
+    "landuse_clipped": (LANDUSE_CLIPPED_QUERY, {}),
+    "parks": (PARKS_QUERY, {"limit": None, "selected_tags": None}),
+    "tags": (TAGS_QUERY, {"tags": Json({"amenity": "restaurant"}), "keys": []}),
+    "full_report_poi": (FULL_REPORT_POI_QUERY, {"categories": list(POI_CATEGORIES), "selected_tags": None}),
+    "full_report_areas": (FULL_REPORT_AREAS_QUERY, {"selected_tags": None}),
+    "full_report_areas_clipped": (FULL_REPORT_AREAS_CLIPPED_QUERY, {"selected_tags": None}),
+    "nearest_poi": (NEAREST_POI_QUERIES["supermarkets"], {"k": 3, "candidates": 16, "max_radius": None}),
+    "nearest_parks": (NEAREST_PARKS_QUERY, {"k": 3, "candidates": 16, "max_radius": None}),
+}
+
+
+def shape(plan):
+    """The node types and the relations and indexes they read, which change when the planner picks another plan."""
+    node = plan["Node Type"]
+    for key in ("Relation Name", "Index Name", "Join Type", "Strategy"):
+        if key in plan:
+            node += " %s" % plan[key]
+
+    return [node] + [shape(child) for child in plan.get("Plans", [])]
+
+
+def explain(osm, query, parameters):
+    def run(cursor):
+        cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query, parameters)
+        return cursor.fetchone()[0]
+
+    document = osm.pool.run(run)
+    if isinstance(document, str):
+        document = json.loads(document)
+
+    plan = document[0]
+    return {
+        "shape": shape(plan["Plan"]),
+        "execution_time": plan["Execution Time"],
+        "planning_time": plan["Planning Time"],
+        "shared_hit_blocks": plan["Plan"].get("Shared Hit Blocks"),
+        "shared_read_blocks": plan["Plan"].get("Shared Read Blocks"),
+        "plan": plan
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Captures EXPLAIN (ANALYZE, BUFFERS) of every webserver query on the synthetic fixture "
+                                                 "and reports plans whose shape differs from a baseline run.")
+    parser.add_argument("settings", help="settings file with the DATABASE_* connection parameters")
+    parser.add_argument("--output", default="explain.json", help="path of the JSON results")
+    parser.add_argument("--baseline", help="results of an earlier run to compare the plan shapes with")
+    parser.add_argument("--radii", type=int, nargs="+", default=[250, 1000, 5000])
+    parser.add_argument("--seed", type=int, default=1)
+    arguments = parser.parse_args()
+
+    config = loadSettings(arguments.settings)
+    osm = createService(config)
+    fixture = fixtureExtent(osm)
+    (lat, lon), = samplePoints(fixture, 1, arguments.seed)
+
+    results = []
+    for radius in arguments.radii:
+        for name, (query, parameters) in QUERIES.items():
+            result = dict(explain(osm, query, query_parameters(lat, lon, radius, **parameters)), query=name, radius=radius)
+            results.append(result)
+            print("%-20s %6d m  %8.2f ms  %8s hit  %8s read" % (name, radius, result["execution_time"], result["shared_hit_blocks"], result["shared_read_blocks"]))
+
+    writeResults(arguments.output, "explain", dict(vars(arguments), fixture=fixture), results)
+
+    if arguments.baseline:
+        with open(arguments.baseline) as baseline:
+            shapes = {(result["query"], result["radius"]): result["shape"] for result in json.load(baseline)["results"]}
+
+        changed = [result for result in results if (result["query"], result["radius"]) in shapes and shapes[(result["query"], result["radius"])] != result["shape"]]
+        for result in changed:
+            print("plan of %s at %d m changed:\n  before: %s\n  after:  %s" % (
+                result["query"], result["radius"], json.dumps(shapes[(result["query"], result["radius"])]), json.dumps(result["shape"])))
+
+        sys.exit(1 if changed else 0)
@@ -0,0 +1,295 @@
+import argparse
+import csv
+import io
+import math
+import os
+import random
+import time
+
+import psycopg2
+
+from common import DATABASE_DIR, METERS_PER_DEGREE, connectionParameters, loadSettings
+
+# Weighted feature kinds with their OSM tags. Tags with a dedicated column in the
+# ogr2ogr OSM layers (e.g. highway for points, landuse for multipolygons) are split
+# off into that column when the rows are written, the rest goes to other_tags.
+POINT_KINDS = [
+    (300, "Bank", {"amenity": "bench"}),
+    (200, "Haltestelle", {"highway": "bus_stop", "bus": "yes", "public_transport": "platform"}),
+    (150, "Restaurant", {"amenity": "restaurant", "cuisine": "german"}),
+    (120, "Café", {"amenity": "cafe"}),
+    (100, "Bäckerei", {"shop": "bakery"}),
+    (80, "Parkplatz", {"amenity": "parking", "parking": "surface"}),
+    (20, "Privatparkplatz", {"amenity": "parking", "access": "private"}),
+    (60, "Arztpraxis", {"amenity": "doctors", "healthcare": "doctor"}),
+    (40, "Supermarkt", {"shop": "supermarket"}),
+    (40, "Kiosk", {"shop": "convenience"}),
+    (25, "Drogerie", {"shop": "chemist"}),
+    (30, "Schule", {"amenity": "school"}),
+    (30, "Kita", {"amenity": "kindergarten"}),
+    (30, "Straßenbahn", {"railway": "tram_stop", "public_transport": "stop_position"}),
+    (8, "Krankenhaus", {"amenity": "hospital", "emergency": "yes"}),
+    (5, "Bahnhof", {"railway": "station", "public_transport": "station"}),
+    (3, "Einkaufszentrum", {"shop": "mall"}),
+    (200, None, {"barrier": "bollard"}),
+]
+
+# (weight, name prefix, tags, smallest and largest radius in meters)
+POLYGON_KINDS = [
+    (600, None, {"building": "yes"}, 6, 25),
+    (80, "Wohngebiet", {"landuse": "residential"}, 80, 600),
+    (20, "Gewerbegebiet", {"landuse": "commercial"}, 60, 400),
+    (20, "Industriegebiet", {"landuse": "industrial"}, 100, 800),
+    (10, "Einkaufsstraße", {"landuse": "retail"}, 40, 250),
+    (40, None, {"landuse": "farmland"}, 150, 900),
+    (30, "Wald", {"landuse": "forest"}, 150, 1200),
+    (30, "Park", {"leisure": "park"}, 30, 500),
+    (20, None, {"leisure": "pitch", "sport": "soccer"}, 30, 60),
+]
+
+RELATION_KINDS = [
+    (60, "Buslinie", {"type": "route", "route": "bus"}),
+    (20, "Schulzentrum", {"type": "site", "amenity": "school"}),
+    (10, "Kita", {"type": "site", "amenity": "kindergarten"}),
+    (10, None, {"type": "associatedStreet"}),
+]
+
+# Tags most real features carry besides the ones that define them, to keep other_tags realistically long.
+EXTRA_TAGS = [
+    (0.5, "addr:street", lambda generator: "Straße %d" % generator.randrange(1, 500)),
+    (0.5, "addr:housenumber", lambda generator: str(generator.randrange(1, 200))),
+    (0.3, "opening_hours", lambda generator: "Mo-Fr 08:00-18:00"),
+    (0.2, "wheelchair", lambda generator: generator.choice(["yes", "no", "limited"])),
+    (0.1, "website", lambda generator: "https://example.org/%d" % generator.randrange(100000)),
+]
+
+# Polygons and relations per point, roughly the ratio found in a German city.
+POLYGONS_PER_POINT = 0.6
+RELATIONS_PER_POINT = 0.02
+
+SCHEMA = """\
+DROP TABLE IF EXISTS points, multipolygons, other_relations, benchmark_fixture CASCADE;
+
+CREATE TABLE points (
+    id serial PRIMARY KEY,
+    osm_id varchar,
+    name varchar,
+    barrier varchar,
+    highway varchar,
+    ref varchar,
+    address varchar,
+    is_in varchar,
+    place varchar,
+    man_made varchar,
+    other_tags varchar,
+    geom geometry(MultiPoint, 4326)
+);
+
+CREATE TABLE multipolygons (
+    id serial PRIMARY KEY,
+    osm_id varchar,
+    osm_way_id varchar,
+    name varchar,
+    type varchar,
+    aeroway varchar,
+    amenity varchar,
+    admin_level varchar,
+    barrier varchar,
+    boundary varchar,
+    building varchar,
+    craft varchar,
+    geological varchar,
+    historic varchar,
+    land_area varchar,
+    landuse varchar,
+    leisure varchar,
+    man_made varchar,
+    military varchar,
+    "natural" varchar,
+    office varchar,
+    place varchar,
+    shop varchar,
+    sport varchar,
+    tourism varchar,
+    other_tags varchar,
+    geom geometry(MultiPolygon, 4326)
+);
+
+CREATE TABLE other_relations (
+    id serial PRIMARY KEY,
+    osm_id varchar,
+    name varchar,
+    type varchar,
+    other_tags varchar,
+    geom geometry(GeometryCollection, 4326)
+);
+
+CREATE INDEX points_geom_geom_idx ON points USING gist (geom);
+CREATE INDEX multipolygons_geom_geom_idx ON multipolygons USING gist (geom);
+CREATE INDEX other_relations_geom_geom_idx ON other_relations USING gist (geom);
+
+CREATE TABLE benchmark_fixture (
+    lat float8 NOT NULL,
+    lon float8 NOT NULL,
+    extent float8 NOT NULL,
+    density float8 NOT NULL,
+    seed bigint NOT NULL,
+    points bigint NOT NULL,
+    multipolygons bigint NOT NULL,
+    other_relations bigint NOT NULL,
+    created_at timestamptz NOT NULL DEFAULT now()
+);
+"""
+
+# The post-import files in the order database/import_data.sh runs them.
+POST_IMPORT_FILES = ["geography.sql", "landuse.sql", "tags.sql", "poi.sql", "poi_grid.sql", "indexes.sql", "extent.sql", "data_version.sql"]
+
+
+def hstore(tags):
+    """Formats tags the way ogr2ogr writes other_tags."""
+    def quote(value):
+        return '"%s"' % value.replace("\\", "\\\\").replace('"', '\\"')
+
+    return ",".join("%s=>%s" % (quote(key), quote(value)) for key, value in tags.items()) or None
+
+
+class FixtureGenerator:
+    """Reproducible synthetic OSM data in the layout ogr2ogr imports from a .osm.pbf file.
+
+    Features are spread uniformly over a square of `extent` meters around the
+    center, `density` points per km² plus polygons and relations in the ratio
+    found in German cities. Equal arguments always produce equal rows.
+    """
+
+    def __init__(self, lat, lon, extent, density, seed):
+        self.lat = lat
+        self.lon = lon
+        self.extent = extent
+        self.density = density
+        self.seed = seed
+        self.generator = random.Random(seed)
+
+        self.lat_delta = extent / 2 / METERS_PER_DEGREE
+        self.lon_delta = self.lat_delta / math.cos(math.radians(lat))
+
+        area = (extent / 1000) ** 2
+        self.points = int(area * density)
+        self.multipolygons = int(area * density * POLYGONS_PER_POINT)
+        self.other_relations = int(area * density * RELATIONS_PER_POINT)
+
+    def __choose(self, kinds):
+        return self.generator.choices(kinds, weights=[kind[0] for kind in kinds])[0]
+
+    def __location(self):
+        return self.lat + self.generator.uniform(-self.lat_delta, self.lat_delta), self.lon + self.generator.uniform(-self.lon_delta, self.lon_delta)
+
+    def __tags(self, tags):
+        tags = dict(tags)
+        for probability, key, value in EXTRA_TAGS:
+            if self.generator.random() < probability:
+                tags[key] = value(self.generator)
+
+        return tags
+
+    def __name(self, prefix, index):
+        return "%s %d" % (prefix, index) if prefix is not None and self.generator.random() < 0.8 else None
+
+    def __ring(self, lat, lon, smallest, largest):
+        """An irregular closed polygon ring around the location, as WKT coordinates."""
+        corners = self.generator.randrange(4, 12)
+        radius = self.generator.uniform(smallest, largest)
+        coordinates = []
+        for corner in range(corners):
+            angle = 2 * math.pi * corner / corners
+            distance = radius * self.generator.uniform(0.6, 1.0)
+            coordinates.append("%.7f %.7f" % (lon + distance * math.cos(angle) / METERS_PER_DEGREE / math.cos(math.radians(lat)),
+                                              lat + distance * math.sin(angle) / METERS_PER_DEGREE))
+
+        return "(" + ", ".join(coordinates + coordinates[:1]) + ")"
+
+    def pointRows(self):
+        for index in range(self.points):
+            _, prefix, tags = self.__choose(POINT_KINDS)
+            tags = self.__tags(tags)
+            lat, lon = self.__location()
+
+            yield ("n%d" % index, self.__name(prefix, index), tags.pop("barrier", None), tags.pop("highway", None),
+                   hstore(tags), "SRID=4326;MULTIPOINT((%.7f %.7f))" % (lon, lat))
+
+    def multipolygonRows(self):
+        for index in range(self.multipolygons):
+            _, prefix, tags, smallest, largest = self.__choose(POLYGON_KINDS)
+            tags = self.__tags(tags)
+            lat, lon = self.__location()
+
+            yield ("w%d" % index, self.__name(prefix, index), tags.pop("building", None), tags.pop("landuse", None),
+                   tags.pop("leisure", None), tags.pop("sport", None), hstore(tags),
+                   "SRID=4326;MULTIPOLYGON((%s))" % self.__ring(lat, lon, smallest, largest))
+
+    def relationRows(self):
+        for index in range(self.other_relations):
+            _, prefix, tags = self.__choose(RELATION_KINDS)
+            tags = self.__tags(tags)
+            lat, lon = self.__location()
+
+            yield ("r%d" % index, self.__name(prefix, index), tags.pop("type", None), hstore(tags),
+                   "SRID=4326;GEOMETRYCOLLECTION(POINT(%.7f %.7f), POLYGON(%s))" % (lon, lat, self.__ring(lat, lon, 50, 200)))
+
+
+def copyRows(cursor, table, columns, rows, chunk_size=50000):
+    """Loads rows with COPY in chunks, so millions of features never have to fit into memory at once."""
+    while True:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        count = 0
+        for row in rows:
+            writer.writerow(["" if value is None else value for value in row])
+            count += 1
+            if count == chunk_size:
+                break
+
+        if count == 0:
+            return
+
+        buffer.seek(0)
+        # Unquoted empty fields are NULL in CSV mode.
+        cursor.copy_expert("COPY %s (%s) FROM STDIN WITH (FORMAT csv)" % (table, ", ".join(columns)), buffer)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Loads a reproducible synthetic OSM dataset into the database of the settings file, "
+                                                 "replacing the points, multipolygons and other_relations tables.")
+    parser.add_argument("settings", help="settings file with the DATABASE_* connection parameters")
+    parser.add_argument("--lat", type=float, default=50.9375, help="latitude of the center of the dataset")
+    parser.add_argument("--lon", type=float, default=6.9603, help="longitude of the center of the dataset")
+    parser.add_argument("--extent", type=float, default=10000, help="side length of the covered square in meters")
+    parser.add_argument("--density", type=float, default=1000, help="points per km²")
+    parser.add_argument("--seed", type=int, default=1)
+    arguments = parser.parse_args()
+
+    fixture = FixtureGenerator(arguments.lat, arguments.lon, arguments.extent, arguments.density, arguments.seed)
+    connection = psycopg2.connect(**connectionParameters(loadSettings(arguments.settings)))
+    connection.autocommit = True
+
+    with connection.cursor() as cursor:
+        started = time.monotonic()
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS postgis")
+        cursor.execute(SCHEMA)
+
+        copyRows(cursor, "points", ["osm_id", "name", "barrier", "highway", "other_tags", "geom"], fixture.pointRows())
+        copyRows(cursor, "multipolygons", ["osm_way_id", "name", "building", "landuse", "leisure", "sport", "other_tags", "geom"], fixture.multipolygonRows())
+        copyRows(cursor, "other_relations", ["osm_id", "name", "type", "other_tags", "geom"], fixture.relationRows())
+        print("loaded %d points, %d multipolygons and %d other_relations in %.1f s" % (
+            fixture.points, fixture.multipolygons, fixture.other_relations, time.monotonic() - started))
+
+        for name in POST_IMPORT_FILES:
+            started = time.monotonic()
+            with open(os.path.join(DATABASE_DIR, "sql", name)) as script:
+                cursor.execute(script.read())
+            print("ran %s in %.1f s" % (name, time.monotonic() - started))
+
+        cursor.execute("INSERT INTO benchmark_fixture (lat, lon, extent, density, seed, points, multipolygons, other_relations) "
+                       "VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+                       (fixture.lat, fixture.lon, fixture.extent, fixture.density, fixture.seed, fixture.points, fixture.multipolygons, fixture.other_relations))
+
+    connection.close()
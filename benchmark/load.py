@@ -0,0 +1,77 @@
+import argparse
+import time
+import urllib.error
+import urllib.request
+import zlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from common import createService, fixtureExtent, loadSettings, samplePoints, summarize, writeResults
+
+
+def request(url, timeout):
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except OSError:
+        status = "error"
+
+    return status, time.perf_counter() - started
+
+
+def run(base_url, path, points, radius, requests, concurrency, timeout):
+    """Sends `requests` requests for the points in turn with `concurrency` clients and returns latencies and throughput."""
+    urls = ["%s/relative/%f,%f/%d%s" % (base_url, lat, lon, radius, path) for lat, lon in points]
+    urls = [urls[index % len(urls)] for index in range(requests)]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        responses = list(executor.map(lambda url: request(url, timeout), urls))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "latency": summarize([duration for status, duration in responses if status == 200]),
+        "statuses": {str(status): count for status, count in Counter(status for status, _ in responses).items()},
+        "requests_per_second": len(responses) / elapsed
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replays requests against a running webserver on the synthetic fixture. "
+                                                 "Cold runs never repeat a point, warm runs cycle through a few points.")
+    parser.add_argument("settings", help="settings file with the DATABASE_* connection parameters, used to find the fixture")
+    parser.add_argument("--url", default="http://localhost:5000", help="base URL of the webserver")
+    parser.add_argument("--output", default="load.json", help="path of the JSON results")
+    parser.add_argument("--paths", nargs="+", default=["", "/supermarkets", "/parks", "/landuse"],
+                        help="endpoints below /relative/<lat>,<lon>/<radius>, the empty path is the full report")
+    parser.add_argument("--radii", type=int, nargs="+", default=[250, 1000, 2000])
+    parser.add_argument("--requests", type=int, default=500, help="requests per path, radius and temperature")
+    parser.add_argument("--warm-points", type=int, default=10, help="distinct points of the warm runs")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=1)
+    arguments = parser.parse_args()
+
+    fixture = fixtureExtent(createService(loadSettings(arguments.settings)))
+
+    results = []
+    for radius in arguments.radii:
+        for path in arguments.paths:
+            # Every run gets its own points, so that earlier runs cannot have warmed up the cold ones.
+            seed = zlib.crc32(("%d %d %s" % (arguments.seed, radius, path)).encode("utf-8"))
+            cold = samplePoints(fixture, arguments.requests, seed)
+            warm = samplePoints(fixture, arguments.warm_points, seed + 1)
+
+            for temperature, points in (("cold", cold), ("warm", warm)):
+                result = dict(run(arguments.url.rstrip("/"), path, points, radius, arguments.requests, arguments.concurrency, arguments.timeout),
+                              path=path, radius=radius, temperature=temperature)
+                results.append(result)
+                print("%-15s %6d m  %s  %7.1f req/s  p50 %8.2f ms  p99 %8.2f ms  %s" % (
+                    path or "(full report)", radius, temperature, result["requests_per_second"],
+                    result["latency"].get("p50", 0), result["latency"].get("p99", 0), result["statuses"]))
+
+    writeResults(arguments.output, "load", dict(vars(arguments), fixture=fixture), results)
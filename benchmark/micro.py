@@ -0,0 +1,82 @@
+import argparse
+import time
+
+from common import createService, fixtureExtent, loadSettings, samplePoints, summarize, writeResults
+from osm_service import REPORT_CATEGORIES
+
+
+def resultRows(result):
+    if isinstance(result, dict):
+        # Counts are one value per category.
+        return sum(len(value) if isinstance(value, (dict, list)) else 1 for value in result.values())
+
+    return len(result)
+
+
+# Every OsmService method the webserver calls for a single point, as (name, callable(osm, lat, lon, radius)).
+BENCHMARKS = [(method, lambda osm, lat, lon, radius, method=method: getattr(osm, method)(lat, lon, radius)) for method in REPORT_CATEGORIES.values()] + [
+    ("getFullReport", lambda osm, lat, lon, radius: osm.getFullReport(lat, lon, radius)),
+    ("getFullReport_narrow", lambda osm, lat, lon, radius: osm.getFullReport(lat, lon, radius, ["supermarkets", "parks"], [])),
+    ("getByTags", lambda osm, lat, lon, radius: osm.getByTags(lat, lon, radius, {"amenity": "restaurant"}, [])),
+    ("getNearest", lambda osm, lat, lon, radius: osm.getNearest("supermarkets", lat, lon, 3, radius)),
+    ("getCounts", lambda osm, lat, lon, radius: osm.getCounts(lat, lon, radius, list(REPORT_CATEGORIES))),
+]
+
+
+def measure(osm, method, points, radius, passes):
+    """Runs the method once for every point and radius on a fresh connection pool (cold), then `passes` more times (warm).
+
+    Cold only means new connections without prepared statements and points that
+    were not queried before; the caches of PostgreSQL and the OS are not dropped.
+    """
+    cold, warm, rows = [], [], 0
+    for run in range(passes + 1):
+        for lat, lon in points:
+            started = time.perf_counter()
+            result = method(osm, lat, lon, radius)
+            (cold if run == 0 else warm).append(time.perf_counter() - started)
+            rows += resultRows(result)
+
+    return {
+        "cold": summarize(cold),
+        "warm": summarize(warm),
+        "rows_per_call": rows / (len(points) * (passes + 1))
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Times every OsmService method on the synthetic fixture for several radii.")
+    parser.add_argument("settings", help="settings file with the DATABASE_* connection parameters")
+    parser.add_argument("--output", default="micro.json", help="path of the JSON results")
+    parser.add_argument("--radii", type=int, nargs="+", default=[250, 500, 1000, 2000])
+    parser.add_argument("--points", type=int, default=50, help="number of sample points per radius")
+    parser.add_argument("--passes", type=int, default=5, help="warm passes over the sample points")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--only", nargs="+", help="only run these methods")
+    arguments = parser.parse_args()
+
+    config = loadSettings(arguments.settings)
+    fixture = fixtureExtent(createService(config))
+
+    results = []
+    for radius in arguments.radii:
+        points = samplePoints(fixture, arguments.points, arguments.seed + radius)
+        for name, method in BENCHMARKS:
+            if arguments.only and name not in arguments.only:
+                continue
+
+            osm = createService(config)
+            result = dict(measure(osm, method, points, radius, arguments.passes), method=name, radius=radius)
+            osm.pool.closeAll()
+            results.append(result)
+            print("%-20s %6d m  cold p50 %8.2f ms  warm p50 %8.2f ms  p99 %8.2f ms  %8.1f rows" % (
+                name, radius, result["cold"]["p50"], result["warm"]["p50"], result["warm"]["p99"], result["rows_per_call"]))
+
+        if not arguments.only or "getBatchReports" in arguments.only:
+            osm = createService(config)
+            started = time.perf_counter()
+            osm.getBatchReports([(lat, lon, radius, list(REPORT_CATEGORIES)) for lat, lon in points])
+            results.append({"method": "getBatchReports", "radius": radius, "items": len(points), "total": summarize([time.perf_counter() - started])})
+            osm.pool.closeAll()
+
+    writeResults(arguments.output, "micro", dict(vars(arguments), fixture=fixture), results)
@@ -0,0 +1,249 @@
+"""Imports an OSM extract faster than import_data.sh.
+
+The three layers are loaded by concurrent ogr2ogr processes into unlogged
+tables of a staging schema, without spatial indexes. The derived columns and
+tables of the sql/ files are built there, still without any index, and the
+layers are turned into regular logged tables while that only rewrites their
+rows. Then all indexes, the geom indexes of the layers and those of
+indexes.sql, are built concurrently on a connection each. After a final
+ANALYZE the staging tables replace the live tables in a single transaction, so
+the webserver keeps answering from the old data until then. The duration of
+every phase is printed at the end.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+from psycopg2.errors import LockNotAvailable
+
+SQL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sql")
+
+LAYERS = ("points", "multipolygons", "other_relations")
+TABLES = LAYERS + ("poi", "poi_grid")
+
+# Built by ogr2ogr unless the spatial index is deferred, queried by the bounding box prefilters of the webserver.
+GEOM_INDEXES = ["CREATE INDEX %s_geom_geom_idx ON %s USING gist (geom)" % (layer, layer) for layer in LAYERS]
+
+# The sql/ files that derive columns and tables from the layers, in the order of import_data.sh.
+DERIVE_FILES = ["geography.sql", "landuse.sql", "tags.sql", "poi.sql", "poi_grid.sql"]
+
+# The indexes of the derived columns and tables, one independent statement each.
+INDEX_FILE = "indexes.sql"
+
+# Written to public after the swap.
+PUBLISH_FILES = ["extent.sql", "data_version.sql"]
+
+SWAP_ATTEMPTS = 10
+
+
+def sql_statements(script):
+    """The statements of a script of plain statements, without its comments."""
+    lines = [line for line in script.splitlines() if not line.lstrip().startswith("--")]
+    return [statement.strip() for statement in "\n".join(lines).split(";") if statement.strip()]
+
+
+class Phases:
+    """Measures the duration of every phase of the import."""
+
+    def __init__(self):
+        self.durations = []
+
+    def run(self, name, function, *args):
+        print("%s..." % name, flush=True)
+        started = time.monotonic()
+        result = function(*args)
+        self.durations.append((name, time.monotonic() - started))
+        print("%s took %.1f s" % (name, self.durations[-1][1]), flush=True)
+        return result
+
+    def report(self):
+        width = max(len(name) for name, _ in self.durations)
+        for name, duration in self.durations:
+            print("%-*s %8.1f s" % (width, name, duration))
+        print("%-*s %8.1f s" % (width, "total", sum(duration for _, duration in self.durations)))
+
+
+class Importer:
+    def __init__(self, connection_parameters, file, staging_schema="osm_import", live_schema="public", maintenance_work_mem="1GB",
+                 logged=True, lock_timeout="5s", index_workers=4):
+        self.connection_parameters = connection_parameters
+        self.file = file
+        self.staging_schema = staging_schema
+        self.live_schema = live_schema
+        self.previous_schema = staging_schema + "_previous"
+        self.maintenance_work_mem = maintenance_work_mem
+        self.logged = logged
+        self.lock_timeout = lock_timeout
+        self.index_workers = index_workers
+
+    def __connect(self, search_path=None):
+        options = "-c maintenance_work_mem=%s" % self.maintenance_work_mem
+        if search_path is not None:
+            options += " -c search_path=%s,public" % search_path
+
+        connection = psycopg2.connect(options=options, **self.connection_parameters)
+        connection.autocommit = True
+        return connection
+
+    def __execute(self, statements, search_path=None):
+        connection = self.__connect(search_path)
+        try:
+            with connection.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
+        finally:
+            connection.close()
+
+    def __parallel(self, statements, search_path=None):
+        """Runs every statement on a connection of its own, at most `index_workers` at a time."""
+        with ThreadPoolExecutor(max_workers=min(len(statements), self.index_workers)) as executor:
+            for future in [executor.submit(self.__execute, [statement], search_path) for statement in statements]:
+                future.result()
+
+    def createStagingSchema(self):
+        self.__execute(["DROP SCHEMA IF EXISTS %s CASCADE" % self.staging_schema, "CREATE SCHEMA %s" % self.staging_schema])
+
+    def __loadLayer(self, layer):
+        parameters = self.connection_parameters
+        # ogr2ogr reads PGPASSWORD, so the password does not show up in the process list.
+        destination = "PG:host=%s port=%s user=%s dbname=%s active_schema=%s" % (
+            parameters["host"], parameters["port"], parameters["user"], parameters["database"], self.staging_schema)
+        command = ["ogr2ogr", "--config", "PG_USE_COPY", "YES", "-f", "PostgreSQL", destination, "-lco", "DIM=2", self.file, layer,
+                   "-overwrite", "-lco", "GEOMETRY_NAME=geom", "-lco", "FID=id", "-lco", "UNLOGGED=YES", "-lco", "SPATIAL_INDEX=NONE",
+                   "-nln", "%s.%s" % (self.staging_schema, layer), "-nlt", "PROMOTE_TO_MULTI"]
+        subprocess.run(command, check=True, env=dict(os.environ, PGPASSWORD=parameters["password"]))
+
+    def load(self):
+        with ThreadPoolExecutor(max_workers=len(LAYERS)) as executor:
+            for future in [executor.submit(self.__loadLayer, layer) for layer in LAYERS]:
+                future.result()
+
+    def derive(self, name):
+        with open(os.path.join(SQL_DIR, name)) as script:
+            self.__execute([script.read()], search_path=self.staging_schema)
+
+    def setLogged(self):
+        # Rewrites every table once, instead of logging each of the updates of the derive phase. No index
+        # exists yet, so only the rows are written to the WAL; the indexes are logged once while they are built.
+        self.__parallel(["ALTER TABLE %s.%s SET LOGGED" % (self.staging_schema, layer) for layer in LAYERS])
+
+    def buildIndexes(self):
+        with open(os.path.join(SQL_DIR, INDEX_FILE)) as script:
+            statements = GEOM_INDEXES + sql_statements(script.read())
+
+        self.__parallel(statements, search_path=self.staging_schema)
+
+    def analyze(self):
+        self.__parallel(["ANALYZE %s.%s" % (self.staging_schema, table) for table in TABLES])
+
+    def check(self):
+        for table in TABLES:
+            connection = self.__connect()
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT count(*) FROM %s.%s" % (self.staging_schema, table))
+                    if cursor.fetchone()[0] == 0:
+                        raise RuntimeError("%s.%s is empty, keeping the live tables" % (self.staging_schema, table))
+            finally:
+                connection.close()
+
+    def swap(self):
+        self.__execute(["DROP SCHEMA IF EXISTS %s CASCADE" % self.previous_schema])
+
+        statements = ["SET LOCAL lock_timeout = '%s'" % self.lock_timeout, "CREATE SCHEMA %s" % self.previous_schema]
+        for table in TABLES:
+            statements.append("ALTER TABLE IF EXISTS %s.%s SET SCHEMA %s" % (self.live_schema, table, self.previous_schema))
+            statements.append("ALTER TABLE %s.%s SET SCHEMA %s" % (self.staging_schema, table, self.live_schema))
+
+        for attempt in range(1, SWAP_ATTEMPTS + 1):
+            connection = self.__connect()
+            try:
+                # A failed attempt rolls back completely.
+                connection.autocommit = False
+                with connection:
+                    with connection.cursor() as cursor:
+                        for statement in statements:
+                            cursor.execute(statement)
+                return
+            except LockNotAvailable:
+                if attempt == SWAP_ATTEMPTS:
+                    raise
+                time.sleep(5)
+            finally:
+                connection.close()
+
+    def publish(self):
+        scripts = []
+        for name in PUBLISH_FILES:
+            with open(os.path.join(SQL_DIR, name)) as script:
+                scripts.append(script.read())
+
+        self.__execute(scripts)
+
+    def dropPrevious(self):
+        try:
+            self.__execute(["SET lock_timeout = '%s'" % self.lock_timeout,
+                            "DROP SCHEMA %s CASCADE" % self.previous_schema, "DROP SCHEMA %s CASCADE" % self.staging_schema])
+        except LockNotAvailable:
+            print("the previous tables are still in use and will be dropped by the next import.")
+
+
+def download(region, file):
+    if os.path.exists(file):
+        print("%s exists." % file)
+        return
+
+    print("%s does not exist. downloading..." % file)
+    urllib.request.urlretrieve("http://download.geofabrik.de/europe/%s-latest.osm.pbf" % region, file + ".download")
+    os.replace(file + ".download", file)
+
+
+if __name__ == "__main__":
+    from flask import Config
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("settings", help="settings file with the DATABASE_* connection parameters")
+    parser.add_argument("--region", default="germany/nordrhein-westfalen", help="Geofabrik extract below europe/, downloaded if the file does not exist")
+    parser.add_argument("--file", help="the .osm.pbf file, named after the region by default")
+    parser.add_argument("--maintenance-work-mem", default="1GB", help="maintenance_work_mem of every connection building indexes")
+    parser.add_argument("--index-workers", type=int, default=4,
+                        help="indexes built at the same time, each on a connection with --maintenance-work-mem")
+    parser.add_argument("--unlogged", action="store_true",
+                        help="keep the layers unlogged; faster, but they are emptied by a database crash and not replicated")
+    arguments = parser.parse_args()
+
+    config = Config(".")
+    config.from_pyfile(os.path.abspath(arguments.settings))
+
+    file = arguments.file or "%s-latest.osm.pbf" % os.path.basename(arguments.region)
+    importer = Importer({"user": config["DATABASE_USER"], "password": config["DATABASE_PASSWORD"], "host": config["DATABASE_HOST"],
+                         "port": config["DATABASE_PORT"], "database": config["DATABASE_NAME"]},
+                        file, maintenance_work_mem=arguments.maintenance_work_mem, logged=not arguments.unlogged,
+                        index_workers=arguments.index_workers)
+
+    phases = Phases()
+    try:
+        phases.run("download", download, arguments.region, file)
+        phases.run("staging schema", importer.createStagingSchema)
+        phases.run("load layers", importer.load)
+        for name in DERIVE_FILES:
+            phases.run(name, importer.derive, name)
+        if importer.logged:
+            phases.run("set logged", importer.setLogged)
+        phases.run("indexes", importer.buildIndexes)
+        phases.run("analyze", importer.analyze)
+        phases.run("check", importer.check)
+        phases.run("swap", importer.swap)
+        phases.run("extent and data version", importer.publish)
+        phases.run("drop previous tables", importer.dropPrevious)
+    except (subprocess.CalledProcessError, psycopg2.Error, RuntimeError) as e:
+        print("import failed: %s" % e, file=sys.stderr)
+        phases.report()
+        sys.exit(1)
+
+    phases.report()
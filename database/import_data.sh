@@ -1,17 +1,21 @@
 #!/bin/bash
 
-HOST="localhost"
-PORT="5432"
+HOST="${HOST:-localhost}"
+PORT="${PORT:-5432}"
 USER="postgres"
 PASSWORD="password"
 ACTIVE_SCHEMA="public"
+SQL_DIR="$(dirname "$0")/sql"
 
-FILE="nordrhein-westfalen-latest.osm.pbf"
+# every region database of a sharded webserver is imported separately, e.g.
+# HOST=db-bayern REGION=germany/bayern ./import_data.sh
+REGION="${REGION:-germany/nordrhein-westfalen}"
+FILE="$(basename "$REGION")-latest.osm.pbf"
 if [ -f "$FILE" ]; then
     echo "$FILE exists."
 else
     echo "$FILE does not exist. downloading..."
-    wget "http://download.geofabrik.de/europe/germany/nordrhein-westfalen-latest.osm.pbf"
+    wget "http://download.geofabrik.de/europe/$REGION-latest.osm.pbf"
 fi
 
 # ogr2ogr is part of the GDAL library see:
@@ -20,3 +24,14 @@ fi
 ogr2ogr -progress --config PG_USE_COPY YES -f PostgreSQL "PG:host=$HOST port=$PORT user=$USER password=$PASSWORD active_schema=$ACTIVE_SCHEMA" -lco DIM=2 $FILE points -overwrite -lco GEOMETRY_NAME=geom -lco FID=id -nln public.points -nlt PROMOTE_TO_MULTI
 ogr2ogr -progress --config PG_USE_COPY YES -f PostgreSQL "PG:host=$HOST port=$PORT user=$USER password=$PASSWORD active_schema=$ACTIVE_SCHEMA" -lco DIM=2 $FILE multipolygons -overwrite -lco GEOMETRY_NAME=geom -lco FID=id -nln public.multipolygons -nlt PROMOTE_TO_MULTI
 ogr2ogr -progress --config PG_USE_COPY YES -f PostgreSQL "PG:host=$HOST port=$PORT user=$USER password=$PASSWORD active_schema=$ACTIVE_SCHEMA" -lco DIM=2 $FILE other_relations -overwrite -lco GEOMETRY_NAME=geom -lco FID=id -nln public.other_relations -nlt PROMOTE_TO_MULTI
+
+# derived tables and indexes the webserver queries
+PGPASSWORD=$PASSWORD PGOPTIONS="-c search_path=$ACTIVE_SCHEMA,public" psql -h $HOST -p $PORT -U $USER -v ON_ERROR_STOP=1 \
+    -f "$SQL_DIR/geography.sql" \
+    -f "$SQL_DIR/landuse.sql" \
+    -f "$SQL_DIR/tags.sql" \
+    -f "$SQL_DIR/poi.sql" \
+    -f "$SQL_DIR/poi_grid.sql" \
+    -f "$SQL_DIR/indexes.sql" \
+    -f "$SQL_DIR/extent.sql" \
+    -f "$SQL_DIR/data_version.sql"
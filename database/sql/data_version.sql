@@ -0,0 +1,11 @@
+-- Bumps the data version after every import; webserver caches are dropped when it changes.
+-- The table lives in public, next to the live tables, so it is never swapped out by update_data.sh.
+
+CREATE TABLE IF NOT EXISTS public.data_version (
+    id boolean PRIMARY KEY DEFAULT true CHECK (id),
+    version bigint NOT NULL,
+    imported_at timestamptz NOT NULL DEFAULT now()
+);
+
+INSERT INTO public.data_version (version) VALUES (1)
+ON CONFLICT (id) DO UPDATE SET version = data_version.version + 1, imported_at = now();
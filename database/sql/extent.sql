@@ -0,0 +1,26 @@
+-- Stores the bounding box of the imported data. Webservers with several region databases
+-- route every request to the databases whose extent it overlaps. Like data_version, the
+-- table lives in public and is written after update_data.sh swapped in the new tables.
+
+CREATE TABLE IF NOT EXISTS public.data_extent (
+    id boolean PRIMARY KEY DEFAULT true CHECK (id),
+    west float8 NOT NULL,
+    south float8 NOT NULL,
+    east float8 NOT NULL,
+    north float8 NOT NULL
+);
+
+INSERT INTO public.data_extent (west, south, east, north)
+SELECT ST_XMin(extent), ST_YMin(extent), ST_XMax(extent), ST_YMax(extent)
+FROM (
+    SELECT ST_Extent(geom) AS extent
+    FROM (
+        SELECT geom FROM points
+        UNION ALL
+        SELECT geom FROM multipolygons
+        UNION ALL
+        SELECT geom FROM other_relations
+    ) AS features
+) AS extents
+WHERE extent IS NOT NULL
+ON CONFLICT (id) DO UPDATE SET west = excluded.west, south = excluded.south, east = excluded.east, north = excluded.north;
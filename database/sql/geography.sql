@@ -0,0 +1,18 @@
+-- Stores the geography of every feature once, so distance predicates no longer cast
+-- geom for every candidate row and can use a GiST index of their own, built by indexes.sql.
+
+ALTER TABLE points DROP COLUMN IF EXISTS geog;
+ALTER TABLE points ADD COLUMN geog geography;
+UPDATE points SET geog = geom::geography;
+
+ALTER TABLE multipolygons DROP COLUMN IF EXISTS geog;
+ALTER TABLE multipolygons ADD COLUMN geog geography;
+UPDATE multipolygons SET geog = geom::geography;
+
+ALTER TABLE other_relations DROP COLUMN IF EXISTS geog;
+ALTER TABLE other_relations ADD COLUMN geog geography;
+UPDATE other_relations SET geog = geom::geography;
+
+ANALYZE points;
+ANALYZE multipolygons;
+ANALYZE other_relations;
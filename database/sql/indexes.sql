@@ -0,0 +1,38 @@
+-- Every index the webserver queries apart from the geom indexes built by ogr2ogr. Runs after
+-- the derive scripts, so their updates do not maintain the indexes row by row.
+--
+-- import_data.py runs every statement on a connection of its own, so each one has to stand
+-- on its own and must not depend on another index of this file.
+
+CREATE INDEX points_geog_idx ON points USING gist (geog);
+CREATE INDEX multipolygons_geog_idx ON multipolygons USING gist (geog);
+CREATE INDEX other_relations_geog_idx ON other_relations USING gist (geog);
+
+-- Only the four reported landuse values are indexed, a small fraction of all multipolygons.
+CREATE INDEX multipolygons_landuse_geog_idx ON multipolygons USING gist (geog)
+WHERE landuse IN ('commercial', 'industrial', 'residential', 'retail');
+
+CREATE INDEX points_tags_idx ON points USING gin (tags);
+CREATE INDEX multipolygons_tags_idx ON multipolygons USING gin (tags);
+CREATE INDEX other_relations_tags_idx ON other_relations USING gin (tags);
+
+-- One partial GiST index per value of poi_category serves the single category queries,
+-- the index over all rows serves the full report.
+CREATE INDEX poi_malls_geog_idx ON poi USING gist (geog) WHERE category = 'malls';
+CREATE INDEX poi_chemists_geog_idx ON poi USING gist (geog) WHERE category = 'chemists';
+CREATE INDEX poi_convenience_geog_idx ON poi USING gist (geog) WHERE category = 'convenience';
+CREATE INDEX poi_supermarkets_geog_idx ON poi USING gist (geog) WHERE category = 'supermarkets';
+CREATE INDEX poi_parking_geog_idx ON poi USING gist (geog) WHERE category = 'parking';
+CREATE INDEX poi_schools_geog_idx ON poi USING gist (geog) WHERE category = 'schools';
+CREATE INDEX poi_kindergartens_geog_idx ON poi USING gist (geog) WHERE category = 'kindergartens';
+CREATE INDEX poi_hospitals_geog_idx ON poi USING gist (geog) WHERE category = 'hospitals';
+CREATE INDEX poi_doctors_geog_idx ON poi USING gist (geog) WHERE category = 'doctors';
+CREATE INDEX poi_railway_stations_geog_idx ON poi USING gist (geog) WHERE category = 'railway_stations';
+CREATE INDEX poi_tram_stations_geog_idx ON poi USING gist (geog) WHERE category = 'tram_stations';
+CREATE INDEX poi_bus_stations_geog_idx ON poi USING gist (geog) WHERE category = 'bus_stations';
+CREATE INDEX poi_geog_idx ON poi USING gist (geog);
+
+-- The areas of other_relations, which count queries always check exactly.
+CREATE INDEX poi_relations_geog_idx ON poi USING gist (geog) WHERE source <> 'points';
+
+CREATE UNIQUE INDEX poi_grid_cell_idx ON poi_grid (resolution, cell, category);
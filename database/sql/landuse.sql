@@ -0,0 +1,17 @@
+-- Precomputes the geodesic area of every landuse polygon the service reports on, so landuse
+-- aggregates sum a column instead of measuring every polygon again per request, and keeps a
+-- simplified copy of the geometry that the clipped landuse mode intersects with the circle.
+-- Needs the geog column of geography.sql.
+
+ALTER TABLE multipolygons DROP COLUMN IF EXISTS landuse_area;
+ALTER TABLE multipolygons DROP COLUMN IF EXISTS landuse_simplified;
+ALTER TABLE multipolygons ADD COLUMN landuse_area float8;
+ALTER TABLE multipolygons ADD COLUMN landuse_simplified geometry(Geometry, 4326);
+
+-- A tolerance of 0.00005 degrees is about 5 meters, well below the size of a landuse area.
+UPDATE multipolygons
+SET landuse_area = ST_Area(geog, false),
+    landuse_simplified = ST_MakeValid(ST_SimplifyPreserveTopology(geom, 0.00005))
+WHERE landuse IN ('commercial', 'industrial', 'residential', 'retail');
+
+ANALYZE multipolygons;
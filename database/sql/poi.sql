@@ -0,0 +1,82 @@
+-- Materializes every feature the service reports on into one row per (feature, category),
+-- so that point queries filter on an indexed enum instead of scanning other_tags with LIKE.
+-- The rows are written in geohash order, so features close to each other share table pages;
+-- the partial indexes per category are built by indexes.sql.
+-- other_tags is stored as jsonb, which the webserver decodes without parsing hstore text.
+--
+-- The script also runs against the shadow schema of update_data.sh, so it only drops the
+-- poi table of the current schema, never the live one found further down the search_path.
+-- The poi_category type is shared by all schemas and lives in public; categories are only
+-- ever added to it.
+
+CREATE EXTENSION IF NOT EXISTS hstore SCHEMA public;
+
+DO $$
+BEGIN
+    EXECUTE format('DROP TABLE IF EXISTS %I.poi', current_schema());
+
+    IF to_regtype('public.poi_category') IS NULL THEN
+        CREATE TYPE public.poi_category AS ENUM (
+            'malls',
+            'chemists',
+            'convenience',
+            'supermarkets',
+            'parking',
+            'schools',
+            'kindergartens',
+            'hospitals',
+            'doctors',
+            'railway_stations',
+            'tram_stations',
+            'bus_stations'
+        );
+    END IF;
+END $$;
+
+ALTER TYPE public.poi_category ADD VALUE IF NOT EXISTS 'malls';
+ALTER TYPE public.poi_category ADD VALUE IF NOT EXISTS 'chemists';
+ALTER TYPE public.poi_category ADD VALUE IF NOT EXISTS 'convenience';
+ALTER TYPE public.poi_category ADD VALUE IF NOT EXISTS 'supermarkets';
+ALTER TYPE public.poi_category ADD VALUE IF NOT EXISTS 'parking';
+ALTER TYPE public.poi_category ADD VALUE IF NOT EXISTS 'schools';
+ALTER TYPE public.poi_category ADD VALUE IF NOT EXISTS 'kindergartens';
+ALTER TYPE public.poi_category ADD VALUE IF NOT EXISTS 'hospitals';
+ALTER TYPE public.poi_category ADD VALUE IF NOT EXISTS 'doctors';
+ALTER TYPE public.poi_category ADD VALUE IF NOT EXISTS 'railway_stations';
+ALTER TYPE public.poi_category ADD VALUE IF NOT EXISTS 'tram_stations';
+ALTER TYPE public.poi_category ADD VALUE IF NOT EXISTS 'bus_stations';
+
+CREATE TABLE poi AS
+SELECT * FROM (
+    SELECT categories.category::poi_category AS category, 'points' AS source, id, name, hstore_to_jsonb(other_tags::hstore) AS other_tags, ST_Centroid(geom) AS geom, geog
+    FROM points
+    CROSS JOIN LATERAL (VALUES
+        ('malls', other_tags like '%"shop"=>"mall"%'),
+        ('chemists', other_tags like '%"shop"=>"chemist"%'),
+        ('convenience', other_tags like '%"shop"=>"convenience"%'),
+        ('supermarkets', other_tags like '%"shop"=>"supermarket"%'),
+        ('parking', other_tags like '%"amenity"=>"parking"%'
+            AND NOT other_tags like '%"access"=>"private"%'
+            AND NOT other_tags like '%"access"=>"no"%'
+            AND NOT other_tags like '%"access"=>"discouraged"%'),
+        ('schools', other_tags like '%"amenity"=>"school"%'),
+        ('kindergartens', other_tags like '%"amenity"=>"kindergarten"%'),
+        ('hospitals', other_tags like '%"amenity"=>"hospital"%'),
+        ('doctors', other_tags like '%"amenity"=>"doctors"%'),
+        ('railway_stations', other_tags like '%"railway"=>"station"%'),
+        ('tram_stations', other_tags like '%"railway"=>"tram_stop"%'),
+        ('bus_stations', highway = 'bus_stop')
+    ) AS categories(category, matches)
+    WHERE categories.matches
+    UNION ALL
+    SELECT categories.category::poi_category, 'other_relations', id, name, hstore_to_jsonb(other_tags::hstore), ST_Centroid(geom), geog
+    FROM other_relations
+    CROSS JOIN LATERAL (VALUES
+        ('schools', other_tags like '%"amenity"=>"school"%'),
+        ('kindergartens', other_tags like '%"amenity"=>"kindergarten"%')
+    ) AS categories(category, matches)
+    WHERE categories.matches
+) AS features
+ORDER BY ST_GeoHash(geom, 10);
+
+ANALYZE poi;
@@ -0,0 +1,26 @@
+-- Counts the point features of every category per geohash cell at several resolutions,
+-- so that count-only queries add up the cells completely inside the circle and only
+-- check the features of the cells on its border. Needs the poi table of poi.sql.
+--
+-- Only features imported from points are aggregated. The areas of other_relations can
+-- reach into the circle from a cell outside of it and are always counted exactly.
+--
+-- Like poi.sql, the script only drops the poi_grid table of the current schema.
+
+DO $$
+BEGIN
+    EXECUTE format('DROP TABLE IF EXISTS %I.poi_grid', current_schema());
+END $$;
+
+CREATE TABLE poi_grid AS
+SELECT resolutions.resolution, left(cells.geohash, resolutions.resolution) AS cell, cells.category, count(*)::int AS count
+FROM (
+    SELECT category, ST_GeoHash(geom, 7) AS geohash
+    FROM poi
+    WHERE source = 'points'
+) AS cells
+CROSS JOIN (VALUES (4), (5), (6), (7)) AS resolutions(resolution)
+GROUP BY resolutions.resolution, left(cells.geohash, resolutions.resolution), cells.category;
+
+ANALYZE poi_grid;
+ANALYZE poi;
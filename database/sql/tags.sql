@@ -0,0 +1,54 @@
+-- Converts the hstore text in other_tags, together with the tags ogr2ogr extracts into
+-- dedicated columns, into a jsonb column for ad-hoc tag queries with @> and ?&, indexed by indexes.sql.
+
+CREATE EXTENSION IF NOT EXISTS hstore SCHEMA public;
+
+ALTER TABLE points DROP COLUMN IF EXISTS tags;
+ALTER TABLE points ADD COLUMN tags jsonb;
+UPDATE points SET tags = jsonb_strip_nulls(jsonb_build_object(
+    'name', name,
+    'barrier', barrier,
+    'highway', highway,
+    'ref', ref,
+    'is_in', is_in,
+    'place', place,
+    'man_made', man_made
+)) || coalesce(hstore_to_jsonb(other_tags::hstore), '{}');
+
+ALTER TABLE multipolygons DROP COLUMN IF EXISTS tags;
+ALTER TABLE multipolygons ADD COLUMN tags jsonb;
+UPDATE multipolygons SET tags = jsonb_strip_nulls(jsonb_build_object(
+    'name', name,
+    'type', type,
+    'aeroway', aeroway,
+    'amenity', amenity,
+    'admin_level', admin_level,
+    'barrier', barrier,
+    'boundary', boundary,
+    'building', building,
+    'craft', craft,
+    'geological', geological,
+    'historic', historic,
+    'land_area', land_area,
+    'landuse', landuse,
+    'leisure', leisure,
+    'man_made', man_made,
+    'military', military,
+    'natural', "natural",
+    'office', office,
+    'place', place,
+    'shop', shop,
+    'sport', sport,
+    'tourism', tourism
+)) || coalesce(hstore_to_jsonb(other_tags::hstore), '{}');
+
+ALTER TABLE other_relations DROP COLUMN IF EXISTS tags;
+ALTER TABLE other_relations ADD COLUMN tags jsonb;
+UPDATE other_relations SET tags = jsonb_strip_nulls(jsonb_build_object(
+    'name', name,
+    'type', type
+)) || coalesce(hstore_to_jsonb(other_tags::hstore), '{}');
+
+ANALYZE points;
+ANALYZE multipolygons;
+ANALYZE other_relations;
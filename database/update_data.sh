@@ -0,0 +1,129 @@
+#!/bin/bash
+# Updates the OSM data while the webserver keeps serving the current tables.
+#
+# The local extract is brought up to date with the OSM change files (osc) published
+# next to it, so only the changes of the last days are downloaded. The tables are then
+# rebuilt in a shadow schema, indexed and analyzed, and swapped with the live tables in
+# a single transaction. Queries running during the update keep reading the old tables.
+
+set -e
+
+HOST="${HOST:-localhost}"
+PORT="${PORT:-5432}"
+USER="postgres"
+PASSWORD="password"
+LIVE_SCHEMA="public"
+SHADOW_SCHEMA="osm_shadow"
+PREVIOUS_SCHEMA="osm_previous"
+SQL_DIR="$(dirname "$0")/sql"
+
+LAYERS="points multipolygons other_relations"
+TABLES="$LAYERS poi poi_grid"
+
+# Lock waits of the swap, which block the queries of the webserver while they last.
+LOCK_TIMEOUT="5s"
+SWAP_ATTEMPTS=10
+
+REGION="${REGION:-germany/nordrhein-westfalen}"
+FILE="$(basename "$REGION")-latest.osm.pbf"
+URL="http://download.geofabrik.de/europe/$REGION-latest.osm.pbf"
+
+export PGPASSWORD=$PASSWORD
+
+run_psql() {
+    psql -h $HOST -p $PORT -U $USER -v ON_ERROR_STOP=1 "$@"
+}
+
+download_extract() {
+    wget -O "$FILE.download" "$URL"
+    mv "$FILE.download" "$FILE"
+}
+
+# pyosmium-up-to-date (https://osmcode.org/pyosmium/) applies the change files of the
+# replication service named in the header of Geofabrik extracts. It exits with 1 while
+# more changes are available than it applies in one run.
+update_extract() {
+    if [ ! -f "$FILE" ]; then
+        echo "$FILE does not exist. downloading..."
+        download_extract
+        return
+    fi
+
+    if ! command -v pyosmium-up-to-date > /dev/null; then
+        echo "pyosmium-up-to-date not found. downloading the whole extract..."
+        download_extract
+        return
+    fi
+
+    while true; do
+        status=0
+        pyosmium-up-to-date -v "$FILE" || status=$?
+        case $status in
+            0) return ;;
+            1) ;;
+            *)
+                echo "applying the change files failed. downloading the whole extract..."
+                download_extract
+                return
+                ;;
+        esac
+    done
+}
+
+update_extract
+
+# rebuild all tables in the shadow schema
+run_psql -c "DROP SCHEMA IF EXISTS $SHADOW_SCHEMA CASCADE" -c "CREATE SCHEMA $SHADOW_SCHEMA"
+
+for LAYER in $LAYERS; do
+    ogr2ogr -progress --config PG_USE_COPY YES -f PostgreSQL "PG:host=$HOST port=$PORT user=$USER password=$PASSWORD active_schema=$SHADOW_SCHEMA" -lco DIM=2 $FILE $LAYER -overwrite -lco GEOMETRY_NAME=geom -lco FID=id -nln $SHADOW_SCHEMA.$LAYER -nlt PROMOTE_TO_MULTI
+done
+
+# derived tables, indexes and statistics, all created before the swap
+PGOPTIONS="-c search_path=$SHADOW_SCHEMA,public" run_psql \
+    -f "$SQL_DIR/geography.sql" \
+    -f "$SQL_DIR/landuse.sql" \
+    -f "$SQL_DIR/tags.sql" \
+    -f "$SQL_DIR/poi.sql" \
+    -f "$SQL_DIR/poi_grid.sql" \
+    -f "$SQL_DIR/indexes.sql"
+
+for TABLE in $TABLES; do
+    ROWS=$(run_psql -tA -c "SELECT count(*) FROM $SHADOW_SCHEMA.$TABLE")
+    if [ "$ROWS" -eq 0 ]; then
+        echo "$SHADOW_SCHEMA.$TABLE is empty. keeping the live tables."
+        exit 1
+    fi
+done
+
+# swap the shadow tables in; a failed attempt rolls back completely
+SWAP="BEGIN;
+SET LOCAL lock_timeout = '$LOCK_TIMEOUT';
+CREATE SCHEMA $PREVIOUS_SCHEMA;"
+for TABLE in $TABLES; do
+    SWAP="$SWAP
+ALTER TABLE IF EXISTS $LIVE_SCHEMA.$TABLE SET SCHEMA $PREVIOUS_SCHEMA;
+ALTER TABLE $SHADOW_SCHEMA.$TABLE SET SCHEMA $LIVE_SCHEMA;"
+done
+SWAP="$SWAP
+COMMIT;"
+
+run_psql -c "DROP SCHEMA IF EXISTS $PREVIOUS_SCHEMA CASCADE"
+
+ATTEMPT=1
+until echo "$SWAP" | run_psql; do
+    if [ $ATTEMPT -ge $SWAP_ATTEMPTS ]; then
+        echo "could not swap the tables after $ATTEMPT attempts. the shadow tables are kept in $SHADOW_SCHEMA."
+        exit 1
+    fi
+
+    ATTEMPT=$((ATTEMPT + 1))
+    sleep 5
+done
+
+# webserver caches are dropped when the data version changes
+run_psql -f "$SQL_DIR/extent.sql" -f "$SQL_DIR/data_version.sql"
+
+# the old tables are dropped once no query reads them anymore, or at the next update
+run_psql -c "SET lock_timeout = '$LOCK_TIMEOUT'" -c "DROP SCHEMA $PREVIOUS_SCHEMA CASCADE" -c "DROP SCHEMA $SHADOW_SCHEMA CASCADE" \
+    || echo "the previous tables are still in use and will be dropped by the next update."
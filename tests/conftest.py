@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The webserver modules import each other as top-level modules, like benchmark/common.py.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "webserver"))
@@ -0,0 +1,60 @@
+import threading
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejectedError, estimate_cost
+
+
+def test_estimate_cost_grows_with_area_and_density():
+    assert estimate_cost(1000, ["malls"], {"malls": 2.0}) == pytest.approx(2 * 3.14159, rel=1e-4)
+    assert estimate_cost(2000, ["malls"], {"malls": 2.0}) == pytest.approx(4 * estimate_cost(1000, ["malls"], {"malls": 2.0}))
+
+
+def test_cheap_requests_are_always_admitted():
+    controller = AdmissionController(heavy_cost=10, heavy_concurrency=1, heavy_queue_size=0, queue_timeout=0, retry_after=5)
+    with controller.admit(100):
+        for _ in range(3):
+            with controller.admit(10):
+                pass
+
+
+def hold(controller, cost, entered, release):
+    with controller.admit(cost):
+        entered.set()
+        release.wait(5)
+
+
+def test_full_queue_is_rejected_with_429():
+    controller = AdmissionController(heavy_cost=10, heavy_concurrency=1, heavy_queue_size=0, queue_timeout=5, retry_after=7)
+    entered, release = threading.Event(), threading.Event()
+    thread = threading.Thread(target=hold, args=(controller, 100, entered, release))
+    thread.start()
+    try:
+        assert entered.wait(5)
+        with pytest.raises(AdmissionRejectedError) as error:
+            with controller.admit(100):
+                pass
+        assert (error.value.status, error.value.retry_after) == (429, 7)
+    finally:
+        release.set()
+        thread.join()
+
+
+def test_queue_timeout_is_rejected_with_503_and_frees_the_queue():
+    controller = AdmissionController(heavy_cost=10, heavy_concurrency=1, heavy_queue_size=1, queue_timeout=0.05, retry_after=3)
+    entered, release = threading.Event(), threading.Event()
+    thread = threading.Thread(target=hold, args=(controller, 100, entered, release))
+    thread.start()
+    try:
+        assert entered.wait(5)
+        for _ in range(2):
+            with pytest.raises(AdmissionRejectedError) as error:
+                with controller.admit(100):
+                    pass
+            assert (error.value.status, error.value.retry_after) == (503, 3)
+    finally:
+        release.set()
+        thread.join()
+
+    with controller.admit(100):
+        pass
@@ -0,0 +1,147 @@
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+import pytest
+
+import connection_pool
+from connection_pool import ConnectionPool
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.itersize = 2000
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def execute(self, query):
+        # Like psycopg2, a statement outside autocommit opens a transaction.
+        if not self.connection.autocommit:
+            self.connection.in_transaction = True
+
+    def close(self):
+        pass
+
+
+class FakeInfo:
+    def __init__(self, connection):
+        self.connection = connection
+
+    @property
+    def transaction_status(self):
+        if self.connection.in_transaction:
+            return psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+        return psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+
+class FakeConnection:
+    """Refuses to change the session inside a transaction, like a psycopg2 connection."""
+
+    def __init__(self):
+        self.closed = 0
+        self.in_transaction = False
+        self.readonly = False
+        self.prepared = set()
+        self.lastUsed = None
+        self.info = FakeInfo(self)
+        self.__autocommit = False
+
+    @property
+    def autocommit(self):
+        return self.__autocommit
+
+    @autocommit.setter
+    def autocommit(self, value):
+        if self.in_transaction:
+            raise psycopg2.ProgrammingError("set_session cannot be used inside a transaction")
+        self.__autocommit = value
+
+    def set_session(self, readonly=None, autocommit=None):
+        if self.in_transaction:
+            raise psycopg2.ProgrammingError("set_session cannot be used inside a transaction")
+        self.readonly = readonly
+        self.__autocommit = autocommit
+
+    def cursor(self, name=None):
+        return FakeCursor(self)
+
+    def rollback(self):
+        self.in_transaction = False
+
+    def close(self):
+        self.closed = 1
+
+
+class FakePool:
+    def __init__(self, min_size, max_size, **connection_parameters):
+        self.max_size = max_size
+        self.idle = []
+        self.used = set()
+
+    def getconn(self):
+        if len(self.used) >= self.max_size:
+            raise psycopg2.pool.PoolError("connection pool exhausted")
+        connection = self.idle.pop() if self.idle else FakeConnection()
+        self.used.add(connection)
+        return connection
+
+    def putconn(self, connection, close=False):
+        if connection not in self.used:
+            raise psycopg2.pool.PoolError("trying to put unkeyed connection")
+        self.used.remove(connection)
+        if close:
+            connection.close()
+        else:
+            self.idle.append(connection)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(connection_pool.psycopg2.pool, "ThreadedConnectionPool", FakePool)
+    return ConnectionPool(1, 2, 1, 30)
+
+
+def underlying(pool):
+    return pool._ConnectionPool__getPool()
+
+
+def test_first_checkout_of_a_new_connection_succeeds(pool):
+    for _ in range(5):
+        with pool.connection() as connection:
+            assert connection.autocommit and connection.readonly
+            assert not connection.in_transaction
+
+    assert underlying(pool).used == set()
+    assert len(underlying(pool).idle) == 1
+
+
+def test_checkout_after_a_stream_succeeds(pool, monkeypatch):
+    with pool.cursor(name="stream", itersize=10) as cursor:
+        cursor.execute("SELECT 1")
+        assert not cursor.connection.autocommit and cursor.connection.in_transaction
+
+    # The returned connection is pinged on its next checkout.
+    monkeypatch.setattr(pool, "health_check_interval", 0)
+    for _ in range(5):
+        with pool.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            assert cursor.connection.autocommit and not cursor.connection.in_transaction
+
+    assert underlying(pool).used == set()
+
+
+def test_failed_checkout_returns_the_connection(pool, monkeypatch):
+    def fail(self, readonly=None, autocommit=None):
+        raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+    monkeypatch.setattr(FakeConnection, "set_session", fail)
+    for _ in range(3):
+        with pytest.raises(psycopg2.OperationalError):
+            with pool.connection():
+                pass
+
+    assert underlying(pool).used == set()
@@ -0,0 +1,60 @@
+import random
+
+import pytest
+
+from geohash_grid import MARGIN, cell_size, cover, distance, encode
+
+METERS_PER_DEGREE = 111195
+
+
+def bounding_box(lat, lon, radius):
+    lat_delta = radius / METERS_PER_DEGREE
+    lon_delta = lat_delta / 0.5
+    return lon - lon_delta, lat - lat_delta, lon + lon_delta, lat + lat_delta
+
+
+def cell_bounds(geohash):
+    width, height = cell_size(len(geohash))
+    # Decodes the bounds bit by bit, independently of the encoder.
+    south, north, west, east = -90.0, 90.0, -180.0, 180.0
+    bits = "".join(format("0123456789bcdefghjkmnpqrstuvwxyz".index(char), "05b") for char in geohash)
+    for index, bit in enumerate(bits):
+        if index % 2 == 0:
+            middle = (west + east) / 2
+            west, east = (middle, east) if bit == "1" else (west, middle)
+        else:
+            middle = (south + north) / 2
+            south, north = (middle, north) if bit == "1" else (south, middle)
+
+    assert east - west == pytest.approx(width) and north - south == pytest.approx(height)
+    return west, south, east, north
+
+
+def test_encode_known_geohash():
+    assert encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_cover_matches_brute_force(seed):
+    rng = random.Random(seed)
+    lat, lon, radius = rng.uniform(45, 55), rng.uniform(5, 15), rng.choice([300, 1000, 5000])
+    resolution, interior, border = cover(lat, lon, radius, *bounding_box(lat, lon, radius))
+
+    # Every sampled point of an interior cell is inside the circle.
+    for geohash in interior:
+        west, south, east, north = cell_bounds(geohash)
+        for _ in range(20):
+            assert distance(lat, lon, rng.uniform(south, north), rng.uniform(west, east)) <= radius
+
+    # Every point inside the circle lies in an interior or a border cell.
+    cells = set(interior) | {cell[0] for cell in border}
+    assert len(cells) == len(interior) + len(border)
+    for _ in range(500):
+        lat_delta, lon_delta = rng.uniform(-1, 1) * radius / METERS_PER_DEGREE, rng.uniform(-2, 2) * radius / METERS_PER_DEGREE
+        point = lat + lat_delta, lon + lon_delta
+        if distance(lat, lon, *point) <= radius - MARGIN:
+            assert encode(*point, resolution) in cells
+
+
+def test_cover_gives_up_on_huge_circles():
+    assert cover(50, 7, 5000000, -180, -90, 180, 90) is None
@@ -0,0 +1,87 @@
+import json
+import random
+
+import pytest
+
+from geohash_grid import distance
+from memory_service import CATEGORIES, InMemoryOsmService
+
+CENTER = (50.0, 7.0)
+
+
+def random_rows(seed, count=2000):
+    """Features within about 10 km of the center, a few of them areas reaching further than a grid cell."""
+    rng = random.Random(seed)
+    rows = []
+    for index in range(count):
+        category = rng.choice(CATEGORIES)
+        reach = rng.choice([0, 0, 0, 50, 2000]) if category in ("parks",) + CATEGORIES[-4:] else 0
+        rows.append((category, CENTER[0] + rng.uniform(-0.1, 0.1), CENTER[1] + rng.uniform(-0.15, 0.15),
+                     rng.choice([None, "feature %d" % index]), rng.choice([None, json.dumps({"index": str(index)})]),
+                     reach, rng.uniform(100, 10000)))
+    return rows
+
+
+def brute_force(rows, lat, lon, radius, category):
+    """The (name, distance) pairs of the features of a category within the radius, ordered by distance."""
+    found = []
+    for row in rows:
+        if row[0] == category:
+            reach_distance = max(distance(lat, lon, row[1], row[2]) - row[5], 0)
+            if reach_distance <= radius:
+                found.append((row[3], reach_distance))
+    return sorted(found, key=lambda item: item[1])
+
+
+@pytest.fixture(scope="module")
+def rows():
+    return random_rows(1)
+
+
+@pytest.fixture(scope="module")
+def osm(rows):
+    return InMemoryOsmService.fromRows(rows, data_version=3, cell_size=500)
+
+
+@pytest.mark.parametrize("radius", [100, 800, 3000])
+@pytest.mark.parametrize("category, method", [("malls", "getMalls"), ("parks", "getParks"), ("bus_stations", "getBusStations")])
+def test_radius_queries_match_brute_force(rows, osm, radius, category, method):
+    rng = random.Random(radius)
+    for _ in range(5):
+        lat, lon = CENTER[0] + rng.uniform(-0.05, 0.05), CENTER[1] + rng.uniform(-0.05, 0.05)
+        items = getattr(osm, method)(lat, lon, radius)
+        expected = brute_force(rows, lat, lon, radius, category)
+
+        assert [item.get("name") for item in items] == [name for name, _ in expected]
+        assert [item["distance"] for item in items] == pytest.approx([value for _, value in expected], abs=0.01)
+
+
+def test_counts_and_landuse_match_brute_force(rows, osm):
+    lat, lon, radius = CENTER[0], CENTER[1], 2000
+    counts = osm.getCounts(lat, lon, radius, ["schools", "relative_type_of_area"])
+    assert counts["schools"] == len(brute_force(rows, lat, lon, radius, "schools"))
+    for landuse in CATEGORIES[-4:]:
+        assert counts["relative_type_of_area"].get(landuse, 0) == len(brute_force(rows, lat, lon, radius, landuse))
+
+
+def test_nearest_matches_brute_force(rows, osm):
+    lat, lon = CENTER[0] + 0.01, CENTER[1] - 0.02
+    expected = brute_force(rows, lat, lon, 1e7, "doctors")[:5]
+    nearest = osm.getNearest("doctors", lat, lon, 5)
+    assert [item["distance"] for item in nearest] == pytest.approx([value for _, value in expected], abs=0.01)
+
+    assert osm.getNearest("doctors", lat, lon, 5, max_radius=expected[0][1] + 0.01) == nearest[:1]
+
+
+def test_items_carry_tags_and_names(rows, osm):
+    items = osm.getFullReport(CENTER[0], CENTER[1], 5000, ["malls"], tags=[])["malls"]
+    assert items and all("other_tags" not in item for item in items)
+    assert osm.getDataVersion() == 3
+
+
+def test_dump_roundtrip(tmp_path, osm):
+    path = str(tmp_path / "osm.npz")
+    osm.save(path)
+    loaded = InMemoryOsmService.fromFile(path, cell_size=500)
+    assert loaded.getDataVersion() == 3
+    assert loaded.getFullReport(CENTER[0], CENTER[1], 1500) == osm.getFullReport(CENTER[0], CENTER[1], 1500)
@@ -0,0 +1,24 @@
+from osm_service import NEAREST_POI_QUERIES, POI_CATEGORIES, POI_QUERIES, select_tags
+
+
+def test_select_tags_keeps_items_without_selection():
+    items = [{"name": "a", "other_tags": {"opening_hours": "24/7"}}]
+    assert select_tags(items, None) is items
+
+
+def test_select_tags_reduces_other_tags_and_copies():
+    items = [{"name": "a", "other_tags": {"opening_hours": "24/7", "website": "x"}}, {"name": "b", "other_tags": {"website": "y"}}]
+    assert select_tags(items, ["opening_hours"]) == [{"name": "a", "other_tags": {"opening_hours": "24/7"}}, {"name": "b"}]
+    assert items[0]["other_tags"] == {"opening_hours": "24/7", "website": "x"}
+
+
+def test_select_tags_empty_selection_drops_all_tags():
+    assert select_tags([{"name": "a", "other_tags": {"website": "x"}}, {"name": "b"}], []) == [{"name": "a"}, {"name": "b"}]
+
+
+def test_single_category_queries_inline_their_category():
+    for queries in (POI_QUERIES, NEAREST_POI_QUERIES):
+        assert set(queries) == set(POI_CATEGORIES)
+        for category, query in queries.items():
+            assert "%(category)s" not in query
+            assert "category = '%s'" % category in query
@@ -0,0 +1,144 @@
+import time
+
+from osm_service import REPORT_CATEGORIES
+from report_cache import ReportCache
+
+LIST_METHODS = {method for key, method in REPORT_CATEGORIES.items() if key != "relative_type_of_area"}
+
+
+class FakeOsmService:
+    """Returns one item per 100 meters of radius in every category and records the calls."""
+
+    def __init__(self):
+        self.calls = []
+        self.data_version = 1
+
+    def getDataVersion(self):
+        return self.data_version
+
+    def items(self, radius):
+        return [{"distance": float(distance), "other_tags": {"website": "x", "opening_hours": "24/7"}} for distance in range(0, radius + 1, 100)]
+
+    def getLanduse(self, lat, lon, radius):
+        self.calls.append(("getLanduse", radius))
+        return {"retail": {"count": radius, "total_area": 1.0, "unit": "m^2"}}
+
+    def __getattr__(self, name):
+        if name not in LIST_METHODS:
+            raise AttributeError(name)
+
+        def get(lat, lon, radius, limit=None, tags=None):
+            self.calls.append((name, radius))
+            return self.items(radius)
+
+        return get
+
+    def getFullReport(self, lat, lon, radius, categories=None, tags=None):
+        self.calls.append(("getFullReport", radius, None if categories is None else tuple(categories)))
+        return {key: {"retail": {"count": radius, "total_area": 1.0, "unit": "m^2"}} if key == "relative_type_of_area" else self.items(radius)
+                for key in (REPORT_CATEGORIES if categories is None else categories)}
+
+
+def cache(max_rows=10000, ttl=60):
+    osm = FakeOsmService()
+    return osm, ReportCache(osm, max_rows, ttl, 5, 3600)
+
+
+def test_smaller_radius_is_answered_from_a_larger_one():
+    osm, reports = cache()
+    assert len(reports.getMalls(50.0, 7.0, 1000)) == 11
+    assert [item["distance"] for item in reports.getMalls(50.0, 7.0, 300)] == [0, 100, 200, 300]
+    assert len(reports.getMalls(50.0, 7.0, 1000, limit=2)) == 2
+    assert osm.calls == [("getMalls", 1000)]
+
+    reports.getMalls(50.0, 7.0, 2000)
+    assert osm.calls[-1] == ("getMalls", 2000)
+
+
+def test_landuse_is_only_reused_for_the_same_radius():
+    osm, reports = cache()
+    reports.getLanduse(50.0, 7.0, 1000)
+    reports.getLanduse(50.0, 7.0, 1000)
+    reports.getLanduse(50.0, 7.0, 500)
+    assert osm.calls == [("getLanduse", 1000), ("getLanduse", 500)]
+
+
+def test_single_categories_are_answered_from_a_full_report():
+    osm, reports = cache()
+    reports.getFullReport(50.0, 7.0, 1000)
+    assert len(reports.getMalls(50.0, 7.0, 500)) == 6
+    assert reports.getFullReport(50.0, 7.0, 500, tags=[])["malls"][0] == {"distance": 0.0}
+    assert reports.getFullReport(50.0, 7.0, 500)["relative_type_of_area"]["retail"]["count"] == 500
+    assert osm.calls == [("getFullReport", 1000, None), ("getLanduse", 500)]
+
+
+def test_selected_categories_are_computed_with_one_query():
+    osm, reports = cache()
+    reports.getMalls(50.0, 7.0, 1000)
+    report = reports.getFullReport(50.0, 7.0, 500, categories=["malls", "parks", "schools"], tags=["website"])
+    assert list(report) == ["malls", "parks", "schools"]
+    assert report["parks"][0]["other_tags"] == {"website": "x"}
+    assert osm.calls == [("getMalls", 1000), ("getFullReport", 500, ("parks", "schools"))]
+
+    # The categories were cached complete on their own.
+    assert reports.getParks(50.0, 7.0, 500, tags=["opening_hours"])[0]["other_tags"] == {"opening_hours": "24/7"}
+    assert len(osm.calls) == 2
+
+
+def test_centers_further_apart_than_max_offset_are_not_shared():
+    osm, reports = cache()
+    reports.getMalls(50.0, 7.0, 1000)
+    reports.getMalls(50.000004, 7.0, 1000)
+    assert len(osm.calls) == 1
+
+    # Rounds to the same center, but is about 1.1 meters away.
+    reports.getMalls(50.0, 7.000016, 1000)
+    reports.getMalls(50.0, 6.999996, 1000)
+    assert len(osm.calls) == 2
+
+
+def test_least_recently_used_entries_are_evicted_by_rows():
+    osm, reports = cache(max_rows=25)
+    reports.getMalls(50.0, 7.0, 1000)
+    reports.getMalls(51.0, 7.0, 1000)
+    reports.getMalls(50.0, 7.0, 1000)
+    reports.getMalls(52.0, 7.0, 1000)
+    assert len(osm.calls) == 3
+
+    reports.getMalls(50.0, 7.0, 1000)
+    reports.getMalls(51.0, 7.0, 1000)
+    assert osm.calls[3:] == [("getMalls", 1000)]
+
+
+def test_results_larger_than_the_cache_are_not_stored():
+    osm, reports = cache(max_rows=5)
+    reports.getMalls(50.0, 7.0, 1000)
+    reports.getMalls(50.0, 7.0, 1000)
+    assert len(osm.calls) == 2
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    osm, reports = cache(ttl=10)
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+    reports.getMalls(50.0, 7.0, 1000)
+    monkeypatch.setattr(time, "monotonic", lambda: now + 5)
+    reports.getMalls(50.0, 7.0, 1000)
+    assert len(osm.calls) == 1
+
+    monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+    reports.getMalls(50.0, 7.0, 1000)
+    assert len(osm.calls) == 2
+
+
+def test_a_new_data_version_clears_the_cache():
+    osm = FakeOsmService()
+    reports = ReportCache(osm, 10000, 60, 5, 0)
+    reports.getMalls(50.0, 7.0, 1000)
+    reports.getMalls(50.0, 7.0, 1000)
+    assert len(osm.calls) == 1
+
+    osm.data_version = 2
+    reports.getMalls(50.0, 7.0, 1000)
+    assert len(osm.calls) == 2
+
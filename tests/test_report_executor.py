@@ -0,0 +1,97 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2.extensions
+import pytest
+
+from osm_service import OsmService, REPORT_CATEGORIES
+from report_executor import ConcurrentReportExecutor, ReportTimeoutError
+
+
+class FakeService:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.deadlines = []
+        self.__deadline = threading.local()
+
+    @contextmanager
+    def deadline(self, at):
+        self.__deadline.at = at
+        try:
+            yield
+        finally:
+            self.__deadline.at = None
+
+    def __getattr__(self, name):
+        def get(lat, lon, radius, limit=None, tags=None):
+            self.deadlines.append(getattr(self.__deadline, "at", None))
+            time.sleep(self.delay)
+            return []
+
+        return get
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, query, parameters=None):
+        self.connection.statements.append(query)
+
+    def fetchall(self):
+        return [(42,)]
+
+
+class FakeConnection:
+    closed = 0
+
+    def __init__(self):
+        self.statements = []
+
+
+class FakePool:
+    def __init__(self):
+        self.connection = FakeConnection()
+
+    def run(self, callback):
+        return callback(FakeCursor(self.connection))
+
+
+def test_report_queries_run_with_the_report_deadline():
+    osm = FakeService()
+    started = time.monotonic()
+    report = ConcurrentReportExecutor(osm, max_workers=2, max_parallelism=2, timeout=5).getFullReport(50.0, 7.0, 500)
+
+    assert set(report) == set(REPORT_CATEGORIES)
+    assert len(osm.deadlines) == len(REPORT_CATEGORIES)
+    assert all(started + 5 <= deadline <= time.monotonic() + 5 for deadline in osm.deadlines)
+
+
+def test_report_times_out():
+    with pytest.raises(ReportTimeoutError):
+        ConcurrentReportExecutor(FakeService(delay=0.2), max_workers=2, max_parallelism=2, timeout=0.1).getFullReport(50.0, 7.0, 500)
+
+
+def test_deadline_limits_and_resets_statement_timeout():
+    osm = OsmService("user", "password", "localhost", 5432, "osm")
+    osm.pool = FakePool()
+
+    with osm.deadline(time.monotonic() + 2):
+        assert osm.getDataVersion() == 42
+    assert osm.getDataVersion() == 42
+
+    statements = osm.pool.connection.statements
+    assert statements[0].startswith("SET statement_timeout = ")
+    assert 1000 < int(statements[0].rsplit(" ", 1)[1]) <= 2000
+    assert statements[1:] == ["SELECT version FROM data_version", "RESET statement_timeout", "SELECT version FROM data_version"]
+
+
+def test_deadline_passed_cancels_before_the_query():
+    osm = OsmService("user", "password", "localhost", 5432, "osm")
+    osm.pool = FakePool()
+
+    with osm.deadline(time.monotonic() - 1):
+        with pytest.raises(psycopg2.extensions.QueryCanceledError):
+            osm.getDataVersion()
+    assert osm.pool.connection.statements == []
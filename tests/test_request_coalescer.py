@@ -0,0 +1,136 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from report_executor import ReportTimeoutError
+from request_coalescer import AsyncRequestCoalescer, RequestCoalescer, request_key
+
+
+class BlockingOsmService:
+    """Blocks every getFullReport call until `release` is set, then returns or raises `outcome`."""
+
+    def __init__(self, outcome):
+        self.outcome = outcome
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def getFullReport(self, lat, lon, radius, categories=None, tags=None):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        if isinstance(self.outcome, Exception):
+            raise self.outcome
+        return self.outcome
+
+    def getDataVersion(self):
+        return 1
+
+
+def run_concurrently(coalescer, osm, waiters, **kwargs):
+    """Calls getFullReport from `waiters` threads while the first call blocks; returns the results and the exceptions."""
+    results, errors = [], []
+
+    def call():
+        try:
+            results.append(coalescer.getFullReport(50.0, 7.0, 1000, **kwargs))
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=call)]
+    threads[0].start()
+    assert osm.started.wait(5)
+    threads += [threading.Thread(target=call) for _ in range(waiters - 1)]
+    for thread in threads[1:]:
+        thread.start()
+    # Gives the other threads time to find the running call and wait for it.
+    time.sleep(0.1)
+    osm.release.set()
+    for thread in threads:
+        thread.join()
+
+    return results, errors
+
+
+def test_request_key_freezes_lists_and_dicts():
+    assert request_key("getByTags", (50.0, 7.0, 100, {"shop": "bakery", "amenity": "cafe"}, ["wheelchair"]), {}) == \
+        request_key("getByTags", (50.0, 7.0, 100, {"amenity": "cafe", "shop": "bakery"}, ["wheelchair"]), {})
+    assert request_key("getFullReport", (50.0, 7.0, 100), {"categories": ["malls"]}) != \
+        request_key("getFullReport", (50.0, 7.0, 100), {"categories": ["parks"]})
+
+
+def test_identical_requests_share_one_call():
+    result = {"malls": []}
+    osm = BlockingOsmService(result)
+    coalescer = RequestCoalescer(osm, 5)
+    results, errors = run_concurrently(coalescer, osm, 4)
+
+    assert errors == []
+    assert len(results) == 4 and all(shared is result for shared in results)
+    assert osm.calls == 1
+
+
+def test_every_waiter_raises_its_own_copy_of_the_error():
+    error = ValueError("database gone")
+    osm = BlockingOsmService(error)
+    coalescer = RequestCoalescer(osm, 5)
+    results, errors = run_concurrently(coalescer, osm, 4)
+
+    assert results == []
+    assert len(errors) == 4
+    assert all(isinstance(raised, ValueError) and str(raised) == "database gone" for raised in errors)
+    assert len({id(raised) for raised in errors}) == 4
+    assert osm.calls == 1
+    assert sum(raised is error for raised in errors) == 1
+    assert all(raised is error or raised.__cause__ is error for raised in errors)
+
+
+def test_waiters_give_up_after_the_timeout():
+    osm = BlockingOsmService({})
+    coalescer = RequestCoalescer(osm, 0.05)
+    leader = threading.Thread(target=coalescer.getFullReport, args=(50.0, 7.0, 1000))
+    leader.start()
+    try:
+        assert osm.started.wait(5)
+        with pytest.raises(ReportTimeoutError):
+            coalescer.getFullReport(50.0, 7.0, 1000)
+    finally:
+        osm.release.set()
+        leader.join()
+
+
+def test_other_methods_are_passed_through():
+    osm = BlockingOsmService({})
+    assert RequestCoalescer(osm, 5).getDataVersion() == 1
+
+
+class AsyncOsmService:
+    def __init__(self, outcome):
+        self.outcome = outcome
+        self.calls = 0
+
+    async def getFullReport(self, lat, lon, radius, categories=None, tags=None):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        if isinstance(self.outcome, Exception):
+            raise self.outcome
+        return self.outcome
+
+
+def test_async_identical_requests_share_one_call_and_copy_errors():
+    async def main(outcome):
+        osm = AsyncOsmService(outcome)
+        coalescer = AsyncRequestCoalescer(osm, 5)
+        results = await asyncio.gather(*[coalescer.getFullReport(50.0, 7.0, 1000) for _ in range(3)], return_exceptions=True)
+        return osm.calls, results
+
+    calls, results = asyncio.run(main({"malls": []}))
+    assert calls == 1 and results == [{"malls": []}] * 3
+
+    error = KeyError("malls")
+    calls, results = asyncio.run(main(error))
+    assert calls == 1
+    assert all(isinstance(raised, KeyError) and raised.__cause__ is error for raised in results)
+    assert len({id(raised) for raised in results}) == 3
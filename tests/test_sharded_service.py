@@ -0,0 +1,27 @@
+from sharded_service import merge_counts, merge_items, merge_landuse
+
+
+def item(name, distance, lat=50.0, lon=7.0):
+    return {"name": name, "distance": distance, "location": {"lat": lat, "lon": lon}}
+
+
+def test_merge_items_orders_by_distance_and_drops_border_duplicates():
+    first = [item("a", 10, 50.1), item("border", 30, 50.3)]
+    second = [item("b", 20, 50.2), item("border", 30, 50.3), item("c", 40, 50.4)]
+
+    assert [merged["name"] for merged in merge_items([first, second])] == ["a", "b", "border", "c"]
+    assert [merged["name"] for merged in merge_items([first, second], limit=2)] == ["a", "b"]
+
+
+def test_merge_items_keeps_same_name_at_other_location():
+    assert len(merge_items([[item("Aldi", 10, 50.1)], [item("Aldi", 20, 50.2)]])) == 2
+
+
+def test_merge_landuse_and_counts_add_up():
+    merged = merge_landuse([{"retail": {"count": 1, "total_area": 10.0, "unit": "m^2"}},
+                            {"retail": {"count": 2, "total_area": None, "unit": "m^2"}, "industrial": {"count": 1, "total_area": 5.0, "unit": "m^2"}}])
+    assert merged == {"retail": {"count": 3, "total_area": 10.0, "unit": "m^2"}, "industrial": {"count": 1, "total_area": 5.0, "unit": "m^2"}}
+
+    counts = merge_counts([{"malls": 1, "relative_type_of_area": {"retail": 1}}, {"malls": 2, "relative_type_of_area": {"retail": 2, "commercial": 1}}],
+                          ["malls", "relative_type_of_area"])
+    assert counts == {"malls": 3, "relative_type_of_area": {"retail": 3, "commercial": 1}}
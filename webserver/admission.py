@@ -0,0 +1,79 @@
+import math
+import threading
+from contextlib import contextmanager
+
+from metrics import ADMISSION_REJECTED
+from osm_service import REPORT_CATEGORIES
+
+# Results per square kilometer and category assumed when the densities are not calibrated from
+# the database, roughly those of the more common categories in a German city.
+DEFAULT_DENSITY = 10.0
+
+
+class AdmissionRejectedError(Exception):
+    def __init__(self, status, retry_after):
+        super().__init__("request rejected with %d, retry after %d seconds" % (status, retry_after))
+        self.status = status
+        self.retry_after = retry_after
+
+
+def estimate_cost(radius, categories, densities):
+    """The expected number of result rows of a report on `categories` within `radius` meters."""
+    area = math.pi * (radius / 1000) ** 2
+    return area * sum(densities.get(category, DEFAULT_DENSITY) for category in categories)
+
+
+class AdmissionController:
+    """Keeps expensive requests from crowding out cheap ones.
+
+    Requests whose estimated cost exceeds `heavy_cost` result rows run on at
+    most `heavy_concurrency` threads of the process. At most `heavy_queue_size`
+    of them wait for a slot; further ones are rejected with 429 right away, and
+    waiting ones are rejected with 503 after `queue_timeout` seconds. Cheap
+    requests are always admitted. `densities` maps report categories to their
+    results per square kilometer and can be calibrated from the database with
+    OsmService.getCategoryDensities().
+    """
+
+    def __init__(self, heavy_cost, heavy_concurrency, heavy_queue_size, queue_timeout, retry_after, densities=None):
+        self.heavy_cost = heavy_cost
+        self.heavy_queue_size = heavy_queue_size
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.densities = densities or {}
+
+        self.__lock = threading.Lock()
+        self.__slots = threading.BoundedSemaphore(heavy_concurrency)
+        self.__waiting = 0
+
+    def cost(self, radius, categories=None):
+        return estimate_cost(radius, REPORT_CATEGORIES if categories is None else categories, self.densities)
+
+    @contextmanager
+    def admit(self, cost):
+        if cost <= self.heavy_cost:
+            yield
+            return
+
+        # Only requests that find no free slot count towards the queue.
+        if not self.__slots.acquire(blocking=False):
+            with self.__lock:
+                if self.__waiting >= self.heavy_queue_size:
+                    ADMISSION_REJECTED.inc(status="429")
+                    raise AdmissionRejectedError(429, self.retry_after)
+                self.__waiting += 1
+
+            try:
+                acquired = self.__slots.acquire(timeout=self.queue_timeout)
+            finally:
+                with self.__lock:
+                    self.__waiting -= 1
+
+            if not acquired:
+                ADMISSION_REJECTED.inc(status="503")
+                raise AdmissionRejectedError(503, self.retry_after)
+
+        try:
+            yield
+        finally:
+            self.__slots.release()
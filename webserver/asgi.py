@@ -0,0 +1,246 @@
+import logging
+import os
+from contextlib import asynccontextmanager
+
+import flask_restplus
+from flask_restplus.apidoc import ui_for
+from psycopg.errors import QueryCanceled
+from starlette.applications import Starlette
+from starlette.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response
+from starlette.routing import Mount, Route
+from starlette.staticfiles import StaticFiles
+
+from async_osm_service import AsyncOsmService
+from metrics import render as renderMetrics
+from osm_service import NEAREST_CATEGORIES, REPORT_CATEGORIES
+from report_executor import ReportTimeoutError
+from request_coalescer import AsyncRequestCoalescer
+from routes import api, app as flask_app, categoryList, selectCategories, tagList
+
+logger = logging.getLogger(__name__)
+
+# The Flask app is only used for its settings and the Swagger documentation of its routes. Admission control,
+# the batch endpoint and streaming as NDJSON are only served by webserver.py.
+config = flask_app.config
+
+osm = AsyncOsmService(config["DATABASE_USER"], config["DATABASE_PASSWORD"], config["DATABASE_HOST"], config["DATABASE_PORT"], config["DATABASE_NAME"],
+                      pool_min_size=config.get("DATABASE_POOL_MIN_SIZE", 1),
+                      pool_max_size=config.get("DATABASE_POOL_MAX_SIZE", 10),
+                      pool_timeout=config.get("DATABASE_POOL_TIMEOUT", 30),
+                      timeout=config.get("FULL_REPORT_TIMEOUT", 10),
+                      landuse_clipped=config.get("LANDUSE_CLIPPED", False),
+                      statement_timeout=config.get("STATEMENT_TIMEOUT"))
+
+if config.get("COALESCE_ENABLED", True):
+    osm = AsyncRequestCoalescer(osm, config.get("COALESCE_TIMEOUT", 30))
+
+CATEGORY_ROUTES = {
+    "malls": "getMalls",
+    "chemists": "getChemists",
+    "convenience": "getConvenience",
+    "supermarkets": "getSupermarket",
+    "landuse": "getLanduse",
+    "parking": "getParking",
+    "parks": "getParks",
+    "schools": "getSchools",
+    "kindergarten": "getKindergarten",
+    "hospitals": "getHospitals",
+    "doctors": "getDoctors",
+    "railway": "getRailwayStations",
+    "tram": "getTramStations",
+    "bus": "getBusStations",
+}
+
+
+RESULT_KEYS = {method: key for key, method in REPORT_CATEGORIES.items()}
+
+
+def center(request):
+    return request.path_params["latitude"], request.path_params["longitude"], request.path_params["radius"]
+
+
+def radiusTooLarge(request):
+    return request.path_params["radius"] > config.get("MAX_RADIUS", 20000)
+
+
+async def fullReport(request):
+    latitude, longitude, radius = center(request)
+    if radiusTooLarge(request):
+        return JSONResponse("", 400)
+
+    summary = request.query_params.get("summary")
+    if summary not in (None, "counts"):
+        return JSONResponse("", 400)
+
+    try:
+        include = categoryList(request.query_params["include"]) if "include" in request.query_params else None
+        exclude = categoryList(request.query_params["exclude"]) if "exclude" in request.query_params else None
+        categories = selectCategories(include, exclude)
+    except ValueError:
+        return JSONResponse("", 400)
+
+    tags = tagList(request.query_params["tags"]) if "tags" in request.query_params else None
+
+    try:
+        if summary == "counts":
+            result = await osm.getCounts(latitude, longitude, radius, list(REPORT_CATEGORIES) if categories is None else categories)
+        else:
+            result = await osm.getFullReport(latitude, longitude, radius, categories, tags)
+
+        return JSONResponse({
+            "input": {
+                "center": {
+                    "lat": latitude,
+                    "lon": longitude
+                },
+                "radius": radius
+            },
+            "result": result
+        })
+    except (ReportTimeoutError, QueryCanceled):
+        logger.warning("%s timed out", request.url.path)
+        return JSONResponse("", 504)
+    except Exception:
+        logger.exception("%s failed", request.url.path)
+        return JSONResponse("", 500)
+
+
+def positive(value):
+    value = int(value)
+    if value < 1:
+        raise ValueError("%s is not a positive integer" % value)
+
+    return value
+
+
+def categoryReport(method):
+    async def report(request):
+        if radiusTooLarge(request):
+            return JSONResponse("", 400)
+
+        arguments = {}
+        try:
+            if "limit" in request.query_params and method != "getLanduse":
+                arguments["limit"] = positive(request.query_params["limit"])
+        except ValueError:
+            return JSONResponse("", 400)
+
+        # The landuse report already consists of counts.
+        summary = request.query_params.get("summary") if method != "getLanduse" else None
+        if summary not in (None, "counts"):
+            return JSONResponse("", 400)
+
+        try:
+            if summary == "counts":
+                return JSONResponse(await osm.getCounts(*center(request), [RESULT_KEYS[method]]))
+
+            return JSONResponse(await getattr(osm, method)(*center(request), **arguments))
+        except (ReportTimeoutError, QueryCanceled):
+            logger.warning("%s timed out", request.url.path)
+            return JSONResponse("", 504)
+        except Exception:
+            logger.exception("%s failed", request.url.path)
+            return JSONResponse("", 500)
+
+    return report
+
+
+async def nearestReport(request):
+    category = request.path_params["category"]
+    if category not in NEAREST_CATEGORIES:
+        return JSONResponse("", 404)
+
+    try:
+        k = positive(request.query_params.get("k", 1))
+        max_radius = float(request.query_params["max_radius"]) if "max_radius" in request.query_params else None
+    except ValueError:
+        return JSONResponse("", 400)
+
+    if k > config.get("NEAREST_MAX_K", 100):
+        return JSONResponse("", 400)
+
+    try:
+        return JSONResponse(await osm.getNearest(category, request.path_params["latitude"], request.path_params["longitude"], k, max_radius))
+    except (ReportTimeoutError, QueryCanceled):
+        logger.warning("%s timed out", request.url.path)
+        return JSONResponse("", 504)
+    except Exception:
+        logger.exception("%s failed", request.url.path)
+        return JSONResponse("", 500)
+
+
+async def tile(request):
+    z, x, y = request.path_params["z"], request.path_params["x"], request.path_params["y"]
+    if z > config.get("TILE_MAX_ZOOM", 20) or x >= 2 ** z or y >= 2 ** z:
+        return Response(status_code=404)
+
+    try:
+        return Response(await osm.getTile(z, x, y), media_type="application/vnd.mapbox-vector-tile",
+                        headers={"Cache-Control": "public, max-age=%d" % config.get("TILE_MAX_AGE", 3600)})
+    except (ReportTimeoutError, QueryCanceled):
+        logger.warning("%s timed out", request.url.path)
+        return Response(status_code=504)
+    except Exception:
+        logger.exception("%s failed", request.url.path)
+        return Response(status_code=500)
+
+
+async def tagReport(request):
+    if radiusTooLarge(request):
+        return JSONResponse("", 400)
+
+    tags = {key: value for key, value in request.query_params.items() if value and key != "stream"}
+    keys = [key for key, value in request.query_params.items() if not value and key != "stream"]
+    if not tags and not keys:
+        return JSONResponse("", 400)
+
+    try:
+        return JSONResponse(await osm.getByTags(*center(request), tags, keys))
+    except (ReportTimeoutError, QueryCanceled):
+        logger.warning("%s timed out", request.url.path)
+        return JSONResponse("", 504)
+    except Exception:
+        logger.exception("%s failed", request.url.path)
+        return JSONResponse("", 500)
+
+
+def documentation(request):
+    # flask_restplus builds absolute URLs, so the documentation is rendered for the host it is requested from.
+    with flask_app.test_request_context(base_url=str(request.base_url)):
+        return api.__schema__ if request.url.path == "/swagger.json" else ui_for(api)
+
+
+async def swaggerJson(request):
+    return JSONResponse(documentation(request))
+
+
+async def swaggerUi(request):
+    return HTMLResponse(documentation(request))
+
+
+async def metrics(request):
+    return PlainTextResponse(renderMetrics(), media_type="text/plain; version=0.0.4")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await osm.open()
+    try:
+        yield
+    finally:
+        await osm.close()
+
+
+PREFIX = "/relative/{latitude:float},{longitude:float}/{radius:int}"
+
+app = Starlette(routes=[
+    Route("/", swaggerUi),
+    Route("/swagger.json", swaggerJson),
+    Route("/metrics", metrics),
+    Mount("/swaggerui", StaticFiles(directory=os.path.join(os.path.dirname(flask_restplus.__file__), "static"))),
+    Route(PREFIX, fullReport),
+    Route(PREFIX + "/tags", tagReport),
+    Route("/nearest/{latitude:float},{longitude:float}/{category}", nearestReport),
+    Route("/tiles/{z:int}/{x:int}/{y:int}.mvt", tile),
+] + [Route(PREFIX + "/" + route, categoryReport(method)) for route, method in CATEGORY_ROUTES.items()],
+    lifespan=lifespan)
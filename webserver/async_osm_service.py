@@ -0,0 +1,169 @@
+import asyncio
+import time
+
+from psycopg.conninfo import make_conninfo
+from psycopg.types.json import Jsonb, set_json_loads
+from psycopg_pool import AsyncConnectionPool
+
+from osm_service import LANDUSE_CLIPPED_QUERY, LANDUSE_QUERY, NEAREST_PARKS_QUERY, NEAREST_POI_QUERIES, PARKS_QUERY, POI_CATEGORIES, POI_QUERIES, REPORT_CATEGORIES, TAGS_QUERY, \
+    TILE_QUERY, counts_from_rows, counts_query, landuse_from_rows, park_from_row, query_parameters, response_from_row, tile_parameters
+from metrics import QUERY_DECODE_DURATION, QUERY_DURATION, QUERY_ROWS
+from report_executor import ReportTimeoutError
+
+try:
+    import orjson
+    set_json_loads(orjson.loads)
+except ImportError:
+    pass
+
+
+class AsyncOsmService:
+    """asyncio variant of OsmService on psycopg 3 and its async connection pool.
+
+    Runs the same queries as OsmService, which are prepared on every
+    connection by psycopg. A full report runs the query of every category
+    concurrently, limited only by the `pool_max_size` connections of the pool,
+    and has to finish within `timeout` seconds. The pool has to be opened with
+    `open()` inside the running event loop before the first query.
+    """
+
+    def __init__(self, user, password, host, port, database, pool_min_size=1, pool_max_size=10, pool_timeout=30, timeout=10, landuse_clipped=False,
+                 statement_timeout=None):
+        self.user = user
+        self.password = password
+        self.host = host
+        self.port = port
+        self.database = database
+        self.timeout = timeout
+        self.landuse_clipped = landuse_clipped
+        self.statement_timeout = statement_timeout
+
+        options = "-c default_transaction_read_only=on"
+        if statement_timeout is not None:
+            options += " -c statement_timeout=%d" % (statement_timeout * 1000)
+        self.pool = AsyncConnectionPool(make_conninfo(user=self.user, password=self.password, host=self.host, port=self.port, dbname=self.database),
+                                        min_size=pool_min_size, max_size=pool_max_size, timeout=pool_timeout, open=False,
+                                        check=AsyncConnectionPool.check_connection,
+                                        kwargs={"autocommit": True, "options": options})
+
+    async def open(self):
+        await self.pool.open()
+
+    async def close(self):
+        await self.pool.close()
+
+    async def __executeQuery(self, name, query, parameters, prepare=True):
+        async with self.pool.connection() as connection:
+            started = time.perf_counter()
+            cursor = await connection.execute(query, parameters, prepare=prepare)
+            executed = time.perf_counter()
+
+            rows = await cursor.fetchall()
+            QUERY_DURATION.observe(executed - started, statement=name)
+            QUERY_DECODE_DURATION.observe(time.perf_counter() - executed, statement=name)
+            QUERY_ROWS.observe(len(rows), statement=name)
+            return rows
+
+
+    async def getDataVersion(self):
+        rows = await self.__executeQuery("data_version", "SELECT version FROM data_version", None, prepare=False)
+        return rows[0][0] if rows else None
+
+    async def __getPois(self, category, lat, lon, radius, limit=None, tags=None):
+        rows = await self.__executeQuery("poi_category", POI_QUERIES[category], query_parameters(lat, lon, radius, limit=limit, selected_tags=tags))
+        return [response_from_row(*row) for row in rows]
+
+    async def getLanduse(self, lat, lon, radius):
+        if self.landuse_clipped:
+            rows = await self.__executeQuery("landuse_clipped", LANDUSE_CLIPPED_QUERY, query_parameters(lat, lon, radius))
+        else:
+            rows = await self.__executeQuery("landuse", LANDUSE_QUERY, query_parameters(lat, lon, radius))
+        return landuse_from_rows(rows)
+
+    async def getParking(self, lat, lon, radius, limit=None, tags=None):
+        return await self.__getPois("parking", lat, lon, radius, limit, tags)
+
+    async def getParks(self, lat, lon, radius, limit=None, tags=None):
+        rows = await self.__executeQuery("parks", PARKS_QUERY, query_parameters(lat, lon, radius, limit=limit, selected_tags=tags))
+        return [park_from_row(*row) for row in rows]
+
+
+    async def getMalls(self, lat, lon, radius, limit=None, tags=None):
+        return await self.__getPois("malls", lat, lon, radius, limit, tags)
+
+    async def getChemists(self, lat, lon, radius, limit=None, tags=None):
+        return await self.__getPois("chemists", lat, lon, radius, limit, tags)
+
+    async def getConvenience(self, lat, lon, radius, limit=None, tags=None):
+        return await self.__getPois("convenience", lat, lon, radius, limit, tags)
+
+    async def getSupermarket(self, lat, lon, radius, limit=None, tags=None):
+        return await self.__getPois("supermarkets", lat, lon, radius, limit, tags)
+
+
+    async def getSchools(self, lat, lon, radius, limit=None, tags=None):
+        return await self.__getPois("schools", lat, lon, radius, limit, tags)
+
+    async def getKindergarten(self, lat, lon, radius, limit=None, tags=None):
+        return await self.__getPois("kindergartens", lat, lon, radius, limit, tags)
+
+    async def getHospitals(self, lat, lon, radius, limit=None, tags=None):
+        return await self.__getPois("hospitals", lat, lon, radius, limit, tags)
+
+    async def getDoctors(self, lat, lon, radius, limit=None, tags=None):
+        return await self.__getPois("doctors", lat, lon, radius, limit, tags)
+
+
+    async def getRailwayStations(self, lat, lon, radius, limit=None, tags=None):
+        return await self.__getPois("railway_stations", lat, lon, radius, limit, tags)
+
+    async def getTramStations(self, lat, lon, radius, limit=None, tags=None):
+        return await self.__getPois("tram_stations", lat, lon, radius, limit, tags)
+
+    async def getBusStations(self, lat, lon, radius, limit=None, tags=None):
+        return await self.__getPois("bus_stations", lat, lon, radius, limit, tags)
+
+
+    async def getTile(self, z, x, y):
+        parameters = tile_parameters(z, x, y)
+        if parameters is None:
+            return b""
+
+        rows = await self.__executeQuery("tile", TILE_QUERY, parameters)
+        return bytes(rows[0][0]) if rows and rows[0][0] is not None else b""
+
+    async def getCounts(self, lat, lon, radius, categories):
+        rows = []
+        if "parks" in categories or any(category in POI_CATEGORIES for category in categories):
+            rows = await self.__executeQuery(*counts_query(lat, lon, radius, categories))
+
+        result = counts_from_rows(categories, rows)
+        if "relative_type_of_area" in categories:
+            result["relative_type_of_area"] = {landuse: item["count"] for landuse, item in (await self.getLanduse(lat, lon, radius)).items()}
+
+        return result
+
+    async def getByTags(self, lat, lon, radius, tags, keys):
+        rows = await self.__executeQuery("tags", TAGS_QUERY, query_parameters(lat, lon, radius, tags=Jsonb(tags), keys=list(keys)), prepare=False)
+        return [response_from_row(*row) for row in rows]
+
+    async def getNearest(self, category, lat, lon, k, max_radius=None):
+        parameters = {"lat": lat, "lon": lon, "k": k, "candidates": 2 * k + 10, "max_radius": max_radius}
+
+        if category == "parks":
+            rows = await self.__executeQuery("nearest_parks", NEAREST_PARKS_QUERY, parameters)
+            return [park_from_row(*row) for row in rows]
+
+        rows = await self.__executeQuery("nearest_poi", NEAREST_POI_QUERIES[category], parameters)
+        return [response_from_row(*row) for row in rows]
+
+    async def getFullReport(self, lat, lon, radius, categories=None, tags=None):
+        categories = list(REPORT_CATEGORIES) if categories is None else categories
+        queries = (self.getLanduse(lat, lon, radius) if key == "relative_type_of_area" else getattr(self, REPORT_CATEGORIES[key])(lat, lon, radius, tags=tags)
+                   for key in categories)
+        try:
+            results = await asyncio.wait_for(asyncio.gather(*queries), self.timeout)
+        except asyncio.TimeoutError:
+            raise ReportTimeoutError("full report did not finish within %s seconds" % self.timeout)
+
+        return dict(zip(categories, results))
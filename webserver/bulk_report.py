@@ -0,0 +1,196 @@
+import argparse
+import csv
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import time
+
+from geohash_grid import encode
+from osm_service import OsmService, REPORT_CATEGORIES
+
+logger = logging.getLogger("bulk_report")
+
+# Locations in the same cell of this many geohash characters (about 153 x 153 m) are
+# neighbours in the sort order, so a chunk reads the same index and table pages.
+SORT_RESOLUTION = 7
+
+# Set in every worker process by initWorker.
+worker_osm = None
+worker_batch_size = None
+
+
+def read_csv(path, id_column, lat_column, lon_column, radius_column):
+    with open(path, newline="") as file:
+        for line, row in enumerate(csv.DictReader(file), start=1):
+            yield (row[id_column] if id_column else str(line), float(row[lat_column]), float(row[lon_column]),
+                   int(row[radius_column]) if radius_column else None)
+
+
+def read_parquet(path, id_column, lat_column, lon_column, radius_column):
+    try:
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("reading Parquet files needs the pyarrow package")
+
+    columns = [column for column in (id_column, lat_column, lon_column, radius_column) if column]
+    line = 0
+    for batch in pyarrow.parquet.ParquetFile(path).iter_batches(columns=columns):
+        values = batch.to_pydict()
+        for index in range(batch.num_rows):
+            line += 1
+            yield (str(values[id_column][index]) if id_column else str(line), float(values[lat_column][index]), float(values[lon_column][index]),
+                   int(values[radius_column][index]) if radius_column else None)
+
+
+def spatial_chunks(locations, chunk_size):
+    """Splits the locations into chunks of neighbouring locations, ordered along the geohash curve."""
+    ordered = sorted(locations, key=lambda location: encode(location[1], location[2], SORT_RESOLUTION))
+    return [ordered[start:start + chunk_size] for start in range(0, len(ordered), chunk_size)]
+
+
+class JsonLinesOutput:
+    """Appends one {"id", "lat", "lon", "radius", "report"} object per line."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def completed(self):
+        if not os.path.exists(self.path):
+            return set()
+
+        # A crash can leave a partially written last line, which is cut off before appending.
+        ids = set()
+        with open(self.path, "rb+") as file:
+            end = 0
+            for line in file:
+                if not line.endswith(b"\n"):
+                    break
+                ids.add(json.loads(line)["id"])
+                end += len(line)
+            file.truncate(end)
+
+        return ids
+
+    def open(self):
+        self.file = open(self.path, "a")
+
+    def write(self, results):
+        for id, lat, lon, radius, report in results:
+            self.file.write(json.dumps({"id": id, "lat": lat, "lon": lon, "radius": radius, "report": report}) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+
+class SqliteOutput:
+    """Stores the reports as JSON in the table `reports`, keyed by the id of the location."""
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = None
+
+    def completed(self):
+        self.open()
+        return {row[0] for row in self.connection.execute("SELECT id FROM reports")}
+
+    def open(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path)
+            self.connection.execute("CREATE TABLE IF NOT EXISTS reports (id TEXT PRIMARY KEY, lat REAL, lon REAL, radius INTEGER, report TEXT)")
+
+    def write(self, results):
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO reports (id, lat, lon, radius, report) VALUES (?, ?, ?, ?, ?)",
+                                        [(id, lat, lon, radius, json.dumps(report)) for id, lat, lon, radius, report in results])
+
+    def close(self):
+        self.connection.close()
+
+
+def initWorker(config, batch_size):
+    global worker_osm, worker_batch_size
+    # One connection per process; the batch queries of a chunk run one after the other.
+    worker_osm = OsmService(config["DATABASE_USER"], config["DATABASE_PASSWORD"], config["DATABASE_HOST"], config["DATABASE_PORT"], config["DATABASE_NAME"],
+                            pool_min_size=1, pool_max_size=1, landuse_clipped=config.get("LANDUSE_CLIPPED", False))
+    worker_batch_size = batch_size
+
+
+def reportChunk(arguments):
+    chunk, categories = arguments
+    try:
+        reports = worker_osm.getBatchReports([(lat, lon, radius, categories) for _, lat, lon, radius in chunk], worker_batch_size)
+    except Exception as error:
+        return chunk, None, "%s: %s" % (type(error).__name__, error)
+
+    return chunk, [(id, lat, lon, radius, report) for (id, lat, lon, radius), report in zip(chunk, reports)], None
+
+
+def run(config, locations, output, categories, radius, workers=None, chunk_size=500, batch_size=100):
+    """Writes the reports of all locations not yet in the output and returns the number of locations that failed.
+
+    A location without a radius of its own uses `radius`. Chunks that fail are
+    logged and skipped; running again with the same output retries them.
+    """
+    done = output.completed()
+    pending = [(id, lat, lon, radius if location_radius is None else location_radius) for id, lat, lon, location_radius in locations if id not in done]
+    logger.info("%d locations already done, %d pending", len(done), len(pending))
+
+    output.open()
+    written, failed = 0, 0
+    started = time.monotonic()
+    try:
+        with multiprocessing.Pool(workers, initializer=initWorker, initargs=(dict(config), batch_size)) as pool:
+            chunks = ((chunk, categories) for chunk in spatial_chunks(pending, chunk_size))
+            for chunk, results, error in pool.imap_unordered(reportChunk, chunks):
+                if error is not None:
+                    failed += len(chunk)
+                    logger.error("chunk starting with %s failed: %s", chunk[0][0], error)
+                    continue
+
+                output.write(results)
+                written += len(results)
+                logger.info("%d/%d locations, %.1f per second", written, len(pending), written / (time.monotonic() - started))
+    finally:
+        output.close()
+
+    return failed
+
+
+if __name__ == "__main__":
+    from flask import Config
+
+    parser = argparse.ArgumentParser(description="Writes the full reports of many locations from a CSV or Parquet file to JSON lines or SQLite, "
+                                                 "resuming where a previous run with the same output stopped.")
+    parser.add_argument("settings", help="settings file with the DATABASE_* connection parameters")
+    parser.add_argument("input", help="CSV or Parquet (.parquet) file with one location per row")
+    parser.add_argument("output", help="JSON lines file, or SQLite database if it ends with .sqlite or .db")
+    parser.add_argument("--id-column", help="column identifying a location, the row number if not given")
+    parser.add_argument("--lat-column", default="lat")
+    parser.add_argument("--lon-column", default="lon")
+    parser.add_argument("--radius-column", help="column with the radius of each location in meters")
+    parser.add_argument("--radius", type=int, default=1000, help="radius in meters of locations without a radius column")
+    parser.add_argument("--categories", nargs="+", choices=list(REPORT_CATEGORIES), default=list(REPORT_CATEGORIES))
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes, each with one database connection")
+    parser.add_argument("--chunk-size", type=int, default=500, help="neighbouring locations handed to a worker at once")
+    parser.add_argument("--batch-size", type=int, default=100, help="locations per batch query")
+    arguments = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    config = Config(".")
+    config.from_pyfile(os.path.abspath(arguments.settings))
+
+    read = read_parquet if arguments.input.endswith(".parquet") else read_csv
+    locations = list(read(arguments.input, arguments.id_column, arguments.lat_column, arguments.lon_column, arguments.radius_column))
+
+    output = (SqliteOutput if arguments.output.endswith((".sqlite", ".db")) else JsonLinesOutput)(arguments.output)
+
+    failed = run(config, locations, output, arguments.categories, arguments.radius, arguments.workers, arguments.chunk_size, arguments.batch_size)
+    if failed:
+        logger.error("%d locations failed, run again to retry them", failed)
+        raise SystemExit(1)
@@ -0,0 +1,191 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+
+from metrics import POOL_WAIT_DURATION
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+class Connection(psycopg2.extensions.connection):
+    """psycopg2 connection that remembers the statements prepared on it and when it was last returned intact."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+        self.lastUsed = None
+
+
+class ConnectionPool:
+    """Thread-safe pool of read-only PostgreSQL connections.
+
+    The underlying psycopg2 pool is created lazily on first checkout in every
+    process, so forking web servers (gunicorn) never share a socket between
+    workers. Checkouts block up to `timeout` seconds when all `max_size`
+    connections are in use. Connections that have been idle for longer than
+    `health_check_interval` seconds are pinged before they are handed out and
+    replaced transparently when the server went away.
+    """
+
+    def __init__(self, min_size, max_size, timeout, health_check_interval, **connection_parameters):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.connection_parameters = dict(connection_parameters, connection_factory=Connection)
+
+        self.__lock = threading.Lock()
+        self.__pool = None
+        self.__pid = None
+        self.__slots = None
+        self.__invalidatedAt = 0.0
+
+    def __getPool(self):
+        pid = os.getpid()
+        if self.__pool is None or self.__pid != pid:
+            with self.__lock:
+                if self.__pool is None or self.__pid != pid:
+                    # Connections inherited from a parent process are dropped, never closed,
+                    # since closing them would terminate the parent's sessions.
+                    self.__pool = psycopg2.pool.ThreadedConnectionPool(self.min_size, self.max_size, **self.connection_parameters)
+                    self.__pid = pid
+                    self.__slots = threading.BoundedSemaphore(self.max_size)
+                    self.__invalidatedAt = time.monotonic()
+
+        return self.__pool
+
+    def __isHealthy(self, connection):
+        if connection.closed:
+            return False
+
+        try:
+            # New connections and those of a stream are switched back before the ping, which
+            # would otherwise open a transaction that set_session refuses to run in.
+            if connection.autocommit is False:
+                connection.set_session(readonly=True, autocommit=True)
+
+            # Connections not used since a connection was lost are pinged as well.
+            lastUsed = connection.lastUsed
+            if lastUsed is not None and lastUsed > self.__invalidatedAt and time.monotonic() - lastUsed < self.health_check_interval:
+                return True
+
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            return True
+        except psycopg2.Error:
+            return False
+
+    def __checkout(self):
+        pool = self.__getPool()
+        slots = self.__slots
+
+        started = time.perf_counter()
+        acquired = slots.acquire(timeout=self.timeout)
+        POOL_WAIT_DURATION.observe(time.perf_counter() - started)
+        if not acquired:
+            raise PoolTimeoutError("no database connection available within %s seconds" % self.timeout)
+
+        connection = None
+        try:
+            # Every replacement is checked as well. Once all idle connections are closed,
+            # the pool opens a new one, which fails its check only if the server is down.
+            connection = pool.getconn()
+            attempts = 0
+            while not self.__isHealthy(connection):
+                pool.putconn(connection, close=True)
+                connection = None
+                attempts += 1
+                if attempts > self.max_size:
+                    raise psycopg2.OperationalError("no healthy database connection available")
+                connection = pool.getconn()
+
+            return pool, slots, connection
+        except:
+            if connection is not None:
+                pool.putconn(connection, close=True)
+            slots.release()
+            raise
+
+    def __return(self, pool, slots, connection, broken):
+        try:
+            if not broken and not connection.closed and connection.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+
+            broken = broken or bool(connection.closed)
+            if not broken:
+                connection.lastUsed = time.monotonic()
+
+            pool.putconn(connection, close=broken)
+        except psycopg2.Error:
+            pool.putconn(connection, close=True)
+        finally:
+            slots.release()
+
+    @contextmanager
+    def connection(self):
+        pool, slots, connection = self.__checkout()
+
+        broken = False
+        try:
+            yield connection
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = bool(connection.closed)
+            if broken:
+                # A lost connection usually means the server restarted, so every idle
+                # connection is pinged again before its next use.
+                self.__invalidatedAt = time.monotonic()
+            raise
+        finally:
+            self.__return(pool, slots, connection, broken)
+
+    @contextmanager
+    def cursor(self, name=None, itersize=None):
+        """Checks out a connection and yields a cursor on it.
+
+        Passing a `name` creates a server-side cursor that fetches `itersize`
+        rows per round trip while it is iterated. It lives in a transaction
+        that is rolled back when the connection is returned.
+        """
+        with self.connection() as connection:
+            if name is not None:
+                connection.autocommit = False
+
+            cursor = connection.cursor(name)
+            if itersize is not None:
+                cursor.itersize = itersize
+
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+
+    def run(self, callback):
+        """Runs `callback(cursor)` on a pooled connection.
+
+        The callback is retried once on a fresh connection when the first one
+        turns out to be disconnected, e.g. after a database server restart.
+        """
+        try:
+            with self.cursor() as cursor:
+                return callback(cursor)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            if isinstance(e, psycopg2.extensions.QueryCanceledError):
+                raise
+
+        with self.cursor() as cursor:
+            return callback(cursor)
+
+    def closeAll(self):
+        with self.__lock:
+            if self.__pool is not None and self.__pid == os.getpid():
+                self.__pool.closeall()
+
+            self.__pool = None
+            self.__pid = None
@@ -0,0 +1,118 @@
+import math
+
+# Radius of the sphere PostGIS measures on when ST_DWithin is called with use_spheroid = false.
+EARTH_RADIUS = 6371008.8
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# Geohash lengths aggregated in the poi_grid table by poi_grid.sql. At the equator a cell
+# is about 39 x 20 km at 4 characters, 4.9 x 4.9 km at 5, 1.2 x 0.6 km at 6 and 153 x 153 m at 7.
+GRID_RESOLUTIONS = (4, 5, 6, 7)
+
+# The finest resolution that covers a circle with at most this many cells is used.
+MAX_CELLS = 1024
+
+# Cells closer than this many meters to the edge of the circle are checked exactly,
+# which keeps rounding errors of the cell classification from changing a count.
+MARGIN = 1.0
+
+
+def encode(lat, lon, resolution):
+    """The geohash of a point with `resolution` characters."""
+    south, north, west, east = -90.0, 90.0, -180.0, 180.0
+    result, value, bits, even = [], 0, 0, True
+    while len(result) < resolution:
+        if even:
+            middle = (west + east) / 2
+            if lon >= middle:
+                value, west = value * 2 + 1, middle
+            else:
+                value, east = value * 2, middle
+        else:
+            middle = (south + north) / 2
+            if lat >= middle:
+                value, south = value * 2 + 1, middle
+            else:
+                value, north = value * 2, middle
+
+        even = not even
+        bits += 1
+        if bits == 5:
+            result.append(BASE32[value])
+            value, bits = 0, 0
+
+    return "".join(result)
+
+
+def cell_size(resolution):
+    """Width and height in degrees of the cells with `resolution` characters."""
+    lon_bits = (5 * resolution + 1) // 2
+    lat_bits = 5 * resolution // 2
+    return 360 / 2 ** lon_bits, 180 / 2 ** lat_bits
+
+
+def distance(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(min(math.sqrt(a), 1))
+
+
+def cell_distances(lat, lon, west, south, east, north):
+    """The smallest and the largest distance between the point and the cell."""
+    if west <= lon <= east:
+        nearest_lon, nearest_lat = lon, lat
+    else:
+        nearest_lon = west if (west - lon) % 360 < (lon - east) % 360 else east
+        # The closest point on a meridian lies further towards the pole than the point itself.
+        delta = math.radians(nearest_lon - lon)
+        nearest_lat = math.degrees(math.atan2(math.tan(math.radians(lat)), max(math.cos(delta), 1e-12)))
+
+    nearest = distance(lat, lon, min(max(nearest_lat, south), north), nearest_lon)
+    farthest = max(distance(lat, lon, corner_lat, corner_lon) for corner_lat in (south, north) for corner_lon in (west, east))
+    return nearest, farthest
+
+
+def cell_range(start, end, size):
+    """Indices of the cells of `size` degrees overlapping the interval from start to end."""
+    return range(math.floor(start / size), math.floor(end / size) + 1)
+
+
+def cover(lat, lon, radius, west, south, east, north):
+    """Splits the grid cells overlapping the bounding box of a circle into cells completely inside it and cells on its border.
+
+    Returns the resolution, the geohashes of the interior cells and the
+    geohashes of the border cells with their west, south, east and north
+    bounds, or None if even the coarsest resolution needs too many cells.
+    """
+    south, north = max(south, -90.0), min(north, 90.0)
+    for resolution in reversed(GRID_RESOLUTIONS):
+        width, height = cell_size(resolution)
+        columns, rows = round(360 / width), round(180 / height)
+        xs = cell_range(west + 180, east + 180, width)
+        ys = cell_range(south + 90, north + 90, height)
+        # Column indices wrap around at the antimeridian, rows end at the poles.
+        xs = xs if len(xs) <= columns else range(columns)
+        ys = range(max(ys.start, 0), min(ys.stop, rows))
+        if len(xs) * len(ys) <= MAX_CELLS:
+            break
+    else:
+        return None
+
+    interior, border = [], []
+    for x in xs:
+        cell_west = (x % columns) * width - 180
+        for y in ys:
+            cell_south = y * height - 90
+            bounds = (cell_west, cell_south, cell_west + width, cell_south + height)
+
+            nearest, farthest = cell_distances(lat, lon, *bounds)
+            if nearest > radius + MARGIN:
+                continue
+
+            geohash = encode(cell_south + height / 2, cell_west + width / 2, resolution)
+            if farthest < radius - MARGIN:
+                interior.append(geohash)
+            else:
+                border.append((geohash,) + bounds)
+
+    return resolution, interior, border
@@ -0,0 +1,321 @@
+import argparse
+import json
+import math
+
+import numpy as np
+
+from osm_service import METERS_PER_DEGREE, POI_CATEGORIES, REPORT_CATEGORIES, select_tags
+
+EARTH_RADIUS = 6371008.8
+
+LANDUSE_TYPES = ("commercial", "industrial", "residential", "retail")
+CATEGORIES = POI_CATEGORIES + ("parks",) + LANDUSE_TYPES
+
+
+def haversine(lat, lon, lats, lons):
+    lat, lon, lats, lons = map(np.radians, (lat, lon, lats, lons))
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+
+
+class StringColumn:
+    """Nullable strings stored as one UTF-8 buffer with offsets instead of millions of Python objects."""
+
+    def __init__(self, data, offsets, missing):
+        self.data = data
+        self.offsets = offsets
+        self.missing = missing
+
+    @classmethod
+    def fromValues(cls, values):
+        encoded = [b"" if value is None else value.encode("utf-8") for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets, np.array([value is None for value in values], dtype=bool))
+
+    def __getitem__(self, index):
+        if self.missing[index]:
+            return None
+
+        return self.data[self.offsets[index]:self.offsets[index + 1]].tobytes().decode("utf-8")
+
+
+class Grid:
+    """Uniform grid over lat/lon cells of roughly `cell_size` meters, stored as sorted cell keys."""
+
+    COLUMNS = 1 << 32
+
+    def __init__(self, lats, lons, indices, cell_size, reference_lat):
+        self.cell_lat = cell_size / METERS_PER_DEGREE
+        self.cell_lon = self.cell_lat / max(math.cos(math.radians(reference_lat)), 0.01)
+
+        keys = self.__keys(lats[indices], lons[indices])
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.indices = indices[order]
+
+    def __keys(self, lats, lons):
+        rows = np.floor(np.asarray(lats) / self.cell_lat).astype(np.int64)
+        columns = np.floor(np.asarray(lons) / self.cell_lon).astype(np.int64)
+        return rows * self.COLUMNS + columns + (self.COLUMNS >> 1)
+
+    def query(self, south, north, west, east):
+        first, last = self.__keys([south, north], [west, east])
+        rows = np.arange(first // self.COLUMNS, last // self.COLUMNS + 1, dtype=np.int64) * self.COLUMNS
+        starts = np.searchsorted(self.keys, rows + first % self.COLUMNS, side="left")
+        ends = np.searchsorted(self.keys, rows + last % self.COLUMNS, side="right")
+
+        return np.concatenate([self.indices[start:end] for start, end in zip(starts, ends)] + [np.empty(0, dtype=np.int64)])
+
+
+class InMemoryOsmService:
+    """Read-only backend answering the OsmService methods from columnar NumPy arrays.
+
+    Every feature of the report categories is held as category, centroid, name,
+    tags and `reach`, the largest distance between centroid and geometry. Radius
+    queries look up a grid of `cell_size` meter cells and compute haversine
+    distances for the candidates; features reaching further than one cell are
+    checked on every query. Areas are approximated by a circle of their reach
+    around the centroid, so their distances are lower bounds and polygons close
+    to the edge of the circle may be included where PostGIS would not.
+    """
+
+    def __init__(self, columns, data_version=None, cell_size=500):
+        self.category = columns["category"]
+        self.lat = columns["lat"]
+        self.lon = columns["lon"]
+        self.reach = columns["reach"]
+        self.area = columns["area"]
+        self.names = StringColumn(columns["names_data"], columns["names_offsets"], columns["names_missing"])
+        self.tags = StringColumn(columns["tags_data"], columns["tags_offsets"], columns["tags_missing"])
+        self.data_version = data_version
+        self.cell_size = cell_size
+
+        indices = np.arange(len(self.category), dtype=np.int64)
+        small = self.reach <= cell_size
+        reference_lat = float(self.lat.mean()) if len(self.lat) else 0.0
+        self.__grid = Grid(self.lat, self.lon, indices[small], cell_size, reference_lat)
+        self.__large = indices[~small]
+
+    @classmethod
+    def fromRows(cls, rows, data_version=None, cell_size=500):
+        codes = {category: code for code, category in enumerate(CATEGORIES)}
+        category, lat, lon, names, tags, reach, area = [], [], [], [], [], [], []
+        for row in rows:
+            category.append(codes[row[0]])
+            lat.append(row[1])
+            lon.append(row[2])
+            names.append(row[3])
+            tags.append(row[4])
+            reach.append(row[5] or 0)
+            area.append(row[6] if row[6] is not None else np.nan)
+
+        names = StringColumn.fromValues(names)
+        tags = StringColumn.fromValues(tags)
+        return cls({
+            "category": np.array(category, dtype=np.int8),
+            "lat": np.array(lat, dtype=np.float64),
+            "lon": np.array(lon, dtype=np.float64),
+            "reach": np.array(reach, dtype=np.float32),
+            "area": np.array(area, dtype=np.float64),
+            "names_data": names.data,
+            "names_offsets": names.offsets,
+            "names_missing": names.missing,
+            "tags_data": tags.data,
+            "tags_offsets": tags.offsets,
+            "tags_missing": tags.missing
+        }, data_version, cell_size)
+
+    @classmethod
+    def fromDatabase(cls, osm, cell_size=500):
+        return cls.fromRows(osm.streamFeatures(), osm.getDataVersion(), cell_size)
+
+    @classmethod
+    def fromFile(cls, path, cell_size=500):
+        with np.load(path) as dump:
+            if tuple(dump["categories"]) != CATEGORIES:
+                raise ValueError("%s was written for different categories" % path)
+
+            data_version = int(dump["data_version"])
+            return cls({key: dump[key] for key in dump.files}, None if data_version < 0 else data_version, cell_size)
+
+    def save(self, path):
+        np.savez_compressed(path,
+                            categories=np.array(CATEGORIES),
+                            data_version=np.array(-1 if self.data_version is None else self.data_version),
+                            category=self.category,
+                            lat=self.lat,
+                            lon=self.lon,
+                            reach=self.reach,
+                            area=self.area,
+                            names_data=self.names.data,
+                            names_offsets=self.names.offsets,
+                            names_missing=self.names.missing,
+                            tags_data=self.tags.data,
+                            tags_offsets=self.tags.offsets,
+                            tags_missing=self.tags.missing)
+
+    def __find(self, lat, lon, radius, categories):
+        lat_delta = (radius + self.cell_size) * 1.01 / METERS_PER_DEGREE
+        lon_delta = min(lat_delta / max(math.cos(math.radians(lat)), 0.01), 180)
+        indices = np.concatenate([self.__grid.query(lat - lat_delta, lat + lat_delta, lon - lon_delta, lon + lon_delta), self.__large])
+        indices = indices[np.isin(self.category[indices], [CATEGORIES.index(category) for category in categories])]
+
+        distances = haversine(lat, lon, self.lat[indices], self.lon[indices]) - self.reach[indices]
+        inside = distances <= radius
+        indices, distances = indices[inside], np.maximum(distances[inside], 0)
+
+        order = np.argsort(distances, kind="stable")
+        return indices[order], distances[order]
+
+    def __item(self, index, distance):
+        result = {
+            "distance": float(distance),
+            "unit": "m",
+            "location": {
+                "lat": float(self.lat[index]),
+                "lon": float(self.lon[index])
+            }
+        }
+
+        tags = self.tags[index]
+        if tags is not None:
+            result["other_tags"] = json.loads(tags)
+
+        name = self.names[index]
+        if name is not None:
+            result["name"] = name
+
+        if CATEGORIES[self.category[index]] == "parks":
+            result["area"] = float(self.area[index])
+            result["area_unit"] = "m^2"
+
+        return result
+
+    def __report(self, lat, lon, radius, categories):
+        searched = [category for category in categories if category != "relative_type_of_area"]
+        if "relative_type_of_area" in categories:
+            searched.extend(LANDUSE_TYPES)
+
+        result = {key: {} if key == "relative_type_of_area" else [] for key in categories}
+        for index, distance in zip(*self.__find(lat, lon, radius, searched)):
+            category = CATEGORIES[self.category[index]]
+            if category in LANDUSE_TYPES:
+                landuse = result["relative_type_of_area"].setdefault(category, {"count": 0, "total_area": 0.0, "unit": "m^2"})
+                landuse["count"] += 1
+                landuse["total_area"] += float(self.area[index])
+            else:
+                result[category].append(self.__item(index, distance))
+
+        return result
+
+    def getDataVersion(self):
+        return self.data_version
+
+    def getLanduse(self, lat, lon, radius):
+        return self.__report(lat, lon, radius, ["relative_type_of_area"])["relative_type_of_area"]
+
+    def getParking(self, lat, lon, radius, limit=None, tags=None):
+        return select_tags(self.__report(lat, lon, radius, ["parking"])["parking"][:limit], tags)
+
+    def getParks(self, lat, lon, radius, limit=None, tags=None):
+        return select_tags(self.__report(lat, lon, radius, ["parks"])["parks"][:limit], tags)
+
+
+    def getMalls(self, lat, lon, radius, limit=None, tags=None):
+        return select_tags(self.__report(lat, lon, radius, ["malls"])["malls"][:limit], tags)
+
+    def getChemists(self, lat, lon, radius, limit=None, tags=None):
+        return select_tags(self.__report(lat, lon, radius, ["chemists"])["chemists"][:limit], tags)
+
+    def getConvenience(self, lat, lon, radius, limit=None, tags=None):
+        return select_tags(self.__report(lat, lon, radius, ["convenience"])["convenience"][:limit], tags)
+
+    def getSupermarket(self, lat, lon, radius, limit=None, tags=None):
+        return select_tags(self.__report(lat, lon, radius, ["supermarkets"])["supermarkets"][:limit], tags)
+
+
+    def getSchools(self, lat, lon, radius, limit=None, tags=None):
+        return select_tags(self.__report(lat, lon, radius, ["schools"])["schools"][:limit], tags)
+
+    def getKindergarten(self, lat, lon, radius, limit=None, tags=None):
+        return select_tags(self.__report(lat, lon, radius, ["kindergartens"])["kindergartens"][:limit], tags)
+
+    def getHospitals(self, lat, lon, radius, limit=None, tags=None):
+        return select_tags(self.__report(lat, lon, radius, ["hospitals"])["hospitals"][:limit], tags)
+
+    def getDoctors(self, lat, lon, radius, limit=None, tags=None):
+        return select_tags(self.__report(lat, lon, radius, ["doctors"])["doctors"][:limit], tags)
+
+
+    def getRailwayStations(self, lat, lon, radius, limit=None, tags=None):
+        return select_tags(self.__report(lat, lon, radius, ["railway_stations"])["railway_stations"][:limit], tags)
+
+    def getTramStations(self, lat, lon, radius, limit=None, tags=None):
+        return select_tags(self.__report(lat, lon, radius, ["tram_stations"])["tram_stations"][:limit], tags)
+
+    def getBusStations(self, lat, lon, radius, limit=None, tags=None):
+        return select_tags(self.__report(lat, lon, radius, ["bus_stations"])["bus_stations"][:limit], tags)
+
+
+    def getCounts(self, lat, lon, radius, categories):
+        report = self.__report(lat, lon, radius, categories)
+        return {category: {landuse: item["count"] for landuse, item in items.items()} if category == "relative_type_of_area" else len(items)
+                for category, items in report.items()}
+
+    def getByTags(self, lat, lon, radius, tags, keys):
+        raise NotImplementedError("the in-memory backend only holds the report categories")
+
+    def getTile(self, z, x, y):
+        raise NotImplementedError("the in-memory backend does not hold the geometries of areas")
+
+    def getFullReport(self, lat, lon, radius, categories=None, tags=None):
+        report = self.__report(lat, lon, radius, list(REPORT_CATEGORIES) if categories is None else categories)
+        return {category: items if category == "relative_type_of_area" else select_tags(items, tags) for category, items in report.items()}
+
+    def streamFullReport(self, lat, lon, radius, categories=None, tags=None):
+        for category, items in self.getFullReport(lat, lon, radius, categories, tags).items():
+            if category == "relative_type_of_area":
+                for landuse, item in items.items():
+                    yield category, {"landuse": landuse, **item}
+            else:
+                for item in items:
+                    yield category, item
+
+    def streamCategory(self, category, lat, lon, radius, limit=None):
+        items = self.__report(lat, lon, radius, [category])[category]
+        if category == "relative_type_of_area":
+            return ({"landuse": landuse, **item} for landuse, item in items.items())
+
+        return iter(items[:limit])
+
+    def getNearest(self, category, lat, lon, k, max_radius=None):
+        # The search circle grows until it holds k items or reaches max_radius or half the circumference of the earth.
+        limit = math.pi * EARTH_RADIUS if max_radius is None else max_radius
+        radius = min(self.cell_size, limit)
+        while True:
+            indices, distances = self.__find(lat, lon, radius, [category])
+            if len(indices) >= k or radius >= limit:
+                return [self.__item(index, distance) for index, distance in zip(indices[:k], distances[:k])]
+
+            radius = min(radius * 4, limit)
+
+    def getBatchReports(self, items, chunk_size=100):
+        return [self.__report(lat, lon, radius, categories) for lat, lon, radius, categories in items]
+
+
+if __name__ == "__main__":
+    from flask import Config
+    from osm_service import OsmService
+
+    parser = argparse.ArgumentParser(description="Writes the features of all report categories to a dump file for the in-memory backend.")
+    parser.add_argument("settings", help="settings file with the DATABASE_* connection parameters")
+    parser.add_argument("output", help="path of the .npz dump file")
+    arguments = parser.parse_args()
+
+    config = Config(".")
+    config.from_pyfile(arguments.settings)
+    osm = OsmService(config["DATABASE_USER"], config["DATABASE_PASSWORD"], config["DATABASE_HOST"], config["DATABASE_PORT"], config["DATABASE_NAME"])
+
+    InMemoryOsmService.fromDatabase(osm).save(arguments.output)
@@ -0,0 +1,134 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+ROW_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 50000)
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def formatLabels(labels, **extra):
+    labels = list(labels) + list(extra.items())
+    if not labels:
+        return ""
+
+    return "{" + ",".join('%s="%s"' % (name, escape(value)) for name, value in labels) + "}"
+
+
+def formatValue(value):
+    if value == math.inf:
+        return "+Inf"
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+
+        self.__lock = threading.Lock()
+        self.__values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[label] for label in self.labels)
+        with self.__lock:
+            self.__values[key] = self.__values.get(key, 0) + amount
+
+    def render(self):
+        lines = ["# HELP %s %s" % (self.name, self.help), "# TYPE %s counter" % self.name]
+        with self.__lock:
+            for key, value in sorted(self.__values.items()):
+                lines.append("%s%s %s" % (self.name, formatLabels(zip(self.labels, key)), formatValue(value)))
+
+        return lines
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets, rendered in the Prometheus text format."""
+
+    def __init__(self, name, help, labels=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets) + (math.inf,)
+
+        self.__lock = threading.Lock()
+        self.__values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(labels[label] for label in self.labels)
+        with self.__lock:
+            counts, total = self.__values.get(key, ([0] * len(self.buckets), 0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self.__values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = ["# HELP %s %s" % (self.name, self.help), "# TYPE %s histogram" % self.name]
+        with self.__lock:
+            for key, (counts, total) in sorted(self.__values.items()):
+                labels = list(zip(self.labels, key))
+                for bound, count in zip(self.buckets, counts):
+                    lines.append("%s_bucket%s %d" % (self.name, formatLabels(labels, le=formatValue(bound)), count))
+                lines.append("%s_sum%s %s" % (self.name, formatLabels(labels), formatValue(total)))
+                lines.append("%s_count%s %d" % (self.name, formatLabels(labels), counts[-1]))
+
+        return lines
+
+
+METHOD_DURATION = Histogram("osm_method_duration_seconds", "Duration of OsmService method calls.", ("method",))
+METHOD_ERRORS = Counter("osm_method_errors_total", "OsmService method calls that raised an exception.", ("method",))
+QUERY_DURATION = Histogram("osm_query_duration_seconds", "Time PostgreSQL took to execute a statement.", ("statement",))
+QUERY_DECODE_DURATION = Histogram("osm_query_decode_duration_seconds", "Time spent fetching and decoding the rows of a statement in Python.", ("statement",))
+QUERY_ROWS = Histogram("osm_query_rows", "Rows returned by a statement.", ("statement",), ROW_BUCKETS)
+SLOW_QUERIES = Counter("osm_slow_queries_total", "Statements slower than the slow query threshold.", ("statement",))
+POOL_WAIT_DURATION = Histogram("osm_pool_wait_seconds", "Time spent waiting for a pooled database connection.")
+SERIALIZATION_DURATION = Histogram("osm_serialization_duration_seconds", "Time spent encoding responses as JSON.", ("endpoint",))
+ADMISSION_REJECTED = Counter("osm_admission_rejected_total", "Expensive requests rejected by the admission control.", ("status",))
+
+REGISTRY = [METHOD_DURATION, METHOD_ERRORS, QUERY_DURATION, QUERY_DECODE_DURATION, QUERY_ROWS, SLOW_QUERIES, POOL_WAIT_DURATION, SERIALIZATION_DURATION, ADMISSION_REJECTED]
+
+
+def render():
+    """All metrics of this process in the Prometheus text exposition format."""
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+class InstrumentedOsmService:
+    """Records the duration and failures of every get* method of the wrapped service.
+
+    Every other attribute is passed through unchanged.
+    """
+
+    def __init__(self, osm):
+        self.osm = osm
+
+    def __getattr__(self, name):
+        attribute = getattr(self.osm, name)
+        if not name.startswith("get") or not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            with METHOD_DURATION.time(method=name):
+                try:
+                    return attribute(*args, **kwargs)
+                except Exception:
+                    METHOD_ERRORS.inc(method=name)
+                    raise
+
+        return call
@@ -1,370 +1,888 @@
-import json
-import psycopg2
-
-class OsmService:
-    def __init__(self, user, password, host, port, database):
-        self.user = user
-        self.password = password
-        self.host = host
-        self.port = port
-        self.database = database
-
-        self.__connectToDatabase()
-
-    def __connectToDatabase(self):
-        self.connection = psycopg2.connect(user=self.user, password=self.password, host=self.host, port=self.port, database=self.database)
-
-    def __parse_other_tags(self, other_tags):
-        if other_tags is None:
-            return dict()
-
-        result = dict()
-        for key, value in map(lambda tag: tag.split('"=>"'), other_tags[1:-1].split('","')):
-            result[key] = value
-
-        return result
-
-    def __response_from_row(self, name, point, other_tags, distance):
-        result = {
-            "distance": distance,
-            "unit": "m"
+import logging
+import math
+import re
+import threading
+import time
+from contextlib import contextmanager
+import psycopg2.extras
+from psycopg2.extras import Json
+from connection_pool import ConnectionPool
+from geohash_grid import GRID_RESOLUTIONS, cover
+from metrics import QUERY_DECODE_DURATION, QUERY_DURATION, QUERY_ROWS, SLOW_QUERIES
+
+try:
+    import orjson
+    psycopg2.extras.register_default_json(loads=orjson.loads, globally=True)
+    psycopg2.extras.register_default_jsonb(loads=orjson.loads, globally=True)
+except ImportError:
+    pass
+
+slow_query_logger = logging.getLogger("osm_service.slow_queries")
+
+REPORT_CATEGORIES = {
+    "relative_type_of_area": "getLanduse",
+
+    "malls": "getMalls",
+    "chemists": "getChemists",
+    "convenience": "getConvenience",
+    "supermarkets": "getSupermarket",
+
+    "parks": "getParks",
+    "parking": "getParking",
+    "schools": "getSchools",
+    "kindergartens": "getKindergarten",
+    "hospitals": "getHospitals",
+    "doctors": "getDoctors",
+
+    "railway_stations": "getRailwayStations",
+    "tram_stations": "getTramStations",
+    "bus_stations": "getBusStations",
+}
+
+POI_CATEGORIES = tuple(key for key in REPORT_CATEGORIES if key not in ("relative_type_of_area", "parks"))
+
+NEAREST_CATEGORIES = POI_CATEGORIES + ("parks",)
+
+METERS_PER_DEGREE = 111195
+
+PARAMETER_TYPES = {
+    "category": "poi_category",
+    "lat": "float8",
+    "lon": "float8",
+    "radius": "float8",
+    "west": "float8",
+    "south": "float8",
+    "east": "float8",
+    "north": "float8",
+    "limit": "int8",
+    "k": "int8",
+    "candidates": "int8",
+    "max_radius": "float8",
+    "categories": "text[]",
+    "selected_tags": "text[]",
+    "parks": "bool",
+    "resolution": "int4",
+    "interior": "text[]",
+    "border_cells": "text[]",
+    "border_wests": "float8[]",
+    "border_souths": "float8[]",
+    "border_easts": "float8[]",
+    "border_norths": "float8[]",
+    "z": "int4",
+    "x": "int4",
+    "y": "int4",
+    "margin": "float8",
+    "extent": "int4",
+    "buffer": "int4",
+    "landuse": "bool"
+}
+
+# Lowest zoom level at which a category is drawn in the vector tiles, so that tiles
+# showing a large area only hold the few categories that are visible at that scale.
+TILE_MIN_ZOOMS = {
+    "relative_type_of_area": 10,
+    "railway_stations": 10,
+    "hospitals": 11,
+    "malls": 12,
+    "parks": 12,
+    "schools": 13,
+    "supermarkets": 13,
+    "tram_stations": 13,
+    "kindergartens": 14,
+    "doctors": 14,
+    "chemists": 14,
+    "convenience": 15,
+    "parking": 15,
+    "bus_stations": 15
+}
+
+TILE_EXTENT = 4096
+# Features are included up to this many pixels outside the tile, so that symbols on its edges are drawn completely.
+TILE_BUFFER = 256
+
+# other_tags reduced to the keys in `selected_tags`, or complete if it is NULL.
+SELECTED_POI_TAGS = """\
+CASE WHEN %(selected_tags)s::text[] IS NULL THEN other_tags
+        ELSE (SELECT jsonb_object_agg(key, value) FROM jsonb_each(other_tags) WHERE key = ANY(%(selected_tags)s::text[])) END"""
+SELECTED_PARK_TAGS = """\
+hstore_to_json(CASE WHEN %(selected_tags)s::text[] IS NULL THEN other_tags::hstore
+        ELSE NULLIF(slice(other_tags::hstore, %(selected_tags)s::text[]), ''::hstore) END)"""
+
+POI_QUERY = """\
+    SELECT name, ST_Y(geom), ST_X(geom), {tags}, ST_Distance(geog, ST_MakePoint(%(lon)s, %(lat)s)::geography) as dist
+    FROM poi
+    WHERE category = %(category)s
+    AND ST_DWithin(geog, ST_MakePoint(%(lon)s, %(lat)s)::geography, %(radius)s, false)
+    ORDER BY dist
+    LIMIT %(limit)s
+    """.format(tags=SELECTED_POI_TAGS)
+
+# The queries of a single category with the category inlined, prepared as a statement of their own per
+# category. A generic plan of a statement taking the category as a parameter could not use the partial
+# index of the category built by indexes.sql and would walk the index over all categories instead.
+POI_QUERIES = {category: POI_QUERY.replace("%(category)s", "'%s'" % category) for category in POI_CATEGORIES}
+
+# The areas of the landuse polygons are precomputed by landuse.sql. The whole area of
+# every polygon touching the circle is summed, or in the clipped mode only the part of
+# its simplified geometry inside the circle; polygons completely inside are not clipped.
+LANDUSE_AREA = "sum(landuse_area)"
+LANDUSE_CLIPPED_AREA = """\
+sum(CASE WHEN ST_Within(landuse_simplified, clip.circle) THEN landuse_area
+        ELSE ST_Area(ST_Intersection(landuse_simplified, clip.circle)::geography, false) END)"""
+LANDUSE_CLIP_JOIN = "CROSS JOIN (SELECT ST_Buffer(ST_MakePoint(%(lon)s, %(lat)s)::geography, %(radius)s)::geometry AS circle) AS clip"
+
+BATCH_CLIP_JOIN = "CROSS JOIN (SELECT ST_Buffer(centers.center, centers.radius)::geometry AS circle) AS clip"
+
+LANDUSE_QUERY_TEMPLATE = """\
+    SELECT landuse, count(id), {area}
+    FROM multipolygons
+    {join}
+    WHERE landuse IN ('commercial', 'industrial', 'residential', 'retail')
+    AND ST_DWithin(geog, ST_MakePoint(%(lon)s, %(lat)s)::geography, %(radius)s, false)
+    GROUP BY landuse"""
+
+LANDUSE_QUERY = LANDUSE_QUERY_TEMPLATE.format(area=LANDUSE_AREA, join="")
+LANDUSE_CLIPPED_QUERY = LANDUSE_QUERY_TEMPLATE.format(area=LANDUSE_CLIPPED_AREA, join=LANDUSE_CLIP_JOIN)
+
+PARKS_QUERY = """\
+    SELECT name, ST_Y(ST_Centroid(geom)), ST_X(ST_Centroid(geom)), {tags}, ST_Distance(geog, ST_MakePoint(%(lon)s, %(lat)s)::geography) as dist, ST_Area(geom)
+    FROM multipolygons
+    WHERE geom && ST_MakeEnvelope(%(west)s, %(south)s, %(east)s, %(north)s, 4326)
+    AND ST_DWithin(geog, ST_MakePoint(%(lon)s, %(lat)s)::geography, %(radius)s, false)
+    AND leisure like 'park'
+    ORDER BY dist
+    LIMIT %(limit)s
+    """.format(tags=SELECTED_PARK_TAGS)
+
+TAGS_QUERY = """\
+    SELECT name, ST_Y(ST_Centroid(geom)), ST_X(ST_Centroid(geom)), hstore_to_json(other_tags::hstore), ST_Distance(geog, ST_MakePoint(%(lon)s, %(lat)s)::geography) as dist
+    FROM (
+        SELECT name, geom, geog, other_tags
+        FROM points
+        WHERE tags @> %(tags)s AND tags ?& %(keys)s
+        AND geom && ST_MakeEnvelope(%(west)s, %(south)s, %(east)s, %(north)s, 4326)
+        AND ST_DWithin(geog, ST_MakePoint(%(lon)s, %(lat)s)::geography, %(radius)s, false)
+        UNION ALL
+        SELECT name, geom, geog, other_tags
+        FROM multipolygons
+        WHERE tags @> %(tags)s AND tags ?& %(keys)s
+        AND geom && ST_MakeEnvelope(%(west)s, %(south)s, %(east)s, %(north)s, 4326)
+        AND ST_DWithin(geog, ST_MakePoint(%(lon)s, %(lat)s)::geography, %(radius)s, false)
+        UNION ALL
+        SELECT name, geom, geog, other_tags
+        FROM other_relations
+        WHERE tags @> %(tags)s AND tags ?& %(keys)s
+        AND geom && ST_MakeEnvelope(%(west)s, %(south)s, %(east)s, %(north)s, 4326)
+        AND ST_DWithin(geog, ST_MakePoint(%(lon)s, %(lat)s)::geography, %(radius)s, false)
+    ) AS matches
+    ORDER BY dist
+    """
+
+FULL_REPORT_POI_QUERY = """\
+    SELECT category, name, ST_Y(geom), ST_X(geom), {tags}, ST_Distance(geog, ST_MakePoint(%(lon)s, %(lat)s)::geography) as dist
+    FROM poi
+    WHERE ST_DWithin(geog, ST_MakePoint(%(lon)s, %(lat)s)::geography, %(radius)s, false)
+    AND category = ANY(%(categories)s::poi_category[])
+    ORDER BY dist
+    """.format(tags=SELECTED_POI_TAGS)
+
+FULL_REPORT_AREAS_QUERY_TEMPLATE = """\
+    WITH nearby AS (
+        SELECT id, name, geom, geog, other_tags, landuse, leisure, landuse_area, landuse_simplified
+        FROM multipolygons
+        WHERE geom && ST_MakeEnvelope(%(west)s, %(south)s, %(east)s, %(north)s, 4326)
+        AND ST_DWithin(geog, ST_MakePoint(%(lon)s, %(lat)s)::geography, %(radius)s, false)
+        AND (landuse IN ('commercial', 'industrial', 'residential', 'retail')
+        OR leisure like 'park')
+    )
+    SELECT 'landuse', landuse, NULL::float8, NULL::float8, NULL::json, NULL as dist, count(id), {area}
+    FROM nearby
+    {join}
+    WHERE landuse IN ('commercial', 'industrial', 'residential', 'retail')
+    GROUP BY landuse
+    UNION ALL
+    SELECT 'parks', name, ST_Y(ST_Centroid(geom)), ST_X(ST_Centroid(geom)), {tags}, ST_Distance(geog, ST_MakePoint(%(lon)s, %(lat)s)::geography) as dist, NULL, ST_Area(geom)
+    FROM nearby
+    WHERE leisure like 'park'
+    ORDER BY dist
+    """
+
+FULL_REPORT_AREAS_QUERY = FULL_REPORT_AREAS_QUERY_TEMPLATE.format(area=LANDUSE_AREA, join="", tags=SELECTED_PARK_TAGS)
+FULL_REPORT_AREAS_CLIPPED_QUERY = FULL_REPORT_AREAS_QUERY_TEMPLATE.format(area=LANDUSE_CLIPPED_AREA, join=LANDUSE_CLIP_JOIN, tags=SELECTED_PARK_TAGS)
+
+# `<->` walks the GiST index on geog in order of the distance on the sphere. The
+# candidates are re-ranked by their exact distance on the spheroid, which differs
+# by less than one percent, so a few more candidates than requested are fetched.
+NEAREST_POI_QUERY = """\
+    SELECT name, ST_Y(geom), ST_X(geom), other_tags, dist
+    FROM (
+        SELECT name, geom, other_tags, ST_Distance(geog, ST_MakePoint(%(lon)s, %(lat)s)::geography) as dist
+        FROM (
+            SELECT name, geom, geog, other_tags
+            FROM poi
+            WHERE category = %(category)s
+            ORDER BY geog <-> ST_MakePoint(%(lon)s, %(lat)s)::geography
+            LIMIT %(candidates)s
+        ) AS candidates
+    ) AS nearest
+    WHERE dist <= %(max_radius)s OR %(max_radius)s IS NULL
+    ORDER BY dist
+    LIMIT %(k)s
+    """
+
+NEAREST_POI_QUERIES = {category: NEAREST_POI_QUERY.replace("%(category)s", "'%s'" % category) for category in POI_CATEGORIES}
+
+NEAREST_PARKS_QUERY = """\
+    SELECT name, ST_Y(ST_Centroid(geom)), ST_X(ST_Centroid(geom)), hstore_to_json(other_tags::hstore), dist, ST_Area(geom)
+    FROM (
+        SELECT name, geom, other_tags, ST_Distance(geog, ST_MakePoint(%(lon)s, %(lat)s)::geography) as dist
+        FROM (
+            SELECT name, geom, geog, other_tags
+            FROM multipolygons
+            WHERE leisure like 'park'
+            ORDER BY geog <-> ST_MakePoint(%(lon)s, %(lat)s)::geography
+            LIMIT %(candidates)s
+        ) AS candidates
+    ) AS nearest
+    WHERE dist <= %(max_radius)s OR %(max_radius)s IS NULL
+    ORDER BY dist
+    LIMIT %(k)s
+    """
+
+# One layer per category, named like the categories of the report, with landuse in the
+# layer relative_type_of_area. Tiles are in Web Mercator (EPSG:3857).
+TILE_QUERY = """\
+    WITH bounds AS (
+        SELECT ST_TileEnvelope(%(z)s, %(x)s, %(y)s) AS tile,
+            ST_Transform(ST_TileEnvelope(%(z)s, %(x)s, %(y)s, margin => %(margin)s), 4326)::geography AS area
+    ),
+    features AS (
+        SELECT poi.category::text AS layer, poi.id, poi.name, NULL::text AS landuse,
+            ST_AsMVTGeom(ST_Transform(poi.geom, 3857), bounds.tile, %(extent)s, %(buffer)s) AS geom
+        FROM poi, bounds
+        WHERE poi.category = ANY(%(categories)s::poi_category[])
+        AND poi.geog && bounds.area
+        UNION ALL
+        SELECT 'parks', multipolygons.id, multipolygons.name, NULL,
+            ST_AsMVTGeom(ST_Transform(multipolygons.geom, 3857), bounds.tile, %(extent)s, %(buffer)s)
+        FROM multipolygons, bounds
+        WHERE %(parks)s
+        AND multipolygons.leisure like 'park'
+        AND multipolygons.geog && bounds.area
+        UNION ALL
+        SELECT 'relative_type_of_area', multipolygons.id, multipolygons.name, multipolygons.landuse,
+            ST_AsMVTGeom(ST_Transform(multipolygons.landuse_simplified, 3857), bounds.tile, %(extent)s, %(buffer)s)
+        FROM multipolygons, bounds
+        WHERE %(landuse)s
+        AND multipolygons.landuse IN ('commercial', 'industrial', 'residential', 'retail')
+        AND multipolygons.geog && bounds.area
+    )
+    SELECT string_agg(layer, ''::bytea)
+    FROM (
+        SELECT ST_AsMVT(features, features.layer, %(extent)s, 'geom') AS layer
+        FROM features
+        WHERE geom IS NOT NULL
+        GROUP BY features.layer
+    ) AS layers
+    """
+
+PARKS_COUNT_QUERY = """\
+    SELECT 'parks', count(id)
+    FROM multipolygons
+    WHERE %(parks)s
+    AND leisure like 'park'
+    AND geom && ST_MakeEnvelope(%(west)s, %(south)s, %(east)s, %(north)s, 4326)
+    AND ST_DWithin(geog, ST_MakePoint(%(lon)s, %(lat)s)::geography, %(radius)s, false)
+    """
+
+# Features of other_relations are not aggregated in poi_grid and always counted exactly.
+RELATIONS_COUNT_QUERY = """\
+    SELECT category::text, count(id)
+    FROM poi
+    WHERE source <> 'points'
+    AND category = ANY(%(categories)s::poi_category[])
+    AND ST_DWithin(geog, ST_MakePoint(%(lon)s, %(lat)s)::geography, %(radius)s, false)
+    GROUP BY category
+    """
+
+COUNTS_QUERY = """\
+    SELECT category::text, count(id)
+    FROM poi
+    WHERE category = ANY(%(categories)s::poi_category[])
+    AND ST_DWithin(geog, ST_MakePoint(%(lon)s, %(lat)s)::geography, %(radius)s, false)
+    GROUP BY category
+    UNION ALL
+""" + PARKS_COUNT_QUERY
+
+# The cells inside the circle are added up from poi_grid, the features of the cells on
+# its border are checked exactly. Every point belongs to the border cell of its own
+# geohash only; the envelopes are enlarged by about 100 m because the edges of a
+# geography envelope are great circles instead of parallels.
+GRID_COUNTS_QUERY = """\
+    SELECT category::text, sum(count)
+    FROM poi_grid
+    WHERE resolution = %(resolution)s
+    AND cell = ANY(%(interior)s::text[])
+    AND category = ANY(%(categories)s::poi_category[])
+    GROUP BY category
+    UNION ALL
+    SELECT poi.category::text, count(poi.id)
+    FROM unnest(%(border_cells)s::text[], %(border_wests)s::float8[], %(border_souths)s::float8[], %(border_easts)s::float8[], %(border_norths)s::float8[])
+        AS border(cell, west, south, east, north)
+    JOIN poi ON poi.geog && ST_Expand(ST_MakeEnvelope(border.west, border.south, border.east, border.north, 4326), 0.001)::geography
+    AND ST_GeoHash(poi.geom, %(resolution)s) = border.cell
+    WHERE poi.source = 'points'
+    AND poi.category = ANY(%(categories)s::poi_category[])
+    AND ST_DWithin(poi.geog, ST_MakePoint(%(lon)s, %(lat)s)::geography, %(radius)s, false)
+    GROUP BY poi.category
+    UNION ALL
+""" + RELATIONS_COUNT_QUERY + """\
+UNION ALL
+""" + PARKS_COUNT_QUERY
+
+
+def response_from_row(name, lat, lon, other_tags, distance):
+    result = {
+        "distance": distance,
+        "unit": "m",
+        "location": {
+            "lat": lat,
+            "lon": lon
         }
+    }
 
-        geojson = json.loads(point)
-        result["location"] = {
-            "lat": geojson["coordinates"][1],
-            "lon": geojson["coordinates"][0]
+    if other_tags != None:
+        result["other_tags"] = other_tags
+
+    if name != None:
+        result["name"] = name
+
+    return result
+
+
+def park_from_row(name, lat, lon, other_tags, distance, area):
+    result = response_from_row(name, lat, lon, other_tags, distance)
+    result["area"] = area
+    result["area_unit"] = "m^2"
+
+    return result
+
+
+def query_parameters(lat, lon, radius, **parameters):
+    # Bounding box of the circle, slightly enlarged, used as an index prefilter on geom.
+    lat_delta = radius * 1.01 / METERS_PER_DEGREE
+    lon_delta = min(lat_delta / max(math.cos(math.radians(lat)), 0.01), 180)
+
+    parameters.update({
+        "lat": lat,
+        "lon": lon,
+        "radius": radius,
+        "west": lon - lon_delta,
+        "south": lat - lat_delta,
+        "east": lon + lon_delta,
+        "north": lat + lat_delta
+    })
+    return parameters
+
+
+def select_tags(items, tags):
+    """Copies of the items with other_tags reduced to the keys in `tags`, or the items themselves if `tags` is None."""
+    if tags is None:
+        return items
+
+    result = []
+    for item in items:
+        item = dict(item)
+        other_tags = {key: value for key, value in item.pop("other_tags", {}).items() if key in tags}
+        if other_tags:
+            item["other_tags"] = other_tags
+        result.append(item)
+
+    return result
+
+
+def tile_parameters(z, x, y):
+    """The parameters of TILE_QUERY, or None if no category is drawn at zoom level `z`."""
+    categories = [category for category, zoom in TILE_MIN_ZOOMS.items() if zoom <= z]
+    if not categories:
+        return None
+
+    return {
+        "z": z,
+        "x": x,
+        "y": y,
+        "extent": TILE_EXTENT,
+        "buffer": TILE_BUFFER,
+        "margin": TILE_BUFFER / TILE_EXTENT,
+        "categories": [category for category in categories if category in POI_CATEGORIES],
+        "parks": "parks" in categories,
+        "landuse": "relative_type_of_area" in categories
+    }
+
+
+def counts_query(lat, lon, radius, categories):
+    """The statement name, query and parameters counting the POI categories and parks among `categories`."""
+    parameters = query_parameters(lat, lon, radius, categories=[category for category in categories if category in POI_CATEGORIES],
+                                  parks="parks" in categories)
+
+    cells = cover(lat, lon, radius, parameters["west"], parameters["south"], parameters["east"], parameters["north"])
+    if cells is None:
+        return "counts", COUNTS_QUERY, parameters
+
+    resolution, interior, border = cells
+    border_cells, border_wests, border_souths, border_easts, border_norths = (list(column) for column in zip(*border)) if border else ([], [], [], [], [])
+    parameters.update({
+        "resolution": resolution,
+        "interior": interior,
+        "border_cells": border_cells,
+        "border_wests": border_wests,
+        "border_souths": border_souths,
+        "border_easts": border_easts,
+        "border_norths": border_norths
+    })
+    return "grid_counts", GRID_COUNTS_QUERY, parameters
+
+
+def counts_from_rows(categories, rows):
+    result = {category: 0 for category in categories if category != "relative_type_of_area"}
+    for category, count in rows:
+        result[category] += count
+
+    return result
+
+
+def landuse_from_rows(rows):
+    result = {}
+    for row in rows:
+        result[row[0]] = {
+            "count": row[1],
+            "total_area": row[2],
+            "unit": "m^2"
         }
 
-        if other_tags != None:
-            result["other_tags"] = self.__parse_other_tags(other_tags)
-
-        if name != None:
-            result["name"] = name
-
-        return result
-
-    def __getCursor(self):
-        if self.connection.closed:
-            self.__connectToDatabase()
+    return result
 
-        return self.connection.cursor()
 
-    def __executeQuery(self, query, parameters):
-        cursor = self.__getCursor()
+def empty_report(categories):
+    return {key: {} if key == "relative_type_of_area" else [] for key in categories}
 
-        cursor.execute(query, parameters)
-        return list(cursor.fetchall())
 
+class OsmService:
+    def __init__(self, user, password, host, port, database, pool_min_size=1, pool_max_size=10, pool_timeout=30, pool_health_check_interval=30, stream_itersize=2000,
+                 slow_query_threshold=None, slow_query_explain=False, landuse_clipped=False, statement_timeout=None):
+        self.user = user
+        self.password = password
+        self.host = host
+        self.port = port
+        self.database = database
+        self.stream_itersize = stream_itersize
+        self.slow_query_threshold = slow_query_threshold
+        self.slow_query_explain = slow_query_explain
+        self.landuse_clipped = landuse_clipped
+        self.statement_timeout = statement_timeout
+
+        # The server cancels every statement running longer than statement_timeout seconds.
+        options = {} if statement_timeout is None else {"options": "-c statement_timeout=%d" % (statement_timeout * 1000)}
+        self.pool = ConnectionPool(pool_min_size, pool_max_size, pool_timeout, pool_health_check_interval,
+                                   user=self.user, password=self.password, host=self.host, port=self.port, database=self.database, **options)
+        self.__deadline = threading.local()
+
+    @contextmanager
+    def deadline(self, at):
+        """Lets the server cancel every query of the current thread still running at the time.monotonic() `at`.
+
+        Each query started in the block runs with a statement_timeout of the
+        time left until then, which is reset to the configured one afterwards.
+        Streamed queries are not limited.
+        """
+        self.__deadline.at = at
+        try:
+            yield
+        finally:
+            self.__deadline.at = None
+
+    def __prepare(self, cursor, statement, query):
+        """Prepares `query` as `statement` on the cursor's connection once and returns the EXECUTE command for it."""
+        names = list(dict.fromkeys(re.findall(r"%\((\w+)\)s", query)))
+        if statement not in cursor.connection.prepared:
+            body = re.sub(r"%\((\w+)\)s", lambda match: "$%d" % (names.index(match.group(1)) + 1), query).replace("%%", "%")
+            cursor.execute("PREPARE %s (%s) AS %s" % (statement, ", ".join(PARAMETER_TYPES[name] for name in names), body))
+            cursor.connection.prepared.add(statement)
+
+        return "EXECUTE %s (%s)" % (statement, ", ".join("%%(%s)s" % name for name in names))
+
+    def __logSlowQuery(self, cursor, name, query, parameters, duration):
+        """Logs the parameters and, if enabled, the plan of a statement that took longer than the slow query threshold."""
+        SLOW_QUERIES.inc(statement=name)
+
+        plan = None
+        if self.slow_query_explain:
+            try:
+                cursor.execute("EXPLAIN " + query, parameters)
+                plan = "\n".join(row[0] for row in cursor.fetchall())
+            except psycopg2.Error as e:
+                plan = "EXPLAIN failed: %s" % e
+
+        slow_query_logger.warning("%s took %.3f s with %r%s", name, duration, parameters, "\n" + plan if plan else "")
+
+    def __executeQuery(self, query, parameters, statement=None, name=None):
+        name = name or statement
+
+        def execute(cursor):
+            started = time.perf_counter()
+            if statement is None:
+                cursor.execute(query, parameters)
+            else:
+                cursor.execute(self.__prepare(cursor, statement, query), parameters)
+            executed = time.perf_counter()
+
+            rows = list(cursor.fetchall())
+            QUERY_DURATION.observe(executed - started, statement=name)
+            QUERY_DECODE_DURATION.observe(time.perf_counter() - executed, statement=name)
+            QUERY_ROWS.observe(len(rows), statement=name)
+
+            if self.slow_query_threshold is not None and executed - started > self.slow_query_threshold:
+                self.__logSlowQuery(cursor, name, query, parameters, executed - started)
+
+            return rows
+
+        deadline = getattr(self.__deadline, "at", None)
+        if deadline is None:
+            return self.pool.run(execute)
+
+        def executeUntilDeadline(cursor):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise psycopg2.extensions.QueryCanceledError("deadline passed before %s was started" % name)
+
+            cursor.execute("SET statement_timeout = %d" % max(int(remaining * 1000), 1))
+            try:
+                return execute(cursor)
+            finally:
+                if not cursor.connection.closed:
+                    cursor.execute("RESET statement_timeout")
+
+        return self.pool.run(executeUntilDeadline)
+
+    def __streamQuery(self, query, parameters, statement=None, name=None):
+        name = name or statement
+        rows = 0
+        started = time.perf_counter()
+        # Server-side cursors cannot be declared for EXECUTE, so streamed queries are never prepared.
+        # The duration of a stream includes the time the client took to read it.
+        try:
+            with self.pool.cursor(name="stream", itersize=self.stream_itersize) as cursor:
+                cursor.execute(query, parameters)
+                for row in cursor:
+                    rows += 1
+                    yield row
+        finally:
+            QUERY_DURATION.observe(time.perf_counter() - started, statement=name + "_stream")
+            QUERY_ROWS.observe(rows, statement=name + "_stream")
+
+
+    def getDataVersion(self):
+        rows = self.__executeQuery("SELECT version FROM data_version", None, name="data_version")
+        return rows[0][0] if rows else None
+
+    def getExtent(self):
+        """Returns the (west, south, east, north) bounding box of the imported data written by extent.sql, or None."""
+        rows = self.__executeQuery("SELECT west, south, east, north FROM data_extent", None, name="data_extent")
+        return tuple(rows[0]) if rows else None
+
+    def getCategoryDensities(self):
+        """Returns the points per square kilometer of every point category, counted in poi_grid over the area of data_extent."""
+        extent = self.getExtent()
+        if extent is None:
+            return {}
+
+        west, south, east, north = extent
+        area = (east - west) * (north - south) * (METERS_PER_DEGREE / 1000) ** 2 * math.cos(math.radians((south + north) / 2))
+        rows = self.__executeQuery("SELECT category::text, sum(count) FROM poi_grid WHERE resolution = %(resolution)s GROUP BY category",
+                                   {"resolution": GRID_RESOLUTIONS[0]}, name="category_densities")
+        return {category: float(count) / area for category, count in rows} if area > 0 else {}
+
+    def __getPois(self, category, lat, lon, radius, limit=None, stream=False, tags=None):
+        rows = (self.__streamQuery if stream else self.__executeQuery)(POI_QUERIES[category], query_parameters(lat, lon, radius, limit=limit, selected_tags=tags),
+                                                                        statement="poi_" + category, name="poi_category")
+
+        result = (response_from_row(*row) for row in rows)
+        return result if stream else list(result)
 
     def getLanduse(self, lat, lon, radius):
-        rows = self.__executeQuery("""\
-            SELECT landuse, count(id), ST_Area(ST_Collect(geom)::geography, false)
-            FROM multipolygons
-            WHERE (landuse = 'commercial'
-            OR landuse = 'industrial'
-            OR landuse = 'residential'
-            OR landuse = 'retail')
-            AND ST_DWithin(geom::geography, ST_MakePoint(%(lon)s, %(lat)s)::geography, %(radius)s, false)
-            GROUP BY landuse""", {
-                "lat": lat,
-                "lon": lon,
-                "radius": radius
-            })
-
-        result = {}
-        for row in rows:
-            result[row[0]] = {
-                "count": row[1],
-                "total_area": row[2],
-                "unit": "m^2"
-            }
+        if self.landuse_clipped:
+            rows = self.__executeQuery(LANDUSE_CLIPPED_QUERY, query_parameters(lat, lon, radius), statement="landuse_clipped")
+        else:
+            rows = self.__executeQuery(LANDUSE_QUERY, query_parameters(lat, lon, radius), statement="landuse")
 
-        return result
+        return landuse_from_rows(rows)
 
-    def getParking(self, lat, lon, radius):
-        rows = self.__executeQuery("""\
-            SELECT name, ST_AsGeoJSON(ST_Centroid(geom)), other_tags, ST_Distance(geom::geography, ST_MakePoint(%(lon)s, %(lat)s)::geography) as dist
-            FROM points
-            WHERE ST_DWithin(geom::geography, ST_MakePoint(%(lon)s, %(lat)s)::geography, %(radius)s, false)
-            AND other_tags like '%%"amenity"=>"parking"%%'
-            AND NOT other_tags like '%%"access"=>"private"%%'
-            AND NOT other_tags like '%%"access"=>"no"%%'
-            AND NOT other_tags like '%%"access"=>"discouraged"%%'
-            ORDER BY dist
-            """, {
-                "lat": lat,
-                "lon": lon,
-                "radius": radius
-            })
+    def getParking(self, lat, lon, radius, limit=None, tags=None):
+        return self.__getPois("parking", lat, lon, radius, limit, tags=tags)
 
-        result = list()
-        for row in rows:
-            result.append(self.__response_from_row(*row))
+    def getParks(self, lat, lon, radius, limit=None, stream=False, tags=None):
+        rows = (self.__streamQuery if stream else self.__executeQuery)(PARKS_QUERY, query_parameters(lat, lon, radius, limit=limit, selected_tags=tags),
+                                                                        statement="parks")
 
-        return result
+        result = (park_from_row(*row) for row in rows)
+        return result if stream else list(result)
 
-    def getParks(self, lat, lon, radius):
-        rows = self.__executeQuery("""\
-            SELECT name, ST_AsGeoJSON(ST_Centroid(geom)), other_tags, ST_Distance(geom::geography, ST_MakePoint(%(lon)s, %(lat)s)::geography) as dist, ST_Area(geom)
-            FROM multipolygons
-            WHERE ST_DWithin(geom::geography, ST_MakePoint(%(lon)s, %(lat)s)::geography, %(radius)s, false)
-            AND leisure like 'park'
-            ORDER BY dist
-            """, {
-                "lat": lat,
-                "lon": lon,
-                "radius": radius
-            })
 
-        result = list()
-        for row in rows:
-            temp = self.__response_from_row(row[0], row[1], row[2], row[3])
-            temp["area"] = row[4]
-            temp["area_unit"] = "m^2"
+    def getMalls(self, lat, lon, radius, limit=None, tags=None):
+        return self.__getPois("malls", lat, lon, radius, limit, tags=tags)
 
-            result.append(temp)
+    def getChemists(self, lat, lon, radius, limit=None, tags=None):
+        return self.__getPois("chemists", lat, lon, radius, limit, tags=tags)
 
-        return result
+    def getConvenience(self, lat, lon, radius, limit=None, tags=None):
+        return self.__getPois("convenience", lat, lon, radius, limit, tags=tags)
 
+    def getSupermarket(self, lat, lon, radius, limit=None, tags=None):
+        return self.__getPois("supermarkets", lat, lon, radius, limit, tags=tags)
 
-    def getMalls(self, lat, lon, radius):
-        rows = self.__executeQuery("""\
-            SELECT name, ST_AsGeoJSON(ST_Centroid(geom)), other_tags, ST_Distance(geom::geography, ST_MakePoint(%(lon)s, %(lat)s)::geography) as dist
-            FROM points
-            WHERE ST_DWithin(geom::geography, ST_MakePoint(%(lon)s, %(lat)s)::geography, %(radius)s, false)
-            AND other_tags like '%%"shop"=>"mall"%%'
-            ORDER BY dist
-            """, {
-                "lat": lat,
-                "lon": lon,
-                "radius": radius
-            })
 
-        result = list()
-        for row in rows:
-            result.append(self.__response_from_row(*row))
+    def getSchools(self, lat, lon, radius, limit=None, tags=None):
+        return self.__getPois("schools", lat, lon, radius, limit, tags=tags)
 
-        return result
+    def getKindergarten(self, lat, lon, radius, limit=None, tags=None):
+        return self.__getPois("kindergartens", lat, lon, radius, limit, tags=tags)
 
-    def getChemists(self, lat, lon, radius):
-        rows = self.__executeQuery("""\
-            SELECT name, ST_AsGeoJSON(ST_Centroid(geom)), other_tags, ST_Distance(geom::geography, ST_MakePoint(%(lon)s, %(lat)s)::geography) as dist
-            FROM points
-            WHERE ST_DWithin(geom::geography, ST_MakePoint(%(lon)s, %(lat)s)::geography, %(radius)s, false)
-            AND other_tags like '%%"shop"=>"chemist"%%'
-            ORDER BY dist
-            """, {
-                "lat": lat,
-                "lon": lon,
-                "radius": radius
-            })
+    def getHospitals(self, lat, lon, radius, limit=None, tags=None):
+        return self.__getPois("hospitals", lat, lon, radius, limit, tags=tags)
 
-        result = list()
-        for row in rows:
-            result.append(self.__response_from_row(*row))
+    def getDoctors(self, lat, lon, radius, limit=None, tags=None):
+        return self.__getPois("doctors", lat, lon, radius, limit, tags=tags)
 
-        return result
 
-    def getConvenience(self, lat, lon, radius):
-        rows = self.__executeQuery("""\
-            SELECT name, ST_AsGeoJSON(ST_Centroid(geom)), other_tags, ST_Distance(geom::geography, ST_MakePoint(%(lon)s, %(lat)s)::geography) as dist
-            FROM points
-            WHERE ST_DWithin(geom::geography, ST_MakePoint(%(lon)s, %(lat)s)::geography, %(radius)s, false)
-            AND other_tags like '%%"shop"=>"convenience"%%'
-            ORDER BY dist
-            """, {
-                "lat": lat,
-                "lon": lon,
-                "radius": radius
-            })
+    def getRailwayStations(self, lat, lon, radius, limit=None, tags=None):
+        return self.__getPois("railway_stations", lat, lon, radius, limit, tags=tags)
 
-        result = list()
-        for row in rows:
-            result.append(self.__response_from_row(*row))
+    def getTramStations(self, lat, lon, radius, limit=None, tags=None):
+        return self.__getPois("tram_stations", lat, lon, radius, limit, tags=tags)
 
-        return result
-
-    def getSupermarket(self, lat, lon, radius):
-        rows = self.__executeQuery("""\
-            SELECT name, ST_AsGeoJSON(ST_Centroid(geom)), other_tags, ST_Distance(geom::geography, ST_MakePoint(%(lon)s, %(lat)s)::geography) as dist
-            FROM points
-            WHERE ST_DWithin(geom::geography, ST_MakePoint(%(lon)s, %(lat)s)::geography, %(radius)s, false)
-            AND other_tags like '%%"shop"=>"supermarket"%%'
-            ORDER BY dist
-            """, {
-                "lat": lat,
-                "lon": lon,
-                "radius": radius
-            })
-
-        result = list()
-        for row in rows:
-            result.append(self.__response_from_row(*row))
-
-        return result
-
-
-    def getSchools(self, lat, lon, radius):
-        rows = self.__executeQuery("""\
-            SELECT name, ST_AsGeoJSON(ST_Centroid(geom)), other_tags, ST_Distance(geom::geography, ST_MakePoint(%(lon)s, %(lat)s)::geography) as dist
-            FROM points
-            WHERE ST_DWithin(geom::geography, ST_MakePoint(%(lon)s, %(lat)s)::geography, %(radius)s, false)
-            AND other_tags like '%%"amenity"=>"school"%%'
-            ORDER BY dist
-            """, {
-                "lat": lat,
-                "lon": lon,
-                "radius": radius
-            })
-
-        result = list()
-        for row in rows:
-            result.append(self.__response_from_row(*row))
-
-        rows = self.__executeQuery("""\
-            SELECT name, ST_AsGeoJSON(ST_Centroid(geom)), other_tags, ST_Distance(geom::geography, ST_MakePoint(%(lon)s, %(lat)s)::geography) as dist
-            FROM other_relations
-            WHERE ST_DWithin(geom::geography, ST_MakePoint(%(lon)s, %(lat)s)::geography, %(radius)s, false)
-            AND other_tags like '%%"amenity"=>"school"%%'
-            ORDER BY dist
-            """, {
-                "lat": lat,
-                "lon": lon,
-                "radius": radius
-            })
-
-        for row in rows:
-            result.append(self.__response_from_row(*row))
+    def getBusStations(self, lat, lon, radius, limit=None, tags=None):
+        return self.__getPois("bus_stations", lat, lon, radius, limit, tags=tags)
 
-        return result
-
-    def getKindergarten(self, lat, lon, radius):
-        rows = self.__executeQuery("""\
-            SELECT name, ST_AsGeoJSON(ST_Centroid(geom)), other_tags, ST_Distance(geom::geography, ST_MakePoint(%(lon)s, %(lat)s)::geography) as dist
-            FROM points
-            WHERE ST_DWithin(geom::geography, ST_MakePoint(%(lon)s, %(lat)s)::geography, %(radius)s, false)
-            AND other_tags like '%%"amenity"=>"kindergarten"%%'
-            ORDER BY dist
-            """, {
-                "lat": lat,
-                "lon": lon,
-                "radius": radius
-            })
-
-        result = list()
-        for row in rows:
-            result.append(self.__response_from_row(*row))
 
-        rows = self.__executeQuery("""\
-            SELECT name, ST_AsGeoJSON(ST_Centroid(geom)), other_tags, ST_Distance(geom::geography, ST_MakePoint(%(lon)s, %(lat)s)::geography) as dist
-            FROM other_relations
-            WHERE ST_DWithin(geom::geography, ST_MakePoint(%(lon)s, %(lat)s)::geography, %(radius)s, false)
-            AND other_tags like '%%"amenity"=>"kindergarten"%%'
-            ORDER BY dist
-            """, {
-                "lat": lat,
-                "lon": lon,
-                "radius": radius
-            })
+    def getTile(self, z, x, y):
+        """Returns the Mapbox vector tile z/x/y with one layer per category drawn at zoom level `z`, empty bytes if there is none."""
+        parameters = tile_parameters(z, x, y)
+        if parameters is None:
+            return b""
 
-        for row in rows:
-            result.append(self.__response_from_row(*row))
+        rows = self.__executeQuery(TILE_QUERY, parameters, statement="tile")
+        return bytes(rows[0][0]) if rows and rows[0][0] is not None else b""
 
-        return result
+    def getCounts(self, lat, lon, radius, categories):
+        """Returns the number of items of each of the list categories within the radius, and the number of
+        areas per landuse type for relative_type_of_area.
 
-    def getHospitals(self, lat, lon, radius):
-        rows = self.__executeQuery("""\
-            SELECT name, ST_AsGeoJSON(ST_Centroid(geom)), other_tags, ST_Distance(geom::geography, ST_MakePoint(%(lon)s, %(lat)s)::geography) as dist
-            FROM points
-            WHERE ST_DWithin(geom::geography, ST_MakePoint(%(lon)s, %(lat)s)::geography, %(radius)s, false)
-            AND other_tags like '%%"amenity"=>"hospital"%%'
-            ORDER BY dist
-            """, {
-                "lat": lat,
-                "lon": lon,
-                "radius": radius
-            })
+        Point features are counted from the poi_grid cells completely inside the circle and checked
+        exactly only in the cells on its border, so the time hardly depends on the radius.
+        """
+        rows = []
+        if "parks" in categories or any(category in POI_CATEGORIES for category in categories):
+            name, query, parameters = counts_query(lat, lon, radius, categories)
+            rows = self.__executeQuery(query, parameters, statement=name)
 
-        result = list()
-        for row in rows:
-            result.append(self.__response_from_row(*row))
+        result = counts_from_rows(categories, rows)
+        if "relative_type_of_area" in categories:
+            result["relative_type_of_area"] = {landuse: item["count"] for landuse, item in self.getLanduse(lat, lon, radius).items()}
 
         return result
 
-    def getDoctors(self, lat, lon, radius):
-        rows = self.__executeQuery("""\
-            SELECT name, ST_AsGeoJSON(ST_Centroid(geom)), other_tags, ST_Distance(geom::geography, ST_MakePoint(%(lon)s, %(lat)s)::geography) as dist
-            FROM points
-            WHERE ST_DWithin(geom::geography, ST_MakePoint(%(lon)s, %(lat)s)::geography, %(radius)s, false)
-            AND other_tags like '%%"amenity"=>"doctors"%%'
-            ORDER BY dist
-            """, {
-                "lat": lat,
-                "lon": lon,
-                "radius": radius
-            })
-
-        result = list()
-        for row in rows:
-            result.append(self.__response_from_row(*row))
+    def getByTags(self, lat, lon, radius, tags, keys):
+        rows = self.__executeQuery(TAGS_QUERY, query_parameters(lat, lon, radius, tags=Json(tags), keys=list(keys)), name="tags")
+
+        return [response_from_row(*row) for row in rows]
+
+    def getNearest(self, category, lat, lon, k, max_radius=None):
+        """Returns the `k` items of a POI category or the parks closest to the point, none further away than `max_radius` meters if given."""
+        parameters = {"lat": lat, "lon": lon, "k": k, "candidates": 2 * k + 10, "max_radius": max_radius}
+
+        if category == "parks":
+            rows = self.__executeQuery(NEAREST_PARKS_QUERY, parameters, statement="nearest_parks")
+            return [park_from_row(*row) for row in rows]
+
+        rows = self.__executeQuery(NEAREST_POI_QUERIES[category], parameters, statement="nearest_poi_" + category, name="nearest_poi")
+        return [response_from_row(*row) for row in rows]
+
+    def __fullReportRows(self, lat, lon, radius, stream, categories, tags):
+        parameters = query_parameters(lat, lon, radius, selected_tags=tags)
+        query = self.__streamQuery if stream else self.__executeQuery
+
+        poi_categories = [category for category in categories if category in POI_CATEGORIES]
+        if poi_categories:
+            for row in query(FULL_REPORT_POI_QUERY, dict(parameters, categories=poi_categories), statement="full_report_poi"):
+                yield row[0], response_from_row(*row[1:6])
+
+        # Reports without landuse or without parks only run the query of the other one.
+        if "relative_type_of_area" in categories and "parks" in categories:
+            if self.landuse_clipped:
+                areas = query(FULL_REPORT_AREAS_CLIPPED_QUERY, parameters, statement="full_report_areas_clipped")
+            else:
+                areas = query(FULL_REPORT_AREAS_QUERY, parameters, statement="full_report_areas")
+
+            for row in areas:
+                if row[0] == 'landuse':
+                    yield "relative_type_of_area", {
+                        "landuse": row[1],
+                        "count": row[6],
+                        "total_area": row[7],
+                        "unit": "m^2"
+                    }
+                else:
+                    yield "parks", park_from_row(*row[1:6], row[7])
+        elif "relative_type_of_area" in categories:
+            for landuse, item in self.getLanduse(lat, lon, radius).items():
+                yield "relative_type_of_area", {"landuse": landuse, **item}
+        elif "parks" in categories:
+            for row in query(PARKS_QUERY, dict(parameters, limit=None), statement="parks"):
+                yield "parks", park_from_row(*row)
+
+    def getFullReport(self, lat, lon, radius, categories=None, tags=None):
+        """Returns the report of all or the given `categories`, each query of an unwanted category is skipped.
+        `tags` limits other_tags to these keys."""
+        categories = list(REPORT_CATEGORIES) if categories is None else categories
+        result = empty_report(categories)
+
+        for category, item in self.__fullReportRows(lat, lon, radius, False, categories, tags):
+            if category == "relative_type_of_area":
+                result[category][item.pop("landuse")] = item
+            else:
+                result[category].append(item)
 
         return result
 
+    def streamFullReport(self, lat, lon, radius, categories=None, tags=None):
+        """Yields (category, item) pairs of the full report while they are read from the database."""
+        return self.__fullReportRows(lat, lon, radius, True, list(REPORT_CATEGORIES) if categories is None else categories, tags)
+
+    def streamCategory(self, category, lat, lon, radius, limit=None):
+        """Yields the items of one report category while they are read from the database."""
+        if category in POI_CATEGORIES:
+            return self.__getPois(category, lat, lon, radius, limit, stream=True)
+
+        if category == "parks":
+            return self.getParks(lat, lon, radius, limit, stream=True)
+
+        return ({"landuse": landuse, **item} for landuse, item in self.getLanduse(lat, lon, radius).items())
+
+    def streamFeatures(self):
+        """Yields (category, lat, lon, name, tags as JSON, reach, area) for every feature of every report category.
+
+        `reach` is the largest distance in meters between the centroid and the geometry, `area` the
+        area reported for parks and landuse. Used to load the in-memory backend.
+        """
+        return self.__streamQuery("""\
+            SELECT category::text, ST_Y(geom), ST_X(geom), name, other_tags::text,
+                ST_Distance(geom::geography, ST_EndPoint(ST_LongestLine(geom, geog::geometry))::geography), NULL
+            FROM poi
+            UNION ALL
+            SELECT 'parks', ST_Y(ST_Centroid(geom)), ST_X(ST_Centroid(geom)), name, hstore_to_json(other_tags::hstore)::text,
+                ST_Distance(ST_Centroid(geom)::geography, ST_EndPoint(ST_LongestLine(ST_Centroid(geom), geom))::geography), ST_Area(geom)
+            FROM multipolygons
+            WHERE leisure like 'park'
+            UNION ALL
+            SELECT landuse, ST_Y(ST_Centroid(geom)), ST_X(ST_Centroid(geom)), name, hstore_to_json(other_tags::hstore)::text,
+                ST_Distance(ST_Centroid(geom)::geography, ST_EndPoint(ST_LongestLine(ST_Centroid(geom), geom))::geography), landuse_area
+            FROM multipolygons
+            WHERE landuse IN ('commercial', 'industrial', 'residential', 'retail')
+            """, None, name="features")
 
-    def getRailwayStations(self, lat, lon, radius):
-        rows = self.__executeQuery("""\
-            SELECT name, ST_AsGeoJSON(ST_Centroid(geom)), other_tags, ST_Distance(geom::geography, ST_MakePoint(%(lon)s, %(lat)s)::geography) as dist
-            FROM points
-            WHERE ST_DWithin(geom::geography, ST_MakePoint(%(lon)s, %(lat)s)::geography, %(radius)s, false)
-            AND other_tags like '%%"railway"=>"station"%%'
-            ORDER BY dist
-            """, {
-                "lat": lat,
-                "lon": lon,
-                "radius": radius
-            })
-
+    def getBatchReports(self, items, chunk_size=100):
+        """Returns one full report per (lat, lon, radius, categories) item, restricted to the given categories."""
         result = list()
-        for row in rows:
-            result.append(self.__response_from_row(*row))
+        for start in range(0, len(items), chunk_size):
+            result.extend(self.__getBatchChunk(items[start:start + chunk_size]))
 
         return result
 
-    def getTramStations(self, lat, lon, radius):
-        rows = self.__executeQuery("""\
-            SELECT name, ST_AsGeoJSON(ST_Centroid(geom)), other_tags, ST_Distance(geom::geography, ST_MakePoint(%(lon)s, %(lat)s)::geography) as dist
-            FROM points
-            WHERE ST_DWithin(geom::geography, ST_MakePoint(%(lon)s, %(lat)s)::geography, %(radius)s, false)
-            AND other_tags like '%%"railway"=>"tram_stop"%%'
-            ORDER BY dist
-            """, {
-                "lat": lat,
-                "lon": lon,
-                "radius": radius
-            })
-
-        result = list()
-        for row in rows:
-            result.append(self.__response_from_row(*row))
+    def __getBatchChunk(self, items):
+        reports = list()
+        parameters = {
+            "items": [],
+            "lats": [],
+            "lons": [],
+            "radii": [],
+            "wests": [],
+            "souths": [],
+            "easts": [],
+            "norths": [],
+            "poi_categories": [],
+            "area_categories": []
+        }
 
-        return result
+        for item, (lat, lon, radius, categories) in enumerate(items):
+            reports.append(empty_report(categories))
+
+            bounds = query_parameters(lat, lon, radius)
+            parameters["items"].append(item)
+            parameters["lats"].append(lat)
+            parameters["lons"].append(lon)
+            parameters["radii"].append(radius)
+            parameters["wests"].append(bounds["west"])
+            parameters["souths"].append(bounds["south"])
+            parameters["easts"].append(bounds["east"])
+            parameters["norths"].append(bounds["north"])
+            parameters["poi_categories"].append(",".join(category for category in categories if category in POI_CATEGORIES))
+            parameters["area_categories"].append(",".join(category for category in categories if category not in POI_CATEGORIES))
 
-    def getBusStations(self, lat, lon, radius):
         rows = self.__executeQuery("""\
-            SELECT name, ST_AsGeoJSON(ST_Centroid(geom)), other_tags, ST_Distance(geom::geography, ST_MakePoint(%(lon)s, %(lat)s)::geography) as dist
-            FROM points
-            WHERE ST_DWithin(geom::geography, ST_MakePoint(%(lon)s, %(lat)s)::geography, %(radius)s, false)
-            AND highway = 'bus_stop'
-            ORDER BY dist
-            """, {
-                "lat": lat,
-                "lon": lon,
-                "radius": radius
-            })
+            WITH centers AS (
+                SELECT item, ST_MakePoint(lon, lat)::geography AS center, radius, ST_MakeEnvelope(west, south, east, north, 4326) AS bounds,
+                    string_to_array(poi_categories, ',')::poi_category[] AS poi_categories, string_to_array(area_categories, ',') AS area_categories
+                FROM unnest(%(items)s::int[], %(lats)s::float8[], %(lons)s::float8[], %(radii)s::float8[],
+                    %(wests)s::float8[], %(souths)s::float8[], %(easts)s::float8[], %(norths)s::float8[],
+                    %(poi_categories)s::text[], %(area_categories)s::text[])
+                    AS centers(item, lat, lon, radius, west, south, east, north, poi_categories, area_categories)
+            )
+            SELECT centers.item, poi.category::text, poi.name, ST_Y(poi.geom), ST_X(poi.geom), poi.other_tags, ST_Distance(poi.geog, centers.center) as dist, NULL, NULL
+            FROM centers
+            CROSS JOIN LATERAL (
+                SELECT category, name, geom, geog, other_tags
+                FROM poi
+                WHERE category = ANY(centers.poi_categories)
+                AND ST_DWithin(geog, centers.center, centers.radius, false)
+            ) AS poi
+            UNION ALL
+            SELECT centers.item, 'relative_type_of_area', landuse.landuse, NULL, NULL, NULL, NULL as dist, landuse.count, landuse.area
+            FROM centers
+            CROSS JOIN LATERAL (
+                SELECT landuse, count(id) AS count, {area} AS area
+                FROM multipolygons
+                {join}
+                WHERE landuse IN ('commercial', 'industrial', 'residential', 'retail')
+                AND ST_DWithin(geog, centers.center, centers.radius, false)
+                GROUP BY landuse
+            ) AS landuse
+            WHERE 'relative_type_of_area' = ANY(centers.area_categories)
+            UNION ALL
+            SELECT centers.item, 'parks', parks.name, ST_Y(ST_Centroid(parks.geom)), ST_X(ST_Centroid(parks.geom)), hstore_to_jsonb(parks.other_tags::hstore), ST_Distance(parks.geog, centers.center) as dist, NULL, ST_Area(parks.geom)
+            FROM centers
+            CROSS JOIN LATERAL (
+                SELECT name, geom, geog, other_tags
+                FROM multipolygons
+                WHERE leisure like 'park'
+                AND geom && centers.bounds
+                AND ST_DWithin(geog, centers.center, centers.radius, false)
+            ) AS parks
+            WHERE 'parks' = ANY(centers.area_categories)
+            ORDER BY 1, dist
+            """.format(area=LANDUSE_CLIPPED_AREA if self.landuse_clipped else LANDUSE_AREA,
+                       join=BATCH_CLIP_JOIN if self.landuse_clipped else ""), parameters, name="batch")
 
-        result = list()
         for row in rows:
-            result.append(self.__response_from_row(*row))
-
-        return result
+            report = reports[row[0]]
+            if row[1] == 'relative_type_of_area':
+                report["relative_type_of_area"][row[2]] = {
+                    "count": row[7],
+                    "total_area": row[8],
+                    "unit": "m^2"
+                }
+            elif row[1] == 'parks':
+                report["parks"].append(park_from_row(*row[2:7], row[8]))
+            else:
+                report[row[1]].append(response_from_row(*row[2:7]))
+
+        return reports
@@ -0,0 +1,207 @@
+import threading
+import time
+from collections import OrderedDict
+
+from geohash_grid import distance
+from osm_service import REPORT_CATEGORIES, select_tags
+
+RESULT_KEYS = {method: key for key, method in REPORT_CATEGORIES.items()}
+
+
+class ReportCache:
+    """In-process LRU cache in front of an OsmService.
+
+    Results are keyed on the method, the center snapped to `precision` decimal
+    places and the radius. The distances of a cached result are measured from
+    the center it was computed for, so it only answers requests whose center
+    lies within `max_offset` meters of that one; distances and the radius
+    filter are off by at most that much. A cached result for a larger radius
+    around the same center answers smaller radii by filtering on the `distance`
+    of every row; single categories are also answered from cached full
+    reports. Landuse aggregates cannot be filtered and are only reused for the
+    exact radius. Results are always cached complete, a `limit`, a selection of
+    categories and of other_tags keys are applied afterwards.
+
+    The cache holds at most `max_rows` result rows, which bounds the number of
+    items but not their size in bytes: a park with many other_tags takes more
+    memory than a bus stop. It drops entries after `ttl` seconds and is cleared
+    whenever the data version written by the import changes, which is checked
+    every `version_check_interval` seconds. Cached results are shared between
+    requests and must not be modified.
+    """
+
+    def __init__(self, osm, max_rows, ttl, precision, version_check_interval, max_offset=1.0):
+        self.osm = osm
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self.precision = precision
+        self.version_check_interval = version_check_interval
+        self.max_offset = max_offset
+
+        self.__lock = threading.Lock()
+        self.__entries = OrderedDict()
+        self.__radii = {}
+        self.__rows = 0
+
+        self.__version = None
+        self.__versionCheckedAt = None
+
+    def __getattr__(self, name):
+        attribute = getattr(self.osm, name)
+        if name not in RESULT_KEYS:
+            return attribute
+
+        if name == REPORT_CATEGORIES["relative_type_of_area"]:
+            return lambda lat, lon, radius: self.__getExact(name, lat, lon, radius, attribute)
+
+        return lambda lat, lon, radius, limit=None, tags=None: select_tags(self.__getList(name, lat, lon, radius, attribute)[:limit], tags)
+
+    def __checkVersion(self):
+        now = time.monotonic()
+        with self.__lock:
+            if self.__versionCheckedAt is not None and now - self.__versionCheckedAt < self.version_check_interval:
+                return
+            self.__versionCheckedAt = now
+
+        version = self.osm.getDataVersion()
+        with self.__lock:
+            if version != self.__version:
+                self.__entries.clear()
+                self.__radii.clear()
+                self.__rows = 0
+                self.__version = version
+
+    def __center(self, name, lat, lon):
+        return name, round(lat, self.precision), round(lon, self.precision)
+
+    def __lookup(self, name, lat, lon, radius, exact=False):
+        center = self.__center(name, lat, lon)
+        now = time.monotonic()
+
+        with self.__lock:
+            radii = self.__radii.get(center, ())
+            if exact:
+                radii = [radius] if radius in radii else []
+            else:
+                radii = sorted(cached_radius for cached_radius in radii if cached_radius >= radius)
+
+            for cached_radius in radii:
+                key = center + (cached_radius,)
+                expires_at, result, _, cached_lat, cached_lon = self.__entries[key]
+                if expires_at < now:
+                    self.__remove(key)
+                    continue
+                if distance(lat, lon, cached_lat, cached_lon) > self.max_offset:
+                    continue
+
+                self.__entries.move_to_end(key)
+                return result, cached_radius
+
+        return None, None
+
+    def __remove(self, key):
+        _, _, size, _, _ = self.__entries.pop(key)
+        self.__rows -= size
+
+        center, radius = key[:3], key[3]
+        self.__radii[center].discard(radius)
+        if not self.__radii[center]:
+            del self.__radii[center]
+
+    def __store(self, name, lat, lon, radius, result):
+        center = self.__center(name, lat, lon)
+        key = center + (radius,)
+
+        if isinstance(result, list):
+            size = max(len(result), 1)
+        elif name == "getFullReport":
+            size = max(sum(len(value) for value in result.values()), 1)
+        else:
+            size = 1
+
+        if size > self.max_rows:
+            return
+
+        with self.__lock:
+            if key in self.__entries:
+                self.__remove(key)
+
+            self.__entries[key] = (time.monotonic() + self.ttl, result, size, lat, lon)
+            self.__radii.setdefault(center, set()).add(radius)
+            self.__rows += size
+
+            while self.__rows > self.max_rows:
+                self.__remove(next(iter(self.__entries)))
+
+    def __within(self, rows, radius):
+        return [row for row in rows if row["distance"] <= radius]
+
+    def __getExact(self, name, lat, lon, radius, compute):
+        self.__checkVersion()
+
+        cached, _ = self.__lookup(name, lat, lon, radius, exact=True)
+        if cached is not None:
+            return cached
+
+        result = compute(lat, lon, radius)
+        self.__store(name, lat, lon, radius, result)
+        return result
+
+    def __getList(self, name, lat, lon, radius, compute):
+        self.__checkVersion()
+
+        cached, cached_radius = self.__lookup(name, lat, lon, radius)
+        if cached is None:
+            report, cached_radius = self.__lookup("getFullReport", lat, lon, radius)
+            if report is not None:
+                cached = report[RESULT_KEYS[name]]
+
+        if cached is None:
+            result = compute(lat, lon, radius)
+            self.__store(name, lat, lon, radius, result)
+            return result
+
+        return cached if cached_radius == radius else self.__within(cached, radius)
+
+    def getFullReport(self, lat, lon, radius, categories=None, tags=None):
+        self.__checkVersion()
+
+        cached, cached_radius = self.__lookup("getFullReport", lat, lon, radius)
+        if cached is None and categories is not None:
+            return self.__getSelected(lat, lon, radius, categories, tags)
+
+        if cached is None:
+            result = self.osm.getFullReport(lat, lon, radius)
+            self.__store("getFullReport", lat, lon, radius, result)
+        elif cached_radius == radius:
+            result = cached
+        else:
+            result = {key: self.__within(value, radius) for key, value in cached.items() if key != "relative_type_of_area"}
+            result["relative_type_of_area"] = self.getLanduse(lat, lon, radius)
+
+        if categories is None and tags is None:
+            return result
+
+        return {key: result[key] if key == "relative_type_of_area" else select_tags(result[key], tags)
+                for key in (REPORT_CATEGORIES if categories is None else categories)}
+
+    def __getSelected(self, lat, lon, radius, categories, tags):
+        """Answers a report on the selected categories from the cached ones and computes the others with a single full report."""
+        result = {}
+        missing = []
+        for key in categories:
+            name = REPORT_CATEGORIES[key]
+            cached, cached_radius = self.__lookup(name, lat, lon, radius, exact=key == "relative_type_of_area")
+            if cached is None:
+                missing.append(key)
+            else:
+                result[key] = cached if cached_radius == radius else self.__within(cached, radius)
+
+        if missing:
+            # Computed with all other_tags, so every category is cached complete on its own.
+            computed = self.osm.getFullReport(lat, lon, radius, categories=missing)
+            for key in missing:
+                self.__store(REPORT_CATEGORIES[key], lat, lon, radius, computed[key])
+                result[key] = computed[key]
+
+        return {key: result[key] if key == "relative_type_of_area" else select_tags(result[key], tags) for key in categories}
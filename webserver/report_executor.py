@@ -0,0 +1,83 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from osm_service import REPORT_CATEGORIES
+
+
+class ReportTimeoutError(Exception):
+    pass
+
+
+class ConcurrentReportExecutor:
+    """Runs the category queries of a full report in parallel.
+
+    All requests share one bounded thread pool of `max_workers` threads. Every
+    thread can hold a database connection, so `max_workers` has to stay below
+    the size of the connection pool to leave connections for the other
+    requests. A single report never has more than `max_parallelism` queries in
+    flight, and the whole report has to finish within `timeout` seconds. A
+    service with a `deadline()` lets the database cancel the queries still
+    running by then, so they free their connections and threads; queries not
+    yet started are cancelled here. Every other method is passed through to
+    the wrapped service.
+    """
+
+    def __init__(self, osm, max_workers, max_parallelism, timeout):
+        self.osm = osm
+        self.max_workers = max_workers
+        self.max_parallelism = max_parallelism
+        self.timeout = timeout
+
+        self.__lock = threading.Lock()
+        self.__executor = None
+        self.__pid = None
+
+    def __getattr__(self, name):
+        return getattr(self.osm, name)
+
+    def __getExecutor(self):
+        pid = os.getpid()
+        if self.__executor is None or self.__pid != pid:
+            with self.__lock:
+                if self.__executor is None or self.__pid != pid:
+                    self.__executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="report")
+                    self.__pid = pid
+
+        return self.__executor
+
+    def __runUntil(self, deadline, method, *args, **kwargs):
+        with self.osm.deadline(deadline):
+            return method(*args, **kwargs)
+
+    def getFullReport(self, lat, lon, radius, categories=None, tags=None):
+        executor = self.__getExecutor()
+        deadline = time.monotonic() + self.timeout
+        slots = threading.BoundedSemaphore(self.max_parallelism)
+
+        futures = {}
+        try:
+            for key in REPORT_CATEGORIES if categories is None else categories:
+                if not slots.acquire(timeout=max(deadline - time.monotonic(), 0)):
+                    raise ReportTimeoutError("full report did not finish within %s seconds" % self.timeout)
+
+                # Landuse aggregates have no other_tags.
+                arguments = {} if key == "relative_type_of_area" else {"tags": tags}
+                method = getattr(self.osm, REPORT_CATEGORIES[key])
+                if hasattr(self.osm, "deadline"):
+                    future = executor.submit(self.__runUntil, deadline, method, lat, lon, radius, **arguments)
+                else:
+                    future = executor.submit(method, lat, lon, radius, **arguments)
+                future.add_done_callback(lambda _: slots.release())
+                futures[key] = future
+
+            done, pending = wait(futures.values(), timeout=max(deadline - time.monotonic(), 0))
+            if pending:
+                raise ReportTimeoutError("full report did not finish within %s seconds" % self.timeout)
+
+            return {key: future.result() for key, future in futures.items()}
+        except:
+            for future in futures.values():
+                future.cancel()
+            raise
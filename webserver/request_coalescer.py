@@ -0,0 +1,133 @@
+import asyncio
+import copy
+import threading
+
+from osm_service import REPORT_CATEGORIES
+from report_executor import ReportTimeoutError
+
+# The methods returning a result for a point, the same ones the ReportCache caches, and the reports built of them.
+COALESCED_METHODS = frozenset(REPORT_CATEGORIES.values()) | {"getFullReport", "getCounts", "getByTags", "getNearest"}
+
+
+def request_key(name, args, kwargs):
+    """A hashable key of a call, with lists turned into tuples and dicts into sorted tuples of their items."""
+    def freeze(value):
+        if isinstance(value, list):
+            return tuple(value)
+        if isinstance(value, dict):
+            return tuple(sorted(value.items()))
+        return value
+
+    return (name,) + tuple(freeze(value) for value in args) + tuple(sorted((key, freeze(value)) for key, value in kwargs.items()))
+
+
+class CoalescedRequestError(Exception):
+    """Raised in a waiting request if the exception of the shared computation cannot be copied."""
+
+
+def copy_error(error):
+    """A copy of the exception of a shared computation for one waiting request, with the original as its cause.
+
+    Every waiting request raises an exception of its own, so their tracebacks
+    do not get mixed up and handlers cannot change the exception of the others.
+    """
+    try:
+        copied = copy.copy(error)
+    except Exception:
+        copied = CoalescedRequestError("identical request failed: %r" % error)
+
+    copied.__cause__ = error
+    return copied
+
+
+class Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class RequestCoalescer:
+    """Lets concurrent identical requests share one computation.
+
+    The first call of a method in COALESCED_METHODS with a combination of
+    arguments runs it on the wrapped service, every identical call arriving
+    before it finished waits for its result instead of querying the database
+    again. An exception of the running call is raised in every waiting one as
+    a copy of its own, and a waiting request gives up with a ReportTimeoutError after `timeout` seconds. Results
+    are shared between requests and must not be modified. Every other method is
+    passed through to the wrapped service.
+    """
+
+    def __init__(self, osm, timeout):
+        self.osm = osm
+        self.timeout = timeout
+
+        self.__lock = threading.Lock()
+        self.__flights = {}
+
+    def __getattr__(self, name):
+        attribute = getattr(self.osm, name)
+        if name not in COALESCED_METHODS:
+            return attribute
+
+        return lambda *args, **kwargs: self.__call(request_key(name, args, kwargs), attribute, args, kwargs)
+
+    def __call(self, key, method, args, kwargs):
+        with self.__lock:
+            flight = self.__flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.__flights[key] = Flight()
+
+        if not leader:
+            if not flight.done.wait(self.timeout):
+                raise ReportTimeoutError("identical request did not finish within %s seconds" % self.timeout)
+            if flight.error is not None:
+                raise copy_error(flight.error)
+            return flight.result
+
+        try:
+            flight.result = method(*args, **kwargs)
+            return flight.result
+        except BaseException as error:
+            flight.error = error
+            raise
+        finally:
+            with self.__lock:
+                del self.__flights[key]
+            flight.done.set()
+
+
+class AsyncRequestCoalescer:
+    """The RequestCoalescer of the AsyncOsmService.
+
+    The computation runs in its own task, so a client that disconnects only
+    cancels its own wait and not the request of the others.
+    """
+
+    def __init__(self, osm, timeout):
+        self.osm = osm
+        self.timeout = timeout
+
+        self.__tasks = {}
+
+    def __getattr__(self, name):
+        attribute = getattr(self.osm, name)
+        if name not in COALESCED_METHODS:
+            return attribute
+
+        return lambda *args, **kwargs: self.__call(request_key(name, args, kwargs), attribute, args, kwargs)
+
+    async def __call(self, key, method, args, kwargs):
+        task = self.__tasks.get(key)
+        if task is None:
+            task = self.__tasks[key] = asyncio.ensure_future(method(*args, **kwargs))
+            task.add_done_callback(lambda _: self.__tasks.pop(key, None))
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), self.timeout)
+        except asyncio.TimeoutError:
+            raise ReportTimeoutError("identical request did not finish within %s seconds" % self.timeout)
+        except Exception as error:
+            raise copy_error(error)
@@ -0,0 +1,705 @@
+# Fix Cannot import name 'cached_property': https://stackoverflow.com/a/60157748/3593881
+import werkzeug
+werkzeug.cached_property = werkzeug.utils.cached_property
+import json
+from itertools import chain
+from contextlib import nullcontext
+from flask import Flask, Response, current_app, make_response, request, stream_with_context
+from flask.json import jsonify
+from psycopg2.extensions import QueryCanceledError
+from werkzeug.local import LocalProxy
+from admission import AdmissionRejectedError
+from metrics import SERIALIZATION_DURATION, render as renderMetrics
+from osm_service import NEAREST_CATEGORIES, REPORT_CATEGORIES
+from report_executor import ReportTimeoutError
+from flask_restplus import Api, Resource, fields, inputs, reqparse
+from flask_restplus.representations import output_json as restplus_output_json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# The settings, routes and API documentation shared by webserver.py and asgi.py. Importing this module neither
+# connects to the database nor loads any data; webserver.py creates the services and stores them in app.extensions.
+app = Flask(__name__)
+app.config.from_envvar('SETTINGS_FILE')
+
+osm = LocalProxy(lambda: current_app.extensions["osm"])
+
+api = Api(app, version='1.0', title='OSM Service API',
+    description='Documentation for the OSM Service API.')
+
+@api.representation('application/json')
+def output_json(data, code, headers=None):
+    with SERIALIZATION_DURATION.time(endpoint=request.endpoint):
+        if orjson is None:
+            return restplus_output_json(data, code, headers)
+
+        response = make_response(orjson.dumps(data), code)
+        response.headers.extend(headers or {})
+        response.mimetype = 'application/json'
+        return response
+
+
+@app.route('/metrics')
+def metrics():
+    """Metrics of this worker process in the Prometheus text format."""
+    return Response(renderMetrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+ns = api.namespace('relative', description='Operations for getting data relative to a given point')
+
+summary_parser = reqparse.RequestParser()
+summary_parser.add_argument('summary', choices=('counts',), location='args',
+                            help='With summary=counts only the number of results is returned, counted from a precomputed grid.')
+
+
+
+def categoryList(value):
+    categories = [category for category in value.split(",") if category]
+    unknown = [category for category in categories if category not in REPORT_CATEGORIES]
+    if unknown:
+        raise ValueError("unknown categories: %s" % ", ".join(unknown))
+
+    return categories
+
+
+def tagList(value):
+    return [tag for tag in value.split(",") if tag]
+
+
+def selectCategories(include, exclude):
+    """The report categories in `include` or all of them, without those in `exclude`; None if neither is given.
+
+    Raises a ValueError if no category is left, like an unknown category name.
+    """
+    if include is None and exclude is None:
+        return None
+
+    categories = [category for category in REPORT_CATEGORIES if (include is None or category in include) and category not in (exclude or [])]
+    if not categories:
+        raise ValueError("include and exclude leave no category")
+
+    return categories
+
+
+def rejectedResponse(error):
+    response = make_response(jsonify(message="the service is busy with expensive requests, retry later"), error.status)
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response
+
+
+report_parser = summary_parser.copy()
+report_parser.add_argument('include', type=categoryList, location='args',
+                           help='Comma separated categories of the report, e.g. include=supermarkets,parks. All by default.')
+report_parser.add_argument('exclude', type=categoryList, location='args', help='Comma separated categories left out of the report.')
+report_parser.add_argument('tags', type=tagList, location='args',
+                           help='Comma separated keys of other_tags to return, e.g. tags=opening_hours,website. All by default, none if empty.')
+
+limit_parser = summary_parser.copy()
+limit_parser.add_argument('limit', type=inputs.positive, location='args', help='Return at most this many of the closest results.')
+
+
+def wantsStream():
+    """Whether the client asked for newline delimited JSON via `?stream=1` or the Accept header."""
+    return request.args.get("stream") in ("1", "true") or \
+        request.accept_mimetypes.best_match(["application/json", "application/x-ndjson"]) == "application/x-ndjson"
+
+
+def streamResponse(items):
+    """Streams every item as one line of JSON while it is read from the database."""
+    items = iter(items)
+    # Run the query before answering, so that database errors still result in a 500.
+    first = next(items, None)
+    if first is not None:
+        items = chain([first], items)
+
+    if orjson is not None:
+        lines = (orjson.dumps(item) + b"\n" for item in items)
+    else:
+        lines = (json.dumps(item) + "\n" for item in items)
+
+    return Response(stream_with_context(lines), mimetype="application/x-ndjson")
+
+
+@ns.route('/<float:latitude>,<float:longitude>/<int:radius>')
+class FullReport(Resource):
+    @api.doc(responses={200: 'OK', 400: 'Bad Request', 429: 'Too Many Requests', 500: 'Internal Server Error', 503: 'Service Unavailable',
+                        504: 'Gateway Timeout'},
+             params={'latitude': 'Specify the latitude associated with the point.',
+                     'longitude': 'Specify the longitude associated with the point.',
+                     'radius': 'Specify the radius (meters) covering the circular region of interest around the point '
+                               '(coordinate) described by the latitude and longitude.'})
+    @ns.expect(report_parser)
+    def get(self, latitude, longitude, radius):
+        """Returns the full report: Landuse, Parking, Chemists, Convenience Stores, Supermarkets, Malls, Schools, Kindergartens, Hospitals, Doctors, Railway Stations, Tram Stations, Bus Stations within a radius around a point described by the given latitude and longitude."""
+        args = report_parser.parse_args()
+        try:
+            categories = selectCategories(args['include'], args['exclude'])
+        except ValueError as error:
+            return {"message": str(error)}, 400
+
+        try:
+            if args['summary'] == 'counts':
+                return {
+                    "input": {
+                        "center": {
+                            "lat": latitude,
+                            "lon": longitude
+                        },
+                        "radius": radius
+                    },
+                    "result": osm.getCounts(latitude, longitude, radius, list(REPORT_CATEGORIES) if categories is None else categories)
+                }, 200
+
+            if wantsStream():
+                return streamResponse({"category": category, "item": item} for category, item in osm.streamFullReport(latitude, longitude, radius, categories, args['tags']))
+
+            return {
+                "input": {
+                    "center": {
+                        "lat": latitude,
+                        "lon": longitude
+                    },
+                    "radius": radius
+                },
+                "result": osm.getFullReport(latitude, longitude, radius, categories, args['tags'])
+            }, 200
+        except (ReportTimeoutError, QueryCanceledError):
+            app.logger.warning("%s timed out", request.path)
+            return "", 504
+        except Exception:
+            app.logger.exception("%s failed", request.path)
+            return "", 500
+
+
+@ns.route('/<float:latitude>,<float:longitude>/<int:radius>/malls')
+class MallReport(Resource):
+    @api.doc(responses={200: 'OK', 400: 'Bad Request', 500: 'Internal Server Error', 504: 'Gateway Timeout'},
+             params={'latitude': 'Specify the latitude associated with the point.',
+                     'longitude': 'Specify the longitude associated with the point.',
+                     'radius': 'Specify the radius (meters) covering the circular region of interest around the point '
+                               '(coordinate) described by the latitude and longitude.'})
+    @ns.expect(limit_parser)
+    def get(self, latitude, longitude, radius):
+        """Returns the Malls within a radius around a point described by the given latitude and longitude."""
+        args = limit_parser.parse_args()
+        limit = args['limit']
+        try:
+            if args['summary'] == 'counts':
+                return osm.getCounts(latitude, longitude, radius, ["malls"]), 200
+
+            if wantsStream():
+                return streamResponse(osm.streamCategory("malls", latitude, longitude, radius, limit))
+
+            return osm.getMalls(latitude, longitude, radius, limit), 200
+        except (ReportTimeoutError, QueryCanceledError):
+            app.logger.warning("%s timed out", request.path)
+            return "", 504
+        except Exception:
+            app.logger.exception("%s failed", request.path)
+            return "", 500
+
+
+@ns.route('/<float:latitude>,<float:longitude>/<int:radius>/chemists')
+class ChemistReport(Resource):
+    @api.doc(responses={200: 'OK', 400: 'Bad Request', 500: 'Internal Server Error', 504: 'Gateway Timeout'},
+             params={'latitude': 'Specify the latitude associated with the point.',
+                     'longitude': 'Specify the longitude associated with the point.',
+                     'radius': 'Specify the radius (meters) covering the circular region of interest around the point '
+                               '(coordinate) described by the latitude and longitude.'})
+    @ns.expect(limit_parser)
+    def get(self, latitude, longitude, radius):
+        """Returns the Chemists within a radius around a point described by the given latitude and longitude."""
+        args = limit_parser.parse_args()
+        limit = args['limit']
+        try:
+            if args['summary'] == 'counts':
+                return osm.getCounts(latitude, longitude, radius, ["chemists"]), 200
+
+            if wantsStream():
+                return streamResponse(osm.streamCategory("chemists", latitude, longitude, radius, limit))
+
+            return osm.getChemists(latitude, longitude, radius, limit), 200
+        except (ReportTimeoutError, QueryCanceledError):
+            app.logger.warning("%s timed out", request.path)
+            return "", 504
+        except Exception:
+            app.logger.exception("%s failed", request.path)
+            return "", 500
+
+
+@ns.route('/<float:latitude>,<float:longitude>/<int:radius>/convenience')
+class ConvenienceReport(Resource):
+    @api.doc(responses={200: 'OK', 400: 'Bad Request', 500: 'Internal Server Error', 504: 'Gateway Timeout'},
+             params={'latitude': 'Specify the latitude associated with the point.',
+                     'longitude': 'Specify the longitude associated with the point.',
+                     'radius': 'Specify the radius (meters) covering the circular region of interest around the point '
+                               '(coordinate) described by the latitude and longitude.'})
+    @ns.expect(limit_parser)
+    def get(self, latitude, longitude, radius):
+        """Returns the Convenience Stores within a radius around a point described by the given latitude and longitude."""
+        args = limit_parser.parse_args()
+        limit = args['limit']
+        try:
+            if args['summary'] == 'counts':
+                return osm.getCounts(latitude, longitude, radius, ["convenience"]), 200
+
+            if wantsStream():
+                return streamResponse(osm.streamCategory("convenience", latitude, longitude, radius, limit))
+
+            return osm.getConvenience(latitude, longitude, radius, limit), 200
+        except (ReportTimeoutError, QueryCanceledError):
+            app.logger.warning("%s timed out", request.path)
+            return "", 504
+        except Exception:
+            app.logger.exception("%s failed", request.path)
+            return "", 500
+
+
+@ns.route('/<float:latitude>,<float:longitude>/<int:radius>/supermarkets')
+class SupermarketReport(Resource):
+    @api.doc(responses={200: 'OK', 400: 'Bad Request', 500: 'Internal Server Error', 504: 'Gateway Timeout'},
+             params={'latitude': 'Specify the latitude associated with the point.',
+                     'longitude': 'Specify the longitude associated with the point.',
+                     'radius': 'Specify the radius (meters) covering the circular region of interest around the point '
+                               '(coordinate) described by the latitude and longitude.'})
+    @ns.expect(limit_parser)
+    def get(self, latitude, longitude, radius):
+        """Returns the Supermarkets within a radius around a point described by the given latitude and longitude."""
+        args = limit_parser.parse_args()
+        limit = args['limit']
+        try:
+            if args['summary'] == 'counts':
+                return osm.getCounts(latitude, longitude, radius, ["supermarkets"]), 200
+
+            if wantsStream():
+                return streamResponse(osm.streamCategory("supermarkets", latitude, longitude, radius, limit))
+
+            return osm.getSupermarket(latitude, longitude, radius, limit), 200
+        except (ReportTimeoutError, QueryCanceledError):
+            app.logger.warning("%s timed out", request.path)
+            return "", 504
+        except Exception:
+            app.logger.exception("%s failed", request.path)
+            return "", 500
+
+
+@ns.route('/<float:latitude>,<float:longitude>/<int:radius>/landuse')
+class LanduseReport(Resource):
+    @api.doc(responses={200: 'OK', 500: 'Internal Server Error', 504: 'Gateway Timeout'},
+             params={'latitude': 'Specify the latitude associated with the point.',
+                     'longitude': 'Specify the longitude associated with the point.',
+                     'radius': 'Specify the radius (meters) covering the circular region of interest around the point '
+                               '(coordinate) described by the latitude and longitude.'})
+    def get(self, latitude, longitude, radius):
+        """Returns the Landuse within a radius around a point described by the given latitude and longitude."""
+        try:
+            if wantsStream():
+                return streamResponse(osm.streamCategory("relative_type_of_area", latitude, longitude, radius))
+
+            return osm.getLanduse(latitude, longitude, radius), 200
+        except (ReportTimeoutError, QueryCanceledError):
+            app.logger.warning("%s timed out", request.path)
+            return "", 504
+        except Exception:
+            app.logger.exception("%s failed", request.path)
+            return "", 500
+
+
+@ns.route('/<float:latitude>,<float:longitude>/<int:radius>/parking')
+class ParkingReport(Resource):
+    @api.doc(responses={200: 'OK', 400: 'Bad Request', 500: 'Internal Server Error', 504: 'Gateway Timeout'},
+             params={'latitude': 'Specify the latitude associated with the point.',
+                     'longitude': 'Specify the longitude associated with the point.',
+                     'radius': 'Specify the radius (meters) covering the circular region of interest around the point '
+                               '(coordinate) described by the latitude and longitude.'})
+    @ns.expect(limit_parser)
+    def get(self, latitude, longitude, radius):
+        """Returns car parks within a radius around a point described by the given latitude and longitude."""
+        args = limit_parser.parse_args()
+        limit = args['limit']
+        try:
+            if args['summary'] == 'counts':
+                return osm.getCounts(latitude, longitude, radius, ["parking"]), 200
+
+            if wantsStream():
+                return streamResponse(osm.streamCategory("parking", latitude, longitude, radius, limit))
+
+            return osm.getParking(latitude, longitude, radius, limit), 200
+        except (ReportTimeoutError, QueryCanceledError):
+            app.logger.warning("%s timed out", request.path)
+            return "", 504
+        except Exception:
+            app.logger.exception("%s failed", request.path)
+            return "", 500
+
+
+@ns.route('/<float:latitude>,<float:longitude>/<int:radius>/parks')
+class ParkReport(Resource):
+    @api.doc(responses={200: 'OK', 400: 'Bad Request', 500: 'Internal Server Error', 504: 'Gateway Timeout'},
+             params={'latitude': 'Specify the latitude associated with the point.',
+                     'longitude': 'Specify the longitude associated with the point.',
+                     'radius': 'Specify the radius (meters) covering the circular region of interest around the point '
+                               '(coordinate) described by the latitude and longitude.'})
+    @ns.expect(limit_parser)
+    def get(self, latitude, longitude, radius):
+        """Returns parks within a radius around a point described by the given latitude and longitude."""
+        args = limit_parser.parse_args()
+        limit = args['limit']
+        try:
+            if args['summary'] == 'counts':
+                return osm.getCounts(latitude, longitude, radius, ["parks"]), 200
+
+            if wantsStream():
+                return streamResponse(osm.streamCategory("parks", latitude, longitude, radius, limit))
+
+            return osm.getParks(latitude, longitude, radius, limit), 200
+        except (ReportTimeoutError, QueryCanceledError):
+            app.logger.warning("%s timed out", request.path)
+            return "", 504
+        except Exception:
+            app.logger.exception("%s failed", request.path)
+            return "", 500
+
+
+@ns.route('/<float:latitude>,<float:longitude>/<int:radius>/schools')
+class SchoolReport(Resource):
+    @api.doc(responses={200: 'OK', 400: 'Bad Request', 500: 'Internal Server Error', 504: 'Gateway Timeout'},
+             params={'latitude': 'Specify the latitude associated with the point.',
+                     'longitude': 'Specify the longitude associated with the point.',
+                     'radius': 'Specify the radius (meters) covering the circular region of interest around the point '
+                               '(coordinate) described by the latitude and longitude.'})
+    @ns.expect(limit_parser)
+    def get(self, latitude, longitude, radius):
+        """Returns the Schools within a radius around a point described by the given latitude and longitude."""
+        args = limit_parser.parse_args()
+        limit = args['limit']
+        try:
+            if args['summary'] == 'counts':
+                return osm.getCounts(latitude, longitude, radius, ["schools"]), 200
+
+            if wantsStream():
+                return streamResponse(osm.streamCategory("schools", latitude, longitude, radius, limit))
+
+            return osm.getSchools(latitude, longitude, radius, limit), 200
+        except (ReportTimeoutError, QueryCanceledError):
+            app.logger.warning("%s timed out", request.path)
+            return "", 504
+        except Exception:
+            app.logger.exception("%s failed", request.path)
+            return "", 500
+
+
+@ns.route('/<float:latitude>,<float:longitude>/<int:radius>/kindergarten')
+class KindergartenReport(Resource):
+    @api.doc(responses={200: 'OK', 400: 'Bad Request', 500: 'Internal Server Error', 504: 'Gateway Timeout'},
+             params={'latitude': 'Specify the latitude associated with the point.',
+                     'longitude': 'Specify the longitude associated with the point.',
+                     'radius': 'Specify the radius (meters) covering the circular region of interest around the point '
+                               '(coordinate) described by the latitude and longitude.'})
+    @ns.expect(limit_parser)
+    def get(self, latitude, longitude, radius):
+        """Returns the Kindergartens within a radius around a point described by the given latitude and longitude."""
+        args = limit_parser.parse_args()
+        limit = args['limit']
+        try:
+            if args['summary'] == 'counts':
+                return osm.getCounts(latitude, longitude, radius, ["kindergartens"]), 200
+
+            if wantsStream():
+                return streamResponse(osm.streamCategory("kindergartens", latitude, longitude, radius, limit))
+
+            return osm.getKindergarten(latitude, longitude, radius, limit), 200
+        except (ReportTimeoutError, QueryCanceledError):
+            app.logger.warning("%s timed out", request.path)
+            return "", 504
+        except Exception:
+            app.logger.exception("%s failed", request.path)
+            return "", 500
+
+
+@ns.route('/<float:latitude>,<float:longitude>/<int:radius>/hospitals')
+class HospitalReport(Resource):
+    @api.doc(responses={200: 'OK', 400: 'Bad Request', 500: 'Internal Server Error', 504: 'Gateway Timeout'},
+             params={'latitude': 'Specify the latitude associated with the point.',
+                     'longitude': 'Specify the longitude associated with the point.',
+                     'radius': 'Specify the radius (meters) covering the circular region of interest around the point '
+                               '(coordinate) described by the latitude and longitude.'})
+    @ns.expect(limit_parser)
+    def get(self, latitude, longitude, radius):
+        """Returns the Hospitals within a radius around a point described by the given latitude and longitude."""
+        args = limit_parser.parse_args()
+        limit = args['limit']
+        try:
+            if args['summary'] == 'counts':
+                return osm.getCounts(latitude, longitude, radius, ["hospitals"]), 200
+
+            if wantsStream():
+                return streamResponse(osm.streamCategory("hospitals", latitude, longitude, radius, limit))
+
+            return osm.getHospitals(latitude, longitude, radius, limit), 200
+        except (ReportTimeoutError, QueryCanceledError):
+            app.logger.warning("%s timed out", request.path)
+            return "", 504
+        except Exception:
+            app.logger.exception("%s failed", request.path)
+            return "", 500
+
+
+@ns.route('/<float:latitude>,<float:longitude>/<int:radius>/doctors')
+class DoctorReport(Resource):
+    @api.doc(responses={200: 'OK', 400: 'Bad Request', 500: 'Internal Server Error', 504: 'Gateway Timeout'},
+             params={'latitude': 'Specify the latitude associated with the point.',
+                     'longitude': 'Specify the longitude associated with the point.',
+                     'radius': 'Specify the radius (meters) covering the circular region of interest around the point '
+                               '(coordinate) described by the latitude and longitude.'})
+    @ns.expect(limit_parser)
+    def get(self, latitude, longitude, radius):
+        """Returns the Doctors within a radius around a point described by the given latitude and longitude."""
+        args = limit_parser.parse_args()
+        limit = args['limit']
+        try:
+            if args['summary'] == 'counts':
+                return osm.getCounts(latitude, longitude, radius, ["doctors"]), 200
+
+            if wantsStream():
+                return streamResponse(osm.streamCategory("doctors", latitude, longitude, radius, limit))
+
+            return osm.getDoctors(latitude, longitude, radius, limit), 200
+        except (ReportTimeoutError, QueryCanceledError):
+            app.logger.warning("%s timed out", request.path)
+            return "", 504
+        except Exception:
+            app.logger.exception("%s failed", request.path)
+            return "", 500
+
+
+@ns.route('/<float:latitude>,<float:longitude>/<int:radius>/railway')
+class RailwayStationReport(Resource):
+    @api.doc(responses={200: 'OK', 400: 'Bad Request', 500: 'Internal Server Error', 504: 'Gateway Timeout'},
+             params={'latitude': 'Specify the latitude associated with the point.',
+                     'longitude': 'Specify the longitude associated with the point.',
+                     'radius': 'Specify the radius (meters) covering the circular region of interest around the point '
+                               '(coordinate) described by the latitude and longitude.'})
+    @api.doc(responses={200: 'OK', 400: 'Bad Request', 500: 'Internal Server Error', 504: 'Gateway Timeout'},
+             params={'latitude': 'Specify the latitude associated with the point.',
+                     'longitude': 'Specify the longitude associated with the point.',
+                     'radius': 'Specify the radius (meters) covering the circular region of interest around the point '
+                               '(coordinate) described by the latitude and longitude.'})
+    @ns.expect(limit_parser)
+    def get(self, latitude, longitude, radius):
+        """Returns the Railway Stations within a radius around a point described by the given latitude and longitude."""
+        args = limit_parser.parse_args()
+        limit = args['limit']
+        try:
+            if args['summary'] == 'counts':
+                return osm.getCounts(latitude, longitude, radius, ["railway_stations"]), 200
+
+            if wantsStream():
+                return streamResponse(osm.streamCategory("railway_stations", latitude, longitude, radius, limit))
+
+            return osm.getRailwayStations(latitude, longitude, radius, limit), 200
+        except (ReportTimeoutError, QueryCanceledError):
+            app.logger.warning("%s timed out", request.path)
+            return "", 504
+        except Exception:
+            app.logger.exception("%s failed", request.path)
+            return "", 500
+
+
+@ns.route('/<float:latitude>,<float:longitude>/<int:radius>/tram')
+class TramStationReport(Resource):
+    @api.doc(responses={200: 'OK', 400: 'Bad Request', 500: 'Internal Server Error', 504: 'Gateway Timeout'},
+             params={'latitude': 'Specify the latitude associated with the point.',
+                     'longitude': 'Specify the longitude associated with the point.',
+                     'radius': 'Specify the radius (meters) covering the circular region of interest around the point '
+                               '(coordinate) described by the latitude and longitude.'})
+    @ns.expect(limit_parser)
+    def get(self, latitude, longitude, radius):
+        """Returns the Tram Stations within a radius around a point described by the given latitude and longitude."""
+        args = limit_parser.parse_args()
+        limit = args['limit']
+        try:
+            if args['summary'] == 'counts':
+                return osm.getCounts(latitude, longitude, radius, ["tram_stations"]), 200
+
+            if wantsStream():
+                return streamResponse(osm.streamCategory("tram_stations", latitude, longitude, radius, limit))
+
+            return osm.getTramStations(latitude, longitude, radius, limit), 200
+        except (ReportTimeoutError, QueryCanceledError):
+            app.logger.warning("%s timed out", request.path)
+            return "", 504
+        except Exception:
+            app.logger.exception("%s failed", request.path)
+            return "", 500
+
+
+@ns.route('/<float:latitude>,<float:longitude>/<int:radius>/bus')
+class BusStationReport(Resource):
+    @api.doc(responses={200: 'OK', 400: 'Bad Request', 500: 'Internal Server Error', 504: 'Gateway Timeout'},
+             params={'latitude': 'Specify the latitude associated with the point.',
+                     'longitude': 'Specify the longitude associated with the point.',
+                     'radius': 'Specify the radius (meters) covering the circular region of interest around the point '
+                               '(coordinate) described by the latitude and longitude.'})
+    @ns.expect(limit_parser)
+    def get(self, latitude, longitude, radius):
+        """Returns the Bus Stations within a radius around a point described by the given latitude and longitude."""
+        args = limit_parser.parse_args()
+        limit = args['limit']
+        try:
+            if args['summary'] == 'counts':
+                return osm.getCounts(latitude, longitude, radius, ["bus_stations"]), 200
+
+            if wantsStream():
+                return streamResponse(osm.streamCategory("bus_stations", latitude, longitude, radius, limit))
+
+            return osm.getBusStations(latitude, longitude, radius, limit), 200
+        except (ReportTimeoutError, QueryCanceledError):
+            app.logger.warning("%s timed out", request.path)
+            return "", 504
+        except Exception:
+            app.logger.exception("%s failed", request.path)
+            return "", 500
+
+
+@ns.route('/<float:latitude>,<float:longitude>/<int:radius>/tags')
+class TagReport(Resource):
+    @api.doc(responses={200: 'OK', 400: 'Bad Request', 500: 'Internal Server Error', 501: 'Not Implemented', 504: 'Gateway Timeout'},
+             params={'latitude': 'Specify the latitude associated with the point.',
+                     'longitude': 'Specify the longitude associated with the point.',
+                     'radius': 'Specify the radius (meters) covering the circular region of interest around the point '
+                               '(coordinate) described by the latitude and longitude.'})
+    def get(self, latitude, longitude, radius):
+        """Returns all points, areas and relations whose OSM tags match every query parameter within a radius around a point described by the given latitude and longitude. A parameter without a value (e.g. `?wheelchair&shop=bakery`) only requires the key to be present."""
+        tags = {key: value for key, value in request.args.items() if value and key != "stream"}
+        keys = [key for key, value in request.args.items() if not value and key != "stream"]
+        if not tags and not keys:
+            return "", 400
+
+        try:
+            return osm.getByTags(latitude, longitude, radius, tags, keys), 200
+        except NotImplementedError:
+            # The in-memory backend only holds the report categories.
+            return "", 501
+        except (ReportTimeoutError, QueryCanceledError):
+            app.logger.warning("%s timed out", request.path)
+            return "", 504
+        except Exception:
+            app.logger.exception("%s failed", request.path)
+            return "", 500
+
+
+nearest = api.namespace('nearest', description='Operations for getting the data closest to a given point')
+
+nearest_parser = reqparse.RequestParser()
+nearest_parser.add_argument('k', type=inputs.int_range(1, app.config.get("NEAREST_MAX_K", 100)), default=1, location='args',
+                            help='The number of results.')
+nearest_parser.add_argument('max_radius', type=float, location='args',
+                            help='Only return results within this distance (meters) of the point.')
+
+
+@nearest.route('/<float:latitude>,<float:longitude>/<any(%s):category>' % ", ".join(NEAREST_CATEGORIES))
+class NearestReport(Resource):
+    @api.doc(responses={200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error', 504: 'Gateway Timeout'},
+             params={'latitude': 'Specify the latitude associated with the point.',
+                     'longitude': 'Specify the longitude associated with the point.',
+                     'category': 'Specify the category, one of %s.' % ", ".join(NEAREST_CATEGORIES)})
+    @nearest.expect(nearest_parser)
+    def get(self, latitude, longitude, category):
+        """Returns the k results of a category closest to a point described by the given latitude and longitude, ordered by distance. The database walks its spatial index in order of distance, so no radius has to be guessed."""
+        args = nearest_parser.parse_args()
+        try:
+            return osm.getNearest(category, latitude, longitude, args['k'], args['max_radius']), 200
+        except (ReportTimeoutError, QueryCanceledError):
+            app.logger.warning("%s timed out", request.path)
+            return "", 504
+        except Exception:
+            app.logger.exception("%s failed", request.path)
+            return "", 500
+
+
+batch = api.namespace('batch', path='/batch', description='Operations for getting reports for many points at once')
+
+batch_item = api.model('BatchItem', {
+    'lat': fields.Float(required=True, description='The latitude associated with the point.'),
+    'lon': fields.Float(required=True, description='The longitude associated with the point.'),
+    'radius': fields.Integer(required=True, min=1, description='The radius (meters) covering the circular region of interest around the point.'),
+    'categories': fields.List(fields.String(enum=list(REPORT_CATEGORIES)),
+                              description='The categories of the report. All categories are returned if omitted.')
+})
+
+batch_request = api.model('BatchRequest', {
+    'items': fields.List(fields.Nested(batch_item), required=True, description='The points to report on.')
+})
+
+
+@batch.route('')
+class BatchReport(Resource):
+    @api.doc(responses={200: 'OK', 400: 'Bad Request', 413: 'Payload Too Large', 429: 'Too Many Requests', 500: 'Internal Server Error',
+                        503: 'Service Unavailable', 504: 'Gateway Timeout'})
+    @batch.expect(batch_request, validate=True)
+    def post(self):
+        """Returns one full report per item, in the order of the items, restricted to the categories of every item. The items are answered with a few set-based queries instead of one request per point."""
+        items = request.get_json()["items"]
+        if len(items) > app.config.get("BATCH_MAX_ITEMS", 10000):
+            return "", 413
+        if any(item["radius"] > app.config.get("MAX_RADIUS", 20000) for item in items):
+            return "", 400
+
+        items = [(item["lat"], item["lon"], item["radius"], item.get("categories") or list(REPORT_CATEGORIES)) for item in items]
+        admission = current_app.extensions.get("admission")
+        try:
+            # A batch is admitted as a whole, with the cost of all of its items.
+            with admission.admit(sum(admission.cost(radius, categories) for _, _, radius, categories in items)) if admission is not None else nullcontext():
+                reports = osm.getBatchReports(items, app.config.get("BATCH_CHUNK_SIZE", 100))
+        except AdmissionRejectedError as error:
+            return rejectedResponse(error)
+        except (ReportTimeoutError, QueryCanceledError):
+            app.logger.warning("%s timed out", request.path)
+            return "", 504
+        except Exception:
+            app.logger.exception("%s failed", request.path)
+            return "", 500
+
+        return [{
+            "input": {
+                "center": {
+                    "lat": lat,
+                    "lon": lon
+                },
+                "radius": radius
+            },
+            "result": report
+        } for (lat, lon, radius, _), report in zip(items, reports)], 200
+
+
+tiles = api.namespace('tiles', description='Operations for getting vector tiles for map clients')
+
+
+@tiles.route('/<int:z>/<int:x>/<int:y>.mvt')
+class Tile(Resource):
+    @api.doc(responses={200: 'OK', 404: 'Not Found', 500: 'Internal Server Error', 501: 'Not Implemented', 504: 'Gateway Timeout'},
+             params={'z': 'Specify the zoom level.',
+                     'x': 'Specify the column of the tile.',
+                     'y': 'Specify the row of the tile.'})
+    def get(self, z, x, y):
+        """Returns a Mapbox vector tile with one layer per category, named like the categories of the full report. A category is only drawn from the zoom level on where it becomes legible, so tiles of large areas stay small."""
+        if z > app.config.get("TILE_MAX_ZOOM", 20) or x >= 2 ** z or y >= 2 ** z:
+            return "", 404
+
+        try:
+            tile = osm.getTile(z, x, y)
+        except NotImplementedError:
+            return "", 501
+        except (ReportTimeoutError, QueryCanceledError):
+            app.logger.warning("%s timed out", request.path)
+            return "", 504
+        except Exception:
+            app.logger.exception("%s failed", request.path)
+            return "", 500
+
+        response = Response(tile, mimetype="application/vnd.mapbox-vector-tile")
+        response.headers["Cache-Control"] = "public, max-age=%d" % app.config.get("TILE_MAX_AGE", 3600)
+        return response
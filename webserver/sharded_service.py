@@ -0,0 +1,253 @@
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from itertools import chain
+
+from geohash_grid import cell_distances
+from osm_service import REPORT_CATEGORIES, empty_report, query_parameters
+
+LIST_METHODS = {method for key, method in REPORT_CATEGORIES.items() if key != "relative_type_of_area"}
+
+
+def merge_items(results, limit=None):
+    """Merges the item lists of several shards by distance.
+
+    Features near a region border are contained in the extracts of both
+    regions, so items with the same name and location are only kept once.
+    """
+    seen = set()
+    merged = []
+    for item in sorted(chain.from_iterable(results), key=lambda item: item["distance"]):
+        key = (item.get("name"), item["location"]["lat"], item["location"]["lon"])
+        if key not in seen:
+            seen.add(key)
+            merged.append(item)
+
+    return merged[:limit]
+
+
+def merge_landuse(results):
+    merged = {}
+    for result in results:
+        for landuse, item in result.items():
+            total = merged.setdefault(landuse, {"count": 0, "total_area": 0.0, "unit": "m^2"})
+            total["count"] += item["count"]
+            total["total_area"] += item["total_area"] or 0.0
+
+    return merged
+
+
+def merge_reports(results, categories):
+    return {key: merge_landuse(result[key] for result in results) if key == "relative_type_of_area"
+            else merge_items(result[key] for result in results) for key in categories}
+
+
+def merge_counts(results, categories):
+    merged = {}
+    for key in categories:
+        if key == "relative_type_of_area":
+            merged[key] = {}
+            for result in results:
+                for landuse, count in result[key].items():
+                    merged[key][landuse] = merged[key].get(landuse, 0) + count
+        else:
+            merged[key] = sum(result[key] for result in results)
+
+    return merged
+
+
+def report_items(report):
+    """The (category, item) pairs of a report, in the form streamFullReport yields them."""
+    for category, items in report.items():
+        if category == "relative_type_of_area":
+            for landuse, item in items.items():
+                yield category, {"landuse": landuse, **item}
+        else:
+            for item in items:
+                yield category, item
+
+
+def tile_center(z, x, y):
+    """The latitude and longitude of the center of the Web Mercator tile z/x/y."""
+    tiles = 2 ** z
+    lon = (x + 0.5) / tiles * 360 - 180
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 0.5) / tiles))))
+    return lat, lon
+
+
+def call_until(deadline, call, shard):
+    with shard.deadline(deadline):
+        return call(shard)
+
+
+class ShardedOsmService:
+    """Routes every request to the region databases it concerns.
+
+    Every shard is an OsmService on a database with the extract of one region.
+    The bounding boxes of the regions are read once by `loadExtents()`. A
+    circle is answered by every shard whose region it overlaps, in parallel on
+    up to `max_workers` threads, and the results are merged by distance.
+    Landuse aggregates and counts of several shards are added up, so features
+    contained in the extracts of two neighbouring regions are counted twice
+    there. Vector tiles come from the shard of the region around their center.
+    """
+
+    def __init__(self, shards, max_workers=8):
+        self.shards = shards
+        self.max_workers = max_workers
+        self.extents = None
+
+        self.__lock = threading.Lock()
+        self.__executor = None
+        self.__pid = None
+        self.__deadline = threading.local()
+
+    @contextmanager
+    def deadline(self, at):
+        """Passes the deadline of OsmService.deadline() on to the shards queried by the current thread."""
+        self.__deadline.at = at
+        try:
+            yield
+        finally:
+            self.__deadline.at = None
+
+    def loadExtents(self):
+        extents = []
+        for shard in self.shards:
+            extent = shard.getExtent()
+            if extent is None:
+                raise ValueError("the database %s on %s has no data_extent, run database/sql/extent.sql" % (shard.database, shard.host))
+            extents.append(extent)
+
+            # Worker processes forked later open their own connections.
+            shard.pool.closeAll()
+
+        self.extents = extents
+
+    def __getExecutor(self):
+        pid = os.getpid()
+        if self.__executor is None or self.__pid != pid:
+            with self.__lock:
+                if self.__executor is None or self.__pid != pid:
+                    self.__executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="shard")
+                    self.__pid = pid
+
+        return self.__executor
+
+    def __shardsFor(self, lat, lon, radius):
+        bounds = query_parameters(lat, lon, radius)
+        return [shard for shard, (west, south, east, north) in zip(self.shards, self.extents)
+                if bounds["west"] <= east and bounds["east"] >= west and bounds["south"] <= north and bounds["north"] >= south]
+
+    def __map(self, shards, call):
+        deadline = getattr(self.__deadline, "at", None)
+        if deadline is not None:
+            # The shards are queried on other threads, which do not see the deadline of this one.
+            call = partial(call_until, deadline, call)
+
+        if len(shards) == 1:
+            return [call(shards[0])]
+
+        return list(self.__getExecutor().map(call, shards))
+
+    def __getattr__(self, name):
+        if name not in LIST_METHODS:
+            raise AttributeError(name)
+
+        def get(lat, lon, radius, limit=None, tags=None):
+            shards = self.__shardsFor(lat, lon, radius)
+            return merge_items(self.__map(shards, lambda shard: getattr(shard, name)(lat, lon, radius, limit, tags=tags)), limit)
+
+        return get
+
+    def getDataVersion(self):
+        # Versions only ever increase, so their sum changes whenever one of the shards is updated.
+        versions = [shard.getDataVersion() for shard in self.shards]
+        return None if None in versions else sum(versions)
+
+    def getExtent(self):
+        return (min(extent[0] for extent in self.extents), min(extent[1] for extent in self.extents),
+                max(extent[2] for extent in self.extents), max(extent[3] for extent in self.extents))
+
+    def getCategoryDensities(self):
+        # The densest region decides, so no request is underestimated anywhere.
+        densities = {}
+        for shard in self.shards:
+            for category, density in shard.getCategoryDensities().items():
+                densities[category] = max(densities.get(category, 0.0), density)
+
+        return densities
+
+    def getLanduse(self, lat, lon, radius):
+        return merge_landuse(self.__map(self.__shardsFor(lat, lon, radius), lambda shard: shard.getLanduse(lat, lon, radius)))
+
+    def getCounts(self, lat, lon, radius, categories):
+        return merge_counts(self.__map(self.__shardsFor(lat, lon, radius), lambda shard: shard.getCounts(lat, lon, radius, categories)), categories)
+
+    def getByTags(self, lat, lon, radius, tags, keys):
+        return merge_items(self.__map(self.__shardsFor(lat, lon, radius), lambda shard: shard.getByTags(lat, lon, radius, tags, keys)))
+
+    def getFullReport(self, lat, lon, radius, categories=None, tags=None):
+        categories = list(REPORT_CATEGORIES) if categories is None else categories
+        results = self.__map(self.__shardsFor(lat, lon, radius), lambda shard: shard.getFullReport(lat, lon, radius, categories, tags))
+        return merge_reports(results, categories)
+
+    def streamFullReport(self, lat, lon, radius, categories=None, tags=None):
+        shards = self.__shardsFor(lat, lon, radius)
+        if len(shards) == 1:
+            return shards[0].streamFullReport(lat, lon, radius, categories, tags)
+
+        return report_items(self.getFullReport(lat, lon, radius, categories, tags))
+
+    def streamCategory(self, category, lat, lon, radius, limit=None):
+        shards = self.__shardsFor(lat, lon, radius)
+        if len(shards) == 1:
+            return shards[0].streamCategory(category, lat, lon, radius, limit)
+
+        items = (item for _, item in report_items(self.getFullReport(lat, lon, radius, [category])))
+        return items if category == "relative_type_of_area" else iter(list(items)[:limit])
+
+    def getNearest(self, category, lat, lon, k, max_radius=None):
+        """Asks the shards in the order of the distance to their region, until no further region can hold a closer item."""
+        shards = sorted((cell_distances(lat, lon, *extent)[0], index) for index, extent in enumerate(self.extents))
+
+        results = []
+        for distance, index in shards:
+            if max_radius is not None and distance > max_radius:
+                break
+            if len(results) >= k and distance > results[k - 1]["distance"]:
+                break
+
+            results = merge_items([results, self.shards[index].getNearest(category, lat, lon, k, max_radius)], k)
+
+        return results
+
+    def getTile(self, z, x, y):
+        lat, lon = tile_center(z, x, y)
+        _, index = min((cell_distances(lat, lon, *extent)[0], index) for index, extent in enumerate(self.extents))
+        return self.shards[index].getTile(z, x, y)
+
+    def getBatchReports(self, items, chunk_size=100):
+        """Answers the items of a single region with the batch queries of its shard and the others one by one."""
+        reports = [None] * len(items)
+        batches = {}
+        for position, (lat, lon, radius, categories) in enumerate(items):
+            shards = self.__shardsFor(lat, lon, radius)
+            if len(shards) == 1:
+                batches.setdefault(self.shards.index(shards[0]), []).append(position)
+            elif not shards:
+                reports[position] = empty_report(categories)
+            else:
+                reports[position] = merge_reports(self.__map(shards, lambda shard: shard.getFullReport(lat, lon, radius, categories)), categories)
+
+        for index, positions in batches.items():
+            for position, report in zip(positions, self.shards[index].getBatchReports([items[position] for position in positions], chunk_size)):
+                reports[position] = report
+
+        return reports
+
+    def streamFeatures(self):
+        return chain.from_iterable(shard.streamFeatures() for shard in self.shards)
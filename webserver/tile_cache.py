@@ -0,0 +1,108 @@
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+class TileCache:
+    """Caches the vector tiles of an OsmService in memory and optionally on disk.
+
+    Tiles are keyed on the data version written by the import, which is checked
+    every `version_check_interval` seconds. The memory cache holds tiles of at
+    most `max_bytes` bytes in total and evicts the least recently used ones. If
+    `directory` is set, tiles are also stored below `directory/<version>/z/x/y.mvt`,
+    where they survive restarts and are shared by all worker processes; the
+    directories of older versions are left for the operator to delete. Every
+    other attribute is passed through to the wrapped service.
+    """
+
+    def __init__(self, osm, max_bytes, directory=None, version_check_interval=60):
+        self.osm = osm
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.version_check_interval = version_check_interval
+
+        self.__lock = threading.Lock()
+        self.__tiles = OrderedDict()
+        self.__bytes = 0
+
+        self.__version = None
+        self.__versionCheckedAt = None
+
+    def __getattr__(self, name):
+        return getattr(self.osm, name)
+
+    def __checkVersion(self):
+        now = time.monotonic()
+        with self.__lock:
+            if self.__versionCheckedAt is not None and now - self.__versionCheckedAt < self.version_check_interval:
+                return self.__version
+            self.__versionCheckedAt = now
+
+        version = self.osm.getDataVersion()
+        with self.__lock:
+            if version != self.__version:
+                self.__tiles.clear()
+                self.__bytes = 0
+                self.__version = version
+
+        return version
+
+    def __path(self, version, z, x, y):
+        return os.path.join(self.directory, str(version), str(z), str(x), "%d.mvt" % y)
+
+    def __readFile(self, version, z, x, y):
+        try:
+            with open(self.__path(version, z, x, y), "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def __writeFile(self, version, z, x, y, tile):
+        path = self.__path(version, z, x, y)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Other processes never read a partially written tile.
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(tile)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def __store(self, key, tile):
+        if len(tile) > self.max_bytes:
+            return
+
+        with self.__lock:
+            if key in self.__tiles:
+                self.__bytes -= len(self.__tiles.pop(key))
+
+            self.__tiles[key] = tile
+            self.__bytes += len(tile)
+
+            while self.__bytes > self.max_bytes:
+                _, evicted = self.__tiles.popitem(last=False)
+                self.__bytes -= len(evicted)
+
+    def getTile(self, z, x, y):
+        version = self.__checkVersion()
+        key = (version, z, x, y)
+
+        with self.__lock:
+            tile = self.__tiles.get(key)
+            if tile is not None:
+                self.__tiles.move_to_end(key)
+                return tile
+
+        tile = self.__readFile(version, z, x, y) if self.directory is not None else None
+        if tile is None:
+            tile = self.osm.getTile(z, x, y)
+            if self.directory is not None:
+                self.__writeFile(version, z, x, y, tile)
+
+        self.__store(key, tile)
+        return tile
@@ -1,290 +1,159 @@
-# Fix Cannot import name 'cached_property': https://stackoverflow.com/a/60157748/3593881
-import werkzeug
-werkzeug.cached_property = werkzeug.utils.cached_property
-from flask import Flask
+from contextlib import ExitStack
+from flask import g, make_response, request
 from flask.json import jsonify
+from admission import AdmissionController, AdmissionRejectedError
+from metrics import InstrumentedOsmService
 from osm_service import OsmService
-from flask_restplus import Api, Resource, reqparse
-
-app = Flask(__name__)
-app.config.from_envvar('SETTINGS_FILE')
+from report_cache import ReportCache
+from report_executor import ConcurrentReportExecutor
+from request_coalescer import RequestCoalescer
+from routes import app, categoryList, rejectedResponse, selectCategories
+from tile_cache import TileCache
+
+def createOsmService(config):
+    return OsmService(config["DATABASE_USER"], config["DATABASE_PASSWORD"], config["DATABASE_HOST"], config["DATABASE_PORT"], config["DATABASE_NAME"],
+                      pool_min_size=config.get("DATABASE_POOL_MIN_SIZE", 1),
+                      pool_max_size=config.get("DATABASE_POOL_MAX_SIZE", 10),
+                      pool_timeout=config.get("DATABASE_POOL_TIMEOUT", 30),
+                      pool_health_check_interval=config.get("DATABASE_POOL_HEALTH_CHECK_INTERVAL", 30),
+                      stream_itersize=config.get("STREAM_ITERSIZE", 2000),
+                      slow_query_threshold=config.get("SLOW_QUERY_THRESHOLD"),
+                      slow_query_explain=config.get("SLOW_QUERY_EXPLAIN", False),
+                      landuse_clipped=config.get("LANDUSE_CLIPPED", False),
+                      statement_timeout=config.get("STATEMENT_TIMEOUT"))
 
 with app.app_context():
-    osm = OsmService(app.config["DATABASE_USER"], app.config["DATABASE_PASSWORD"], app.config["DATABASE_HOST"], app.config["DATABASE_PORT"], app.config["DATABASE_NAME"])
-
-api = Api(app, version='1.0', title='OSM Service API',
-    description='Documentation for the OSM Service API.')
-
-ns = api.namespace('relative', description='Operations for getting data relative to a given point')
-
-
-@ns.route('/<float:latitude>,<float:longitude>/<int:radius>')
-class FullReport(Resource):
-    @api.doc(responses={200: 'OK', 500: 'Internal Server Error'},
-             params={'latitude': 'Specify the latitude associated with the point.',
-                     'longitude': 'Specify the longitude associated with the point.',
-                     'radius': 'Specify the radius (meters) covering the circular region of interest around the point '
-                               '(coordinate) described by the latitude and longitude.'})
-    def get(self, latitude, longitude, radius):
-        """Returns the full report: Landuse, Parking, Chemists, Convenience Stores, Supermarkets, Malls, Schools, Kindergartens, Hospitals, Doctors, Railway Stations, Tram Stations, Bus Stations within a radius around a point described by the given latitude and longitude."""
-
-        try:
-            return {
-                "input": {
-                    "center": {
-                        "lat": latitude,
-                        "lon": longitude
-                    },
-                    "radius": radius
-                },
-                "result": {
-                    "relative_type_of_area": osm.getLanduse(latitude, longitude, radius),
-
-                    "malls": osm.getMalls(latitude, longitude, radius),
-                    "chemists": osm.getChemists(latitude, longitude, radius),
-                    "convenience": osm.getConvenience(latitude, longitude, radius),
-                    "supermarkets": osm.getSupermarket(latitude, longitude, radius),
-
-                    "parks": osm.getParks(latitude, longitude, radius),
-                    "parking": osm.getParking(latitude, longitude, radius),
-                    "schools": osm.getSchools(latitude, longitude, radius),
-                    "kindergartens": osm.getKindergarten(latitude, longitude, radius),
-                    "hospitals": osm.getHospitals(latitude, longitude, radius),
-                    "doctors": osm.getDoctors(latitude, longitude, radius),
-
-                    "railway_stations": osm.getRailwayStations(latitude, longitude, radius),
-                    "tram_stations": osm.getTramStations(latitude, longitude, radius),
-                    "bus_stations": osm.getBusStations(latitude, longitude, radius),
-                }
-            }, 200
-        except:
-            return "", 500
-
-
-@ns.route('/<float:latitude>,<float:longitude>/<int:radius>/malls')
-class MallReport(Resource):
-    @api.doc(responses={200: 'OK', 500: 'Internal Server Error'},
-             params={'latitude': 'Specify the latitude associated with the point.',
-                     'longitude': 'Specify the longitude associated with the point.',
-                     'radius': 'Specify the radius (meters) covering the circular region of interest around the point '
-                               '(coordinate) described by the latitude and longitude.'})
-    def get(self, latitude, longitude, radius):
-        """Returns the Malls within a radius around a point described by the given latitude and longitude."""
-        try:
-            return osm.getMalls(latitude, longitude, radius), 200
-        except Exception as e:
-            print(e)
-            return "", 500
-
-
-@ns.route('/<float:latitude>,<float:longitude>/<int:radius>/chemists')
-class ChemistReport(Resource):
-    @api.doc(responses={200: 'OK', 500: 'Internal Server Error'},
-             params={'latitude': 'Specify the latitude associated with the point.',
-                     'longitude': 'Specify the longitude associated with the point.',
-                     'radius': 'Specify the radius (meters) covering the circular region of interest around the point '
-                               '(coordinate) described by the latitude and longitude.'})
-    def get(self, latitude, longitude, radius):
-        """Returns the Chemists within a radius around a point described by the given latitude and longitude."""
-        try:
-            return osm.getChemists(latitude, longitude, radius), 200
-        except Exception as e:
-            print(e)
-            return "", 500
-
-
-@ns.route('/<float:latitude>,<float:longitude>/<int:radius>/convenience')
-class ConvenienceReport(Resource):
-    @api.doc(responses={200: 'OK', 500: 'Internal Server Error'},
-             params={'latitude': 'Specify the latitude associated with the point.',
-                     'longitude': 'Specify the longitude associated with the point.',
-                     'radius': 'Specify the radius (meters) covering the circular region of interest around the point '
-                               '(coordinate) described by the latitude and longitude.'})
-    def get(self, latitude, longitude, radius):
-        """Returns the Convenience Stores within a radius around a point described by the given latitude and longitude."""
-        try:
-            return osm.getConvenience(latitude, longitude, radius), 200
-        except Exception as e:
-            print(e)
-            return "", 500
-
-
-@ns.route('/<float:latitude>,<float:longitude>/<int:radius>/supermarkets')
-class SupermarketReport(Resource):
-    @api.doc(responses={200: 'OK', 500: 'Internal Server Error'},
-             params={'latitude': 'Specify the latitude associated with the point.',
-                     'longitude': 'Specify the longitude associated with the point.',
-                     'radius': 'Specify the radius (meters) covering the circular region of interest around the point '
-                               '(coordinate) described by the latitude and longitude.'})
-    def get(self, latitude, longitude, radius):
-        """Returns the Supermarkets within a radius around a point described by the given latitude and longitude."""
-        try:
-            return osm.getSupermarket(latitude, longitude, radius), 200
-        except Exception as e:
-            print(e)
-            return "", 500
-
-
-@ns.route('/<float:latitude>,<float:longitude>/<int:radius>/landuse')
-class LanduseReport(Resource):
-    @api.doc(responses={200: 'OK', 500: 'Internal Server Error'},
-             params={'latitude': 'Specify the latitude associated with the point.',
-                     'longitude': 'Specify the longitude associated with the point.',
-                     'radius': 'Specify the radius (meters) covering the circular region of interest around the point '
-                               '(coordinate) described by the latitude and longitude.'})
-    def get(self, latitude, longitude, radius):
-        """Returns the Landuse within a radius around a point described by the given latitude and longitude."""
-        try:
-            return osm.getLanduse(latitude, longitude, radius), 200
-        except Exception as e:
-            print(e)
-            return "", 500
-
-
-@ns.route('/<float:latitude>,<float:longitude>/<int:radius>/parking')
-class ParkingReport(Resource):
-    @api.doc(responses={200: 'OK', 500: 'Internal Server Error'},
-             params={'latitude': 'Specify the latitude associated with the point.',
-                     'longitude': 'Specify the longitude associated with the point.',
-                     'radius': 'Specify the radius (meters) covering the circular region of interest around the point '
-                               '(coordinate) described by the latitude and longitude.'})
-    def get(self, latitude, longitude, radius):
-        """Returns car parks within a radius around a point described by the given latitude and longitude."""
-        try:
-            return osm.getParking(latitude, longitude, radius), 200
-        except Exception as e:
-            print(e)
-            return "", 500
-
-
-@ns.route('/<float:latitude>,<float:longitude>/<int:radius>/parks')
-class ParkReport(Resource):
-    @api.doc(responses={200: 'OK', 500: 'Internal Server Error'},
-             params={'latitude': 'Specify the latitude associated with the point.',
-                     'longitude': 'Specify the longitude associated with the point.',
-                     'radius': 'Specify the radius (meters) covering the circular region of interest around the point '
-                               '(coordinate) described by the latitude and longitude.'})
-    def get(self, latitude, longitude, radius):
-        """Returns parks within a radius around a point described by the given latitude and longitude."""
-        try:
-            return osm.getParks(latitude, longitude, radius), 200
-        except Exception as e:
-            print(e)
-            return "", 500
-
-
-@ns.route('/<float:latitude>,<float:longitude>/<int:radius>/schools')
-class SchoolReport(Resource):
-    @api.doc(responses={200: 'OK', 500: 'Internal Server Error'},
-             params={'latitude': 'Specify the latitude associated with the point.',
-                     'longitude': 'Specify the longitude associated with the point.',
-                     'radius': 'Specify the radius (meters) covering the circular region of interest around the point '
-                               '(coordinate) described by the latitude and longitude.'})
-    def get(self, latitude, longitude, radius):
-        """Returns the Schools within a radius around a point described by the given latitude and longitude."""
-        try:
-            return osm.getSchools(latitude, longitude, radius), 200
-        except Exception as e:
-            print(e)
-            return "", 500
-
-
-@ns.route('/<float:latitude>,<float:longitude>/<int:radius>/kindergarten')
-class KindergartenReport(Resource):
-    @api.doc(responses={200: 'OK', 500: 'Internal Server Error'},
-             params={'latitude': 'Specify the latitude associated with the point.',
-                     'longitude': 'Specify the longitude associated with the point.',
-                     'radius': 'Specify the radius (meters) covering the circular region of interest around the point '
-                               '(coordinate) described by the latitude and longitude.'})
-    def get(self, latitude, longitude, radius):
-        """Returns the Kindergartens within a radius around a point described by the given latitude and longitude."""
-        try:
-            return osm.getKindergarten(latitude, longitude, radius), 200
-        except Exception as e:
-            print(e)
-            return "", 500
-
-
-@ns.route('/<float:latitude>,<float:longitude>/<int:radius>/hospitals')
-class HospitalReport(Resource):
-    @api.doc(responses={200: 'OK', 500: 'Internal Server Error'},
-             params={'latitude': 'Specify the latitude associated with the point.',
-                     'longitude': 'Specify the longitude associated with the point.',
-                     'radius': 'Specify the radius (meters) covering the circular region of interest around the point '
-                               '(coordinate) described by the latitude and longitude.'})
-    def get(self, latitude, longitude, radius):
-        """Returns the Hospitals within a radius around a point described by the given latitude and longitude."""
-        try:
-            return osm.getHospitals(latitude, longitude, radius), 200
-        except Exception as e:
-            print(e)
-            return "", 500
-
-
-@ns.route('/<float:latitude>,<float:longitude>/<int:radius>/doctors')
-class DoctorReport(Resource):
-    @api.doc(responses={200: 'OK', 500: 'Internal Server Error'},
-             params={'latitude': 'Specify the latitude associated with the point.',
-                     'longitude': 'Specify the longitude associated with the point.',
-                     'radius': 'Specify the radius (meters) covering the circular region of interest around the point '
-                               '(coordinate) described by the latitude and longitude.'})
-    def get(self, latitude, longitude, radius):
-        """Returns the Doctors within a radius around a point described by the given latitude and longitude."""
-        try:
-            return osm.getDoctors(latitude, longitude, radius), 200
-        except Exception as e:
-            print(e)
-            return "", 500
-
-
-@ns.route('/<float:latitude>,<float:longitude>/<int:radius>/railway')
-class RailwayStationReport(Resource):
-    @api.doc(responses={200: 'OK', 500: 'Internal Server Error'},
-             params={'latitude': 'Specify the latitude associated with the point.',
-                     'longitude': 'Specify the longitude associated with the point.',
-                     'radius': 'Specify the radius (meters) covering the circular region of interest around the point '
-                               '(coordinate) described by the latitude and longitude.'})
-    @api.doc(responses={200: 'OK', 500: 'Internal Server Error'},
-             params={'latitude': 'Specify the latitude associated with the point.',
-                     'longitude': 'Specify the longitude associated with the point.',
-                     'radius': 'Specify the radius (meters) covering the circular region of interest around the point '
-                               '(coordinate) described by the latitude and longitude.'})
-    def get(self, latitude, longitude, radius):
-        """Returns the Railway Stations within a radius around a point described by the given latitude and longitude."""
-        try:
-            return osm.getRailwayStations(latitude, longitude, radius), 200
-        except Exception as e:
-            print(e)
-            return "", 500
-
-
-@ns.route('/<float:latitude>,<float:longitude>/<int:radius>/tram')
-class TramStationReport(Resource):
-    @api.doc(responses={200: 'OK', 500: 'Internal Server Error'},
-             params={'latitude': 'Specify the latitude associated with the point.',
-                     'longitude': 'Specify the longitude associated with the point.',
-                     'radius': 'Specify the radius (meters) covering the circular region of interest around the point '
-                               '(coordinate) described by the latitude and longitude.'})
-    def get(self, latitude, longitude, radius):
-        """Returns the Tram Stations within a radius around a point described by the given latitude and longitude."""
-        try:
-            return osm.getTramStations(latitude, longitude, radius), 200
-        except Exception as e:
-            print(e)
-            return "", 500
-
-
-@ns.route('/<float:latitude>,<float:longitude>/<int:radius>/bus')
-class BusStationReport(Resource):
-    @api.doc(responses={200: 'OK', 500: 'Internal Server Error'},
-             params={'latitude': 'Specify the latitude associated with the point.',
-                     'longitude': 'Specify the longitude associated with the point.',
-                     'radius': 'Specify the radius (meters) covering the circular region of interest around the point '
-                               '(coordinate) described by the latitude and longitude.'})
-    def get(self, latitude, longitude, radius):
-        """Returns the Bus Stations within a radius around a point described by the given latitude and longitude."""
-        try:
-            return osm.getBusStations(latitude, longitude, radius), 200
-        except Exception as e:
-            print(e)
-            return "", 500
+    if app.config.get("DATABASE_SHARDS"):
+        from sharded_service import ShardedOsmService
+
+        # Every shard overrides the DATABASE_* settings it differs in.
+        osm = ShardedOsmService([createOsmService(dict(app.config, **shard)) for shard in app.config["DATABASE_SHARDS"]],
+                                app.config.get("SHARD_WORKERS", 8))
+        osm.loadExtents()
+    else:
+        osm = createOsmService(app.config)
+
+    admission = None
+    if app.config.get("ADMISSION_ENABLED", True):
+        admission = AdmissionController(app.config.get("ADMISSION_HEAVY_COST", 20000),
+                                        app.config.get("ADMISSION_HEAVY_CONCURRENCY", 2),
+                                        app.config.get("ADMISSION_HEAVY_QUEUE_SIZE", 10),
+                                        app.config.get("ADMISSION_QUEUE_TIMEOUT", 10),
+                                        app.config.get("ADMISSION_RETRY_AFTER", 30))
+        if app.config.get("ADMISSION_CALIBRATE", False):
+            admission.densities = osm.getCategoryDensities()
+
+    if app.config.get("BACKEND", "postgres") == "memory":
+        from memory_service import InMemoryOsmService
+
+        if app.config.get("MEMORY_DUMP_FILE"):
+            osm = InMemoryOsmService.fromFile(app.config["MEMORY_DUMP_FILE"], app.config.get("MEMORY_CELL_SIZE", 500))
+        else:
+            osm = InMemoryOsmService.fromDatabase(osm, app.config.get("MEMORY_CELL_SIZE", 500))
+
+    if app.config.get("FULL_REPORT_CONCURRENT", False):
+        # By default half of the connections are left to requests other than full reports.
+        osm = ConcurrentReportExecutor(osm,
+                                       app.config.get("FULL_REPORT_WORKERS", max(app.config.get("DATABASE_POOL_MAX_SIZE", 10) // 2, 1)),
+                                       app.config.get("FULL_REPORT_MAX_PARALLELISM", 4),
+                                       app.config.get("FULL_REPORT_TIMEOUT", 10))
+
+    if app.config.get("CACHE_ENABLED", False):
+        osm = ReportCache(osm,
+                          app.config.get("CACHE_MAX_ROWS", 1000000),
+                          app.config.get("CACHE_TTL", 86400),
+                          app.config.get("CACHE_PRECISION", 5),
+                          app.config.get("CACHE_VERSION_CHECK_INTERVAL", 60),
+                          app.config.get("CACHE_MAX_OFFSET", 1.0))
+
+    if app.config.get("COALESCE_ENABLED", True):
+        osm = RequestCoalescer(osm, app.config.get("COALESCE_TIMEOUT", 30))
+
+    if app.config.get("TILE_CACHE_ENABLED", True):
+        osm = TileCache(osm,
+                        app.config.get("TILE_CACHE_MAX_BYTES", 256 * 1024 * 1024),
+                        app.config.get("TILE_CACHE_DIRECTORY"),
+                        app.config.get("TILE_CACHE_VERSION_CHECK_INTERVAL", 60))
+
+    if app.config.get("METRICS_ENABLED", True):
+        osm = InstrumentedOsmService(osm)
+
+    app.extensions["osm"] = osm
+    app.extensions["admission"] = admission
+
+
+# The report categories queried by the endpoints below /relative, by the last segment of their route.
+# The tag query filters all features by their tags and is charged like a single category.
+ROUTE_CATEGORIES = {
+    "malls": ["malls"],
+    "chemists": ["chemists"],
+    "convenience": ["convenience"],
+    "supermarkets": ["supermarkets"],
+    "landuse": ["relative_type_of_area"],
+    "parking": ["parking"],
+    "parks": ["parks"],
+    "schools": ["schools"],
+    "kindergarten": ["kindergartens"],
+    "hospitals": ["hospitals"],
+    "doctors": ["doctors"],
+    "railway": ["railway_stations"],
+    "tram": ["tram_stations"],
+    "bus": ["bus_stations"],
+    "tags": ["tags"],
+}
+
+
+def requestCategories():
+    """The report categories the current request to an endpoint below /relative queries, None for all of them."""
+    route = request.url_rule.rule.rsplit("/", 1)[-1]
+    if route in ROUTE_CATEGORIES:
+        return ROUTE_CATEGORIES[route]
+
+    # The full report, restricted by include and exclude.
+    include = categoryList(request.args["include"]) if "include" in request.args else None
+    exclude = categoryList(request.args["exclude"]) if "exclude" in request.args else None
+    return selectCategories(include, exclude)
+
+
+def requestCost(radius):
+    """The estimated cost of the current request to an endpoint below /relative with the given radius."""
+    if request.args.get("summary") == "counts":
+        # Counts mostly add up precomputed grid cells.
+        return 0
+
+    try:
+        return admission.cost(radius, requestCategories())
+    except ValueError:
+        # Answered with 400 by the endpoint.
+        return 0
+
+
+@app.before_request
+def admitRequest():
+    """Rejects radii above MAX_RADIUS and passes expensive requests through the admission control."""
+    radius = (request.view_args or {}).get("radius")
+    if radius is None:
+        return None
+
+    if radius > app.config.get("MAX_RADIUS", 20000):
+        return make_response(jsonify(message="the radius must not exceed %d meters" % app.config.get("MAX_RADIUS", 20000)), 400)
+
+    if admission is None:
+        return None
+
+    g.admission = ExitStack()
+    try:
+        g.admission.enter_context(admission.admit(requestCost(radius)))
+    except AdmissionRejectedError as error:
+        app.logger.warning("%s rejected with %d", request.path, error.status)
+        return rejectedResponse(error)
+
+    return None
+
+
+@app.teardown_request
+def releaseRequest(exception):
+    # Runs after streamed responses were read completely.
+    admission_stack = g.pop("admission", None)
+    if admission_stack is not None:
+        admission_stack.close()